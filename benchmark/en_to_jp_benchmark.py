@@ -0,0 +1,60 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from lib.en_to_jp import EnToJp
+
+# 英単語を含むLLMの典型的な出力文
+SAMPLE_SENTENCES = [
+    "ChatGPTはOpenAIが開発した大規模言語モデルです。",
+    "PythonのNumPyやPandasを使うと、データ分析が簡単になります。",
+    "GoogleのGeminiやAnthropicのClaudeも、API経由で利用できます。",
+    "DeepLearningのモデルはGPUを使ってTrainingします。",
+    "AKARIはRaspberryPiではなく、Jetsonでもありません。",
+    "このRepositoryでは、gRPCでServer同士が通信しています。",
+    "Dockerを使えば、VOICEVOXのEngineをすぐに起動できます。",
+    "WebSearchの結果をもとに、最新のNewsをお伝えします。",
+    "HelloWorldのSampleCodeをGitHubにPushしてください。",
+    "MachineLearningとArtificialIntelligenceの違いを説明しますね。",
+]
+
+
+def measure(en_to_jp: EnToJp, sentences: list, inference: bool, repeat: int) -> float:
+    """全文の変換にかかる1文あたりの平均時間[ms]を計測する。"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sentence in sentences:
+            en_to_jp.text_to_kana(sentence, True, True, inference)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(sentences))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=100, help="Number of repetitions"
+    )
+    args = parser.parse_args()
+    start = time.perf_counter()
+    en_to_jp = EnToJp()
+    print(f"init: {(time.perf_counter() - start) * 1000:.1f}ms")
+    for inference in [False, True]:
+        en_to_jp.memo.clear()
+        cold = measure(en_to_jp, SAMPLE_SENTENCES, inference, 1)
+        warm = measure(en_to_jp, SAMPLE_SENTENCES, inference, args.repeat)
+        print(
+            f"inference={inference}: cold {cold:.3f}ms/sentence, "
+            f"warm {warm:.3f}ms/sentence"
+        )
+    sentence = "".join(SAMPLE_SENTENCES)
+    for scale in [1, 10, 100]:
+        text = sentence * scale
+        start = time.perf_counter()
+        en_to_jp.text_to_kana(text, True, True, True)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{len(text)} chars: {elapsed:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent import futures
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+import grpc
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from gpt_publisher import AioGptServer, GptServer
+from lib.gpt_session import GptSession
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "lib/grpc"))
+import gpt_server_pb2
+import gpt_server_pb2_grpc
+import voice_server_pb2
+import voice_server_pb2_grpc
+
+
+class SimulatedLlm(object):
+    """
+    一定の遅延で文を返すLLMの代替。
+    """
+
+    def __init__(
+        self, first_latency: float, sentence_interval: float, num_sentences: int
+    ) -> None:
+        self.first_latency = first_latency
+        self.sentence_interval = sentence_interval
+        self.num_sentences = num_sentences
+
+    def sentences(self) -> Iterator[str]:
+        """同期クライアントと同様に、スレッドをブロックして文を返す。"""
+        time.sleep(self.first_latency)
+        for i in range(self.num_sentences):
+            if i > 0:
+                time.sleep(self.sentence_interval)
+            yield f"応答の{i}文目です。"
+
+    async def sentences_async(self) -> AsyncIterator[str]:
+        """非同期クライアントと同様に、イベントループ上で待機して文を返す。"""
+        await asyncio.sleep(self.first_latency)
+        for i in range(self.num_sentences):
+            if i > 0:
+                await asyncio.sleep(self.sentence_interval)
+            yield f"応答の{i}文目です。"
+
+
+class BenchmarkGptServer(GptServer):
+    """
+    最終応答をSimulatedLlmで生成するGptServer。
+    """
+
+    llm: SimulatedLlm
+
+    def final_sentences(self, session: GptSession, messages: list) -> Iterator[str]:
+        return self.llm.sentences()
+
+
+class BenchmarkAioGptServer(AioGptServer):
+    """
+    最終応答をSimulatedLlmの非同期版で生成するAioGptServer。
+    """
+
+    llm: SimulatedLlm
+
+    def final_sentences_async(
+        self, session: GptSession, messages: list
+    ) -> AsyncIterator[str]:
+        return self.llm.sentences_async()
+
+
+class BenchmarkAioGptServerSyncLlm(AioGptServer):
+    """
+    最終応答をスレッドで生成するAioGptServer。非同期クライアントを持たないモデルの場合と同じ。
+    """
+
+    llm: SimulatedLlm
+
+    def final_sentences(self, session: GptSession, messages: list) -> Iterator[str]:
+        return self.llm.sentences()
+
+    def final_sentences_async(
+        self, session: GptSession, messages: list
+    ) -> Iterator[str]:
+        return self.final_sentences(session, messages)
+
+
+class MockVoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
+    """
+    文を受信するだけのvoice_serverの代替。
+    """
+
+    async def StreamText(
+        self,
+        request_iterator: AsyncIterator[voice_server_pb2.StreamTextRequest],
+        context: grpc.aio.ServicerContext,
+    ) -> voice_server_pb2.StreamTextReply:
+        num_texts = 0
+        async for request in request_iterator:
+            if request.text != "":
+                num_texts += 1
+        return voice_server_pb2.StreamTextReply(success=True, num_texts=num_texts)
+
+    async def StartHeadControl(
+        self,
+        request: voice_server_pb2.StartHeadControlRequest,
+        context: grpc.aio.ServicerContext,
+    ) -> voice_server_pb2.StartHeadControlReply:
+        return voice_server_pb2.StartHeadControlReply(success=True)
+
+
+async def start_aio_server(
+    address: str, add_servicer: Callable[[grpc.aio.Server], None]
+) -> grpc.aio.Server:
+    """grpc.aioのサーバを起動する。grpc.aioは1つのイベントループで使用するため、クライアントと同じループで実行する。"""
+    server = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=10)
+    )
+    add_servicer(server)
+    server.add_insecure_port(address)
+    await server.start()
+    return server
+
+
+async def run_turns(
+    address: str, num_turns: int
+) -> Tuple[float, List[float], List[float], int, int]:
+    """異なるセッションIDのStreamGptを同時に呼び出す。
+
+    Returns:
+        Tuple[float, List[float], List[float], int, int]: 全体の所要時間、最初の文を受信するまでの時間、
+        応答の完了までの時間、エラー数、最大スレッド数。
+
+    """
+    first_latencies: List[float] = []
+    total_latencies: List[float] = []
+    max_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads() -> None:
+        nonlocal max_threads
+        while not done.is_set():
+            max_threads = max(max_threads, threading.active_count())
+            await asyncio.sleep(0.01)
+
+    async with grpc.aio.insecure_channel(address) as channel:
+        stub = gpt_server_pb2_grpc.GptServerServiceStub(channel)
+
+        async def turn(i: int) -> None:
+            start = time.perf_counter()
+            first: Optional[float] = None
+            async for reply in stub.StreamGpt(
+                gpt_server_pb2.SetGptRequest(
+                    text=f"こんにちは{i}", is_finish=True, session_id=f"robot{i}"
+                )
+            ):
+                if first is None and reply.text != "":
+                    first = time.perf_counter() - start
+            if first is not None:
+                first_latencies.append(first)
+            total_latencies.append(time.perf_counter() - start)
+
+        sampler = asyncio.ensure_future(sample_threads())
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[turn(i) for i in range(num_turns)], return_exceptions=True
+        )
+        elapsed = time.perf_counter() - start
+        done.set()
+        await sampler
+    errors = sum(1 for result in results if isinstance(result, BaseException))
+    return elapsed, first_latencies, total_latencies, errors, max_threads
+
+
+def summary(name: str, values: List[float]) -> None:
+    """計測値の統計を表示する。"""
+    if len(values) == 0:
+        print(f"{name}: no samples")
+        return
+    values = sorted(values)
+    p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+    print(
+        f"{name}: mean {np.mean(values) * 1000:.0f}ms, "
+        f"median {values[len(values) // 2] * 1000:.0f}ms, "
+        f"p95 {p95 * 1000:.0f}ms, max {values[-1] * 1000:.0f}ms (n={len(values)})"
+    )
+
+
+async def run_benchmark(args: argparse.Namespace) -> None:
+    """スレッドプール版とgrpc.aio版のgpt_serverで、同時に応答を生成する時間を比較する。"""
+    llm = SimulatedLlm(args.first_latency, args.sentence_interval, args.num_sentences)
+    voice_address = f"127.0.0.1:{args.port}"
+    voice_server = await start_aio_server(
+        voice_address,
+        lambda server: voice_server_pb2_grpc.add_VoiceServerServiceServicer_to_server(
+            MockVoiceServer(), server
+        ),
+    )
+    modes = [
+        ("thread pool", BenchmarkGptServer),
+        ("aio (thread LLM)", BenchmarkAioGptServerSyncLlm),
+        ("aio (async LLM)", BenchmarkAioGptServer),
+    ]
+    try:
+        for i, (name, server_class) in enumerate(modes):
+            gpt_address = f"127.0.0.1:{args.port + 1 + i}"
+            gpt_server = server_class(
+                voice_address=voice_address, max_sessions=args.num_turns + 1
+            )
+            gpt_server.llm = llm
+            add_servicer = gpt_server_pb2_grpc.add_GptServerServiceServicer_to_server
+            if isinstance(gpt_server, AioGptServer):
+                aio_server = await start_aio_server(
+                    gpt_address, lambda server: add_servicer(gpt_server, server)
+                )
+            else:
+                # gpt_publisherと同じワーカー数のスレッドプール
+                sync_server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+                add_servicer(gpt_server, sync_server)
+                sync_server.add_insecure_port(gpt_address)
+                sync_server.start()
+            try:
+                elapsed, first, total, errors, max_threads = await run_turns(
+                    gpt_address, args.num_turns
+                )
+            finally:
+                if isinstance(gpt_server, AioGptServer):
+                    await aio_server.stop(None)
+                else:
+                    sync_server.stop(None)
+            print(
+                f"[{name}] {args.num_turns} turns in {elapsed:.2f}s, "
+                f"errors {errors}, max threads {max_threads}"
+            )
+            summary("  first sentence", first)
+            summary("  turn", total)
+    finally:
+        await voice_server.stop(None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--num_turns", type=int, default=100, help="Number of concurrent turns"
+    )
+    parser.add_argument(
+        "--first_latency",
+        type=float,
+        default=0.5,
+        help="Simulated latency of the first sentence[sec]",
+    )
+    parser.add_argument(
+        "--sentence_interval",
+        type=float,
+        default=0.3,
+        help="Simulated interval of the following sentences[sec]",
+    )
+    parser.add_argument(
+        "--num_sentences", type=int, default=3, help="Number of sentences of a turn"
+    )
+    parser.add_argument(
+        "--port", type=int, default=10201, help="First port of benchmark servers"
+    )
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import wave
+from concurrent import futures
+from typing import Iterator, List, Tuple
+
+import grpc
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from lib.audio_io import WavFileSource
+from lib.dispatch_policy import DispatchPolicy
+from lib.google_speech_grpc import GoogleSpeechGrpc, MicrophoneStreamGrpc
+from lib.recognizer import load_replay_script
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "lib/grpc"))
+import gpt_server_pb2
+import gpt_server_pb2_grpc
+import voice_server_pb2
+import voice_server_pb2_grpc
+
+RATE = 16000
+CHUNK = int(RATE / 10)  # 100ms
+
+
+class MockGptServer(gpt_server_pb2_grpc.GptServerServiceServicer):
+    """
+    SetGptの受信時刻を記録するgpt_serverの代替。
+    """
+
+    def __init__(self) -> None:
+        # (受信時刻, テキスト, is_finish)のリスト
+        self.requests: List[Tuple[float, str, bool]] = []
+
+    def SetGpt(
+        self, request: gpt_server_pb2.SetGptRequest, context: grpc.ServicerContext
+    ) -> gpt_server_pb2.SetGptReply:
+        self.requests.append((time.time(), request.text, request.is_finish))
+        return gpt_server_pb2.SetGptReply(success=True)
+
+    def StreamGpt(
+        self, request: gpt_server_pb2.SetGptRequest, context: grpc.ServicerContext
+    ) -> Iterator[gpt_server_pb2.StreamGptReply]:
+        self.requests.append((time.time(), request.text, request.is_finish))
+        return iter([])
+
+    def InterruptGpt(
+        self,
+        request: gpt_server_pb2.InterruptGptRequest,
+        context: grpc.ServicerContext,
+    ) -> gpt_server_pb2.InterruptGptReply:
+        return gpt_server_pb2.InterruptGptReply(success=True)
+
+    def SendMotion(
+        self, request: gpt_server_pb2.SendMotionRequest, context: grpc.ServicerContext
+    ) -> gpt_server_pb2.SendMotionReply:
+        return gpt_server_pb2.SendMotionReply(success=True)
+
+
+class MockVoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
+    """
+    音声再生の制御を受け付けるだけのvoice_serverの代替。
+    """
+
+    def InterruptVoice(
+        self,
+        request: voice_server_pb2.InterruptVoiceRequest,
+        context: grpc.ServicerContext,
+    ) -> voice_server_pb2.InterruptVoiceReply:
+        return voice_server_pb2.InterruptVoiceReply(success=True)
+
+    def EnableVoicePlay(
+        self,
+        request: voice_server_pb2.EnableVoicePlayRequest,
+        context: grpc.ServicerContext,
+    ) -> voice_server_pb2.EnableVoicePlayReply:
+        return voice_server_pb2.EnableVoicePlayReply(success=True)
+
+    def DisableVoicePlay(
+        self,
+        request: voice_server_pb2.DisableVoicePlayRequest,
+        context: grpc.ServicerContext,
+    ) -> voice_server_pb2.DisableVoicePlayReply:
+        return voice_server_pb2.DisableVoicePlayReply(success=True)
+
+
+def make_synthetic_script(output_dir: str, num_utterances: int) -> str:
+    """調波音を発話とみなした音声と、対応するスクリプトを作成する。
+
+    Args:
+        output_dir (str): 作成先のディレクトリ。
+        num_utterances (int): 発話数。
+
+    Returns:
+        str: 作成したスクリプトのパス。
+
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(RATE * 1.6)) / RATE
+    speech = sum(
+        np.sin(2 * np.pi * 150 * k * t) * 3000 / k for k in range(1, 6)
+    ) * np.hanning(len(t))
+    silence = np.zeros(int(RATE * 1.2))
+    parts = [silence]
+    for _ in range(num_utterances):
+        parts += [speech, silence]
+    audio = np.concatenate(parts)
+    audio += rng.standard_normal(len(audio)) * 30
+    wav_path = os.path.join(output_dir, "session.wav")
+    with wave.open(wav_path, "wb") as ww:
+        ww.setnchannels(1)
+        ww.setsampwidth(2)
+        ww.setframerate(RATE)
+        ww.writeframes(audio.clip(-32768, 32767).astype(np.int16).tobytes())
+    words = ["今日は", "いい天気", "ですね", "散歩に", "行きましょう"]
+    utterances = []
+    for _ in range(num_utterances):
+        results = [
+            {
+                "time": 0.4 * (i + 1),
+                "transcript": "".join(words[: i + 1]),
+                "stability": 0.2 * (i + 1),
+            }
+            for i in range(len(words) - 1)
+        ]
+        results.append({"transcript": "".join(words), "is_final": True})
+        utterances.append(results)
+    script_path = os.path.join(output_dir, "script.json")
+    with open(script_path, mode="w") as f:
+        json.dump(
+            {"wav": "session.wav", "final_latency": 0.3, "utterances": utterances},
+            f,
+            ensure_ascii=False,
+        )
+    return script_path
+
+
+def summary(name: str, values: List[float]) -> None:
+    """計測値の統計を表示する。"""
+    if len(values) == 0:
+        print(f"{name}: no samples")
+        return
+    values = sorted(values)
+    p95 = values[min(int(len(values) * 0.95), len(values) - 1)]
+    print(
+        f"{name}: mean {np.mean(values) * 1000:.0f}ms, "
+        f"median {values[len(values) // 2] * 1000:.0f}ms, "
+        f"p95 {p95 * 1000:.0f}ms, max {values[-1] * 1000:.0f}ms (n={len(values)})"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s",
+        "--script",
+        type=str,
+        default=None,
+        help="Replay script json. If not set, a synthetic session is generated",
+    )
+    parser.add_argument(
+        "-n",
+        "--num_utterances",
+        type=int,
+        default=5,
+        help="Number of utterances of the synthetic session",
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=float, default=0.5, help="Microphone input timeout"
+    )
+    parser.add_argument(
+        "-p",
+        "--power_threshold",
+        type=float,
+        default=50.0,
+        help="Microphone input power threshold",
+    )
+    parser.add_argument(
+        "--progress_report_len",
+        type=int,
+        default=8,
+        help="Send the progress of speech recognition if recognition word count over this number",
+    )
+    parser.add_argument(
+        "--dispatch_log",
+        type=str,
+        default=None,
+        help="Log every dispatch decision of interim results to this jsonl file",
+    )
+    parser.add_argument(
+        "--port", type=int, default=10101, help="First port of mock servers"
+    )
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        script_path = args.script
+        if script_path is None:
+            script_path = make_synthetic_script(tmp_dir, args.num_utterances)
+        recognizer = load_replay_script(script_path, RATE)
+        if recognizer.wav_path is None:
+            print("wav is not set in the script")
+            return
+        gpt_server = MockGptServer()
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+        gpt_server_pb2_grpc.add_GptServerServiceServicer_to_server(gpt_server, server)
+        voice_server_pb2_grpc.add_VoiceServerServiceServicer_to_server(
+            MockVoiceServer(), server
+        )
+        gpt_port = str(args.port)
+        voice_port = str(args.port + 1)
+        server.add_insecure_port("127.0.0.1:" + gpt_port)
+        server.add_insecure_port("127.0.0.1:" + voice_port)
+        server.start()
+        stream = MicrophoneStreamGrpc(
+            rate=RATE,
+            chunk=CHUNK,
+            _timeout_thresh=args.timeout,
+            _db_thresh=args.power_threshold,
+            gpt_port=gpt_port,
+            voice_port=voice_port,
+            motion_server_host=None,
+            motion_server_port=None,
+            audio_source=WavFileSource(recognizer.wav_path),
+            recognizer=recognizer,
+            persistent=True,
+        )
+        dispatch_policy = DispatchPolicy(
+            early_min_chars=args.progress_report_len, log_path=args.dispatch_log
+        )
+        google_speech_grpc = GoogleSpeechGrpc(
+            gpt_port=gpt_port, voice_port=voice_port, dispatch_policy=dispatch_policy
+        )
+        # 発話終了の検出からgpt_serverが最終結果を受信するまでの時間
+        final_latencies: List[float] = []
+        # 発話の送信開始からgpt_serverが途中結果を受信するまでの時間
+        progress_latencies: List[float] = []
+        try:
+            while recognizer.index < len(recognizer.utterances):
+                num_requests = len(gpt_server.requests)
+                with stream:
+                    results = stream.transcribe()
+                    if results is None:
+                        break
+                    text = google_speech_grpc.listen_publisher_grpc(results)
+                if recognizer.audio_start_time is None:
+                    continue
+                print(f"{recognizer.index}: {text}")
+                requests = gpt_server.requests[num_requests:]
+                progress_times = [t for t, _, is_finish in requests if not is_finish]
+                final_times = [t for t, _, is_finish in requests if is_finish]
+                if len(progress_times) > 0:
+                    progress_latencies.append(
+                        progress_times[0] - recognizer.audio_start_time
+                    )
+                if len(final_times) > 0 and recognizer.audio_end_time is not None:
+                    final_latencies.append(final_times[0] - recognizer.audio_end_time)
+        finally:
+            stream.close()
+            server.stop(None)
+    summary("speech end -> final SetGpt", final_latencies)
+    summary("speech start -> progress SetGpt", progress_latencies)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import grpc
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# 計測対象のスクリプトと、起動完了を判定するgRPCのポート
+TARGETS = {
+    "voicevox_server": {
+        "args": ["voicevox_server.py", "--voicevox_local", "--audio_sink", "null"],
+        "port": "10002",
+    },
+    "gpt_publisher": {
+        "args": ["gpt_publisher.py"],
+        "port": "10001",
+    },
+}
+
+
+def wait_ready(process: subprocess.Popen, port: str, timeout: float) -> Optional[float]:
+    """gRPCのポートが接続可能になるまで待ち、経過時間[sec]を返す。
+
+    Args:
+        process (subprocess.Popen): 計測対象のプロセス。
+        port (str): 接続を確認するポート番号。
+        timeout (float): 待機する最大時間[sec]。
+
+    Returns:
+        Optional[float]: 起動完了までの時間[sec]。起動に失敗した場合はNone。
+
+    """
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            return None
+        with grpc.insecure_channel("127.0.0.1:" + port) as channel:
+            try:
+                grpc.channel_ready_future(channel).result(timeout=0.05)
+                return time.perf_counter() - start
+            except grpc.FutureTimeoutError:
+                pass
+    return None
+
+
+def measure(name: str, repeat: int, timeout: float) -> List[float]:
+    """スクリプトを繰り返し起動し、起動完了までの時間を計測する。"""
+    results = []
+    target = TARGETS[name]
+    for _ in range(repeat):
+        process = subprocess.Popen(
+            [sys.executable] + target["args"],
+            cwd=ROOT_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            elapsed = wait_ready(process, target["port"], timeout)
+        finally:
+            process.terminate()
+            process.wait()
+        if elapsed is None:
+            print(f"{name}: failed to start")
+            break
+        results.append(elapsed)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-t",
+        "--targets",
+        nargs="+",
+        default=list(TARGETS.keys()),
+        choices=list(TARGETS.keys()),
+        help="Scripts to measure",
+    )
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=5, help="Number of repetitions"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30.0, help="Timeout of startup [sec]"
+    )
+    args = parser.parse_args()
+    for name in args.targets:
+        results = measure(name, args.repeat, args.timeout)
+        if len(results) == 0:
+            continue
+        results.sort()
+        print(
+            f"{name}: min {results[0] * 1000:.0f}ms, "
+            f"median {results[len(results) // 2] * 1000:.0f}ms, "
+            f"max {results[-1] * 1000:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import math
+import os
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from lib.vad import LevelMeter
+
+RATE = 16000
+CHUNK = int(RATE / 10)  # 100ms
+
+
+def legacy_power_db(in_data: bytes) -> float:
+    """変更前のMicrophoneStream._fill_bufferと同じ方法で音量[dB]を計算する。"""
+    in_data2 = struct.unpack(f"{len(in_data) / 2:.0f}h", in_data)
+    rms = math.sqrt(np.square(in_data2).mean())
+    return 20 * math.log10(rms) if rms > 0.0 else -math.inf
+
+
+def measure(func, chunks: list, repeat: int) -> float:
+    """1チャンクあたりの平均処理時間[us]を計測する。"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for chunk in chunks:
+            func(chunk)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(chunks))
+
+
+def measure_memory(func, chunk: bytes, calls: int = 100) -> float:
+    """1チャンクあたりのピークメモリ確保量[byte]を計測する。"""
+    func(chunk)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    peak = 0
+    for _ in range(calls):
+        func(chunk)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.reset_peak()
+    tracemalloc.stop()
+    return peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-r", "--repeat", type=int, default=100, help="Number of repetitions"
+    )
+    parser.add_argument(
+        "-c", "--chunk", type=int, default=CHUNK, help="Samples per chunk"
+    )
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+    # 無音から最大音量までの入力を模擬する
+    chunks = [
+        (rng.standard_normal(args.chunk) * amp)
+        .clip(-32768, 32767)
+        .astype(np.int16)
+        .tobytes()
+        for amp in [0, 10, 100, 1000, 10000, 30000]
+    ]
+    level_meter = LevelMeter(args.chunk)
+    for chunk in chunks[1:]:
+        diff = abs(legacy_power_db(chunk) - level_meter.power_db(chunk))
+        assert diff < 1e-3, f"Level mismatch: {diff}"
+    for name, func in [
+        ("struct.unpack", legacy_power_db),
+        ("LevelMeter", level_meter.power_db),
+    ]:
+        cost = measure(func, chunks, args.repeat)
+        peak = measure_memory(func, chunks[-1])
+        print(f"{name}: {cost:.1f}us/chunk, peak alloc {peak / 1024:.1f}KiB/chunk")
+
+
+if __name__ == "__main__":
+    main()
@@ -35,6 +35,12 @@ def main() -> None:
         action="store_true",
         help="Use google speech v2 instead of v1",
     )
+    parser.add_argument(
+        "--replay_script",
+        type=str,
+        default=None,
+        help="Replay scripted transcripts from this json instead of google speech",
+    )
     parser.add_argument(
         "-m", "--model", help="LLM model name", default="gpt-4o", type=str
     )
@@ -59,8 +65,18 @@ def main() -> None:
         from lib.google_speech import MicrophoneStream, get_db_thresh, listen_print_loop
     timeout: float = args.timeout
     power_threshold: float = args.power_threshold
+    # スクリプトの認識結果を再生する場合は、google speechに接続せず、WAVファイルを音声入力とする
+    recognizer = None
+    audio_source = None
+    if args.replay_script is not None:
+        from lib.audio_io import WavFileSource
+        from lib.recognizer import load_replay_script
+
+        recognizer = load_replay_script(args.replay_script, RATE)
+        if recognizer.wav_path is not None:
+            audio_source = WavFileSource(recognizer.wav_path)
     if power_threshold == 0:
-        power_threshold = get_db_thresh() + POWER_THRESH_DIFF
+        power_threshold = get_db_thresh(audio_source) + POWER_THRESH_DIFF
     print(f"power_threshold set to {power_threshold:.3f}db")
     if args.voicevox_local:
         from lib.voicevox import TextToVoiceVox
@@ -90,7 +106,12 @@ def main() -> None:
         text = ""
         responses = None
         with MicrophoneStream(
-            rate=RATE, chunk=CHUNK, _timeout_thresh=timeout, _db_thresh=power_threshold
+            rate=RATE,
+            chunk=CHUNK,
+            _timeout_thresh=timeout,
+            _db_thresh=power_threshold,
+            audio_source=audio_source,
+            recognizer=recognizer,
         ) as stream:
             print("Enterを入力してください")
             input()
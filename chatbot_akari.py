@@ -2,8 +2,8 @@ import argparse
 import os
 import sys
 
-import grpc
 from lib.chat_akari import ChatStreamAkari
+from lib.grpc_channel import get_channel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import motion_server_pb2
@@ -43,6 +43,12 @@ def main() -> None:
         action="store_true",
         help="Use google speech v2 instead of v1",
     )
+    parser.add_argument(
+        "--replay_script",
+        type=str,
+        default=None,
+        help="Replay scripted transcripts from this json instead of google speech",
+    )
     parser.add_argument(
         "-m", "--model", help="LLM model name", default="gpt-4o", type=str
     )
@@ -67,8 +73,18 @@ def main() -> None:
         from lib.google_speech import MicrophoneStream, get_db_thresh, listen_print_loop
     timeout: float = args.timeout
     power_threshold: float = args.power_threshold
+    # スクリプトの認識結果を再生する場合は、google speechに接続せず、WAVファイルを音声入力とする
+    recognizer = None
+    audio_source = None
+    if args.replay_script is not None:
+        from lib.audio_io import WavFileSource
+        from lib.recognizer import load_replay_script
+
+        recognizer = load_replay_script(args.replay_script, RATE)
+        if recognizer.wav_path is not None:
+            audio_source = WavFileSource(recognizer.wav_path)
     if power_threshold == 0:
-        power_threshold = get_db_thresh() + POWER_THRESH_DIFF
+        power_threshold = get_db_thresh(audio_source) + POWER_THRESH_DIFF
     print(f"power_threshold set to {power_threshold:.3f}db")
     if args.voicevox_local:
         from lib.voicevox import TextToVoiceVox
@@ -82,7 +98,9 @@ def main() -> None:
 
         text_to_voice = TextToVoiceVoxWeb(apikey=VOICEVOX_APIKEY)
 
-    channel = grpc.insecure_channel(args.robot_ip + ":" + str(args.robot_port))
+    channel = get_channel(
+        args.robot_ip + ":" + str(args.robot_port), keepalive_without_calls=False
+    )
     stub = motion_server_pb2_grpc.MotionServerServiceStub(channel)
     SYSTEM_PROMPT_PATH = (
         f"{os.path.dirname(os.path.realpath(__file__))}/config/system_prompt.txt"
@@ -100,7 +118,12 @@ def main() -> None:
         text = ""
         responses = None
         with MicrophoneStream(
-            rate=RATE, chunk=CHUNK, _timeout_thresh=timeout, _db_thresh=power_threshold
+            rate=RATE,
+            chunk=CHUNK,
+            _timeout_thresh=timeout,
+            _db_thresh=power_threshold,
+            audio_source=audio_source,
+            recognizer=recognizer,
         ) as stream:
             print("Enterを入力してください")
             input()
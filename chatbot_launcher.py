@@ -0,0 +1,204 @@
+import argparse
+import os
+import shlex
+import sys
+import time
+from typing import List
+
+from lib.supervisor import Component, Supervisor, preload_modules
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 各コンポーネントが共通で使用する、読み込みに時間のかかるモジュール
+SHARED_MODULES = [
+    "grpc",
+    "google.protobuf",
+    "numpy",
+    "lib.grpc_channel",
+    "lib.metrics",
+    "lib.tracing",
+]
+# gpt_publisherが初回の応答生成時に読み込むLLMのSDK
+LLM_SDK_MODULES = ["openai", "anthropic", "google.genai"]
+
+
+def option_value(args: List[str], name: str, default: str) -> str:
+    """コマンドライン引数のリストから、オプションの値を取り出す。指定されていない場合はdefaultを返す。"""
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            return args[i + 1]
+        if arg.startswith(name + "="):
+            return arg[len(name) + 1 :]
+    return default
+
+
+def build_components(args: argparse.Namespace) -> List[Component]:
+    """起動するコンポーネントを、script/faster_chatbot*.shと同じ構成で作成する。"""
+    components = []
+    voice_depends_on = []
+    if args.motion_server_path is not None:
+        motion_python = os.path.join(args.motion_server_path, "venv/bin/python3")
+        if not os.path.exists(motion_python):
+            motion_python = "python3"
+        components.append(
+            Component(
+                "motion_server",
+                command=[motion_python, "server.py"],
+                cwd=args.motion_server_path,
+                ready_port="50055",
+            )
+        )
+        voice_depends_on.append("motion_server")
+    voice_args = ["--voice_host", args.voice_host] + shlex.split(args.voice_args)
+    if args.tts == "voicevox":
+        voice_module = "voicevox_server"
+        voice_args = ["--voicevox_local"] + voice_args
+    else:
+        voice_module = "style_bert_vits_server"
+    components.append(
+        Component(
+            "voice_server",
+            module=voice_module,
+            args=voice_args,
+            ready_port="10002",
+            depends_on=voice_depends_on,
+        )
+    )
+    gpt_args = shlex.split(args.gpt_args)
+    components.append(
+        Component(
+            "gpt_publisher",
+            module="gpt_publisher",
+            args=gpt_args,
+            ready_port=option_value(gpt_args, "--port", "10001"),
+            depends_on=["voice_server"],
+        )
+    )
+    speech_args = ["--timeout", str(args.timeout)] + shlex.split(args.speech_args)
+    if args.auto:
+        speech_args.append("--auto")
+    components.append(
+        Component(
+            "speech_publisher",
+            module="speech_publisher",
+            args=speech_args,
+            ready_port="10003",
+            depends_on=["voice_server", "gpt_publisher"],
+        )
+    )
+    if args.auto:
+        # 自動モードでは、音声の出力中に音声認識を止める
+        components.append(
+            Component(
+                "talk_controller",
+                module="talk_controller_client",
+                depends_on=["speech_publisher"],
+            )
+        )
+    return components
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Start voice server, gpt_publisher and speech_publisher and restart them on exit"
+    )
+    parser.add_argument(
+        "--voice_host",
+        type=str,
+        default="127.0.0.1",
+        help="Host of VOICEVOX or Style-Bert-VITS2",
+    )
+    parser.add_argument(
+        "--tts",
+        type=str,
+        default="voicevox",
+        choices=["voicevox", "style_bert_vits"],
+        help="Voice server to start",
+    )
+    parser.add_argument(
+        "--motion_server_path",
+        type=str,
+        default=None,
+        help="Path of akari_motion_server. Start it if specified",
+    )
+    parser.add_argument(
+        "--auto",
+        action="store_true",
+        help="Start speech_publisher with --auto and talk_controller_client",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        default=0.8,
+        help="Timeout of speech_publisher",
+    )
+    parser.add_argument(
+        "--voice_args", type=str, default="", help="Extra arguments of voice server"
+    )
+    parser.add_argument(
+        "--gpt_args", type=str, default="", help="Extra arguments of gpt_publisher"
+    )
+    parser.add_argument(
+        "--speech_args",
+        type=str,
+        default="",
+        help="Extra arguments of speech_publisher",
+    )
+    parser.add_argument(
+        "--start_method",
+        type=str,
+        default="fork" if hasattr(os, "fork") else "spawn",
+        choices=["fork", "spawn"],
+        help="Start components by forking the preloaded launcher or as new python processes",
+    )
+    parser.add_argument(
+        "--no_preload",
+        action="store_true",
+        help="Do not import shared modules before forking components",
+    )
+    parser.add_argument(
+        "--log_dir",
+        type=str,
+        default=None,
+        help="Append output of each component to {log_dir}/{name}.log",
+    )
+    parser.add_argument(
+        "--ready_timeout",
+        type=float,
+        default=60.0,
+        help="Restart a component not listening on its port in this time[sec]",
+    )
+    parser.add_argument(
+        "--backoff_max",
+        type=float,
+        default=30.0,
+        help="Maximum wait before restarting a component[sec]",
+    )
+    args = parser.parse_args()
+    # 各コンポーネントはカレントディレクトリからの相対パスで設定ファイルを読み込む
+    os.chdir(ROOT_DIR)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    components = build_components(args)
+    if args.start_method == "fork" and not args.no_preload:
+        start = time.perf_counter()
+        modules = SHARED_MODULES + LLM_SDK_MODULES + ["lib.google_speech_grpc"]
+        modules += [c.module for c in components if c.module is not None]
+        loaded = preload_modules(modules)
+        print(
+            f"Preloaded {len(loaded)}/{len(modules)} modules "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+    supervisor = Supervisor(
+        components,
+        start_method=args.start_method,
+        log_dir=args.log_dir,
+        ready_timeout=args.ready_timeout,
+        backoff_max=args.backoff_max,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
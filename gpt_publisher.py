@@ -1,83 +1,697 @@
 import argparse
+import asyncio
 import copy
 import os
 import sys
+import time
 from concurrent import futures
+from threading import Thread
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Union,
+)
 
 import grpc
-from lib.chat_akari_grpc import ChatStreamAkariGrpc
+from lib.generation import iterate_in_thread
+from lib.gpt_session import GptSession, GptSessionManager
+from lib.grpc_channel import server_options
+from lib.metrics import (
+    AioMetricsServerInterceptor,
+    MetricsServerInterceptor,
+    add_callback,
+    counter,
+    gauge,
+    histogram,
+    start_metrics_server,
+)
+from lib.speculation import SpeculationStats, SpeculativeResponse, is_same_transcript
+from lib.text_normalizer import TextNormalizer
+from lib.tracing import (
+    configure_tracing,
+    get_tracer,
+    trace_id_from_context,
+    trace_metadata,
+)
+from lib.voice_text_stream import (
+    AioVoiceTextStream,
+    NormalizedTextSender,
+    VoiceTextStream,
+)
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import gpt_server_pb2
 import gpt_server_pb2_grpc
 import voice_server_pb2
-import voice_server_pb2_grpc
+
+LLM_FIRST_TOKEN_SECONDS = histogram(
+    "llm_first_token_seconds",
+    "Time from starting a generation to the first token from the LLM",
+    ["kind"],
+)
+GPT_FIRST_SENTENCE_SECONDS = histogram(
+    "gpt_first_sentence_seconds",
+    "Time from receiving a transcript to sending the first sentence to voice server",
+    ["kind", "speculative"],
+)
+GPT_GENERATIONS = counter(
+    "gpt_generations_total", "Number of completed responses", ["kind"]
+)
+GPT_SPECULATIONS = counter(
+    "gpt_speculations_total",
+    "Number of speculative responses by whether the final transcript matched",
+    ["result"],
+)
+GPT_SPECULATION_SAVED_SECONDS = counter(
+    "gpt_speculation_saved_seconds_total",
+    "Total latency saved by adopting speculative responses",
+)
+GPT_INTERRUPTED_GENERATIONS = counter(
+    "gpt_interrupted_generations_total", "Number of generations cancelled by barge-in"
+)
+GPT_AVOIDED_TOKENS = counter(
+    "gpt_avoided_tokens_total", "Estimated number of tokens not generated by barge-in"
+)
+GPT_SESSIONS = gauge("gpt_sessions", "Number of sessions held by the server")
+
+
+class GptTurn(object):
+    """
+    1回の音声認識の結果に対する応答生成の状態を保持するクラス。GptServerとAioGptServerで共有する。
+    """
+
+    def __init__(
+        self,
+        session: GptSession,
+        text: str,
+        is_finish: bool,
+        speculation: Optional[SpeculativeResponse],
+        trace_id: Optional[str],
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            session (GptSession): 応答を生成するセッション。
+            text (str): 音声認識の結果。
+            is_finish (bool): 最終結果かどうか。Falseの場合は第一声を生成する。
+            speculation (Optional[SpeculativeResponse]): 採用する先行生成。ない場合はNone。
+            trace_id (Optional[str]): 発話のトレースID。
+
+        """
+        self.session = session
+        self.chat = session.chat_stream_akari_grpc
+        self.is_finish = is_finish
+        self.speculation = speculation
+        self.trace_id = trace_id
+        self.metadata = trace_metadata(trace_id)
+        self.receive_time = time.time()
+        self.user_message = self.chat.create_message(f"{text}。")
+        self.messages = session.get_messages()
+        self.messages.append(copy.deepcopy(self.user_message))
+        # 応答を生成しているGenerationHandle
+        self.handle: Any = None
+        self.response = ""
+        self.first_sentence_time: Optional[float] = None
+        self.num_sentences = 0
+        self.motion_sent = False
+
+    @property
+    def kind(self) -> str:
+        """生成の種類("early": 第一声, "final": 最終応答)。"""
+        return "final" if self.is_finish else "early"
+
+    def add_sentence(self, sentence: str) -> gpt_server_pb2.StreamGptReply:
+        """voice_serverに送信した文を記録し、クライアントに返すStreamGptReplyを返す。"""
+        print(f"Send to voice server: {sentence}")
+        if self.first_sentence_time is None:
+            self.first_sentence_time = time.time()
+        self.num_sentences += 1
+        self.response += sentence
+        return gpt_server_pb2.StreamGptReply(text=sentence)
+
+    def take_motion(self) -> Optional[gpt_server_pb2.StreamGptReply]:
+        """第一声の生成で予約したモーションを、1回のみStreamGptReplyで返す。"""
+        if self.is_finish or self.motion_sent:
+            return None
+        motion = self.chat.cur_motion_name
+        if not motion:
+            return None
+        self.motion_sent = True
+        return gpt_server_pb2.StreamGptReply(motion=motion)
+
+    def cancel(self) -> None:
+        """生成中の応答と、採用した先行生成を中断する。生成の終了後は何もしない。"""
+        if self.speculation is not None:
+            self.speculation.cancel()
+        if self.handle is not None:
+            self.handle.cancel()
 
 
 class GptServer(gpt_server_pb2_grpc.GptServerServiceServicer):
     """
     chatGPTにtextを送信し、返答をvoice_serverに送るgRPCサーバ
+    会話履歴と送信先のvoice_serverはセッション(ロボット)ごとに保持する。
     """
 
-    def __init__(self) -> None:
-        self.chat_stream_akari_grpc = ChatStreamAkariGrpc()
+    def __init__(
+        self,
+        normalize_text: bool = False,
+        speculation_similarity: float = 0.95,
+        stream_text: bool = True,
+        voice_address: str = "localhost:10002",
+        motion_address: str = "127.0.0.1:50055",
+        max_sessions: int = 16,
+        session_idle_timeout: float = 1800.0,
+    ) -> None:
+        # 有効な場合、英単語のかな変換を行ってからvoice_serverに送信する
+        self.text_normalizer = TextNormalizer() if normalize_text else None
         self.SYSTEM_PROMPT_PATH = (
             f"{os.path.dirname(os.path.realpath(__file__))}/config/system_prompt.txt"
         )
-        self.messages = []
         with open(self.SYSTEM_PROMPT_PATH, "r") as f:
-            self.messages = [
-                self.chat_stream_akari_grpc.create_message(f.read(), role="system")
-            ]
-        voice_channel = grpc.insecure_channel("localhost:10002")
-        self.stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+            system_prompt = f.read()
+        # 有効な場合、1回の応答の文をStreamTextでまとめて送信する。無効な場合は文ごとにSetTextを呼び出す
+        self.sessions = GptSessionManager(
+            system_prompt,
+            voice_address=voice_address,
+            motion_address=motion_address,
+            stream_text=stream_text,
+            max_sessions=max_sessions,
+            idle_timeout=session_idle_timeout,
+        )
+        # セッションIDを指定しないクライアント用のセッション。LLMのクライアントはこのセッションのものを共有する
+        self.chat_stream_akari_grpc = self.sessions.get().chat_stream_akari_grpc
+        # 最終結果とこの類似度以上であれば、先行生成した応答を採用する
+        self.speculation_similarity = speculation_similarity
+        self.speculation_stats = SpeculationStats()
+        add_callback(self.update_metrics)
 
-    def SetGpt(
-        self, request: gpt_server_pb2.SetGptRequest(), context: grpc.ServicerContext
-    ) -> gpt_server_pb2.SetGptReply:
-        response = ""
+    def update_metrics(self) -> None:
+        """メトリクスの出力前に、保持しているセッション数を更新する。"""
+        GPT_SESSIONS.set(len(self.sessions.all()))
+
+    def session_values(
+        self, request: Any, context: Optional[grpc.ServicerContext]
+    ) -> Dict[str, str]:
+        """リクエストのフィールドとメタデータから、セッションIDと接続先を取得する。
+        リクエストのフィールドで指定した値を、メタデータ("session-id", "voice-address", "motion-address")より優先する。
+
+        Args:
+            request (Any): session_idを持つリクエスト。
+            context (Optional[grpc.ServicerContext]): RPCのコンテキスト。
+
+        Returns:
+            Dict[str, str]: メタデータのキー名をキーとした値。
+
+        """
+        values = {}
+        if context is not None:
+            values = dict(context.invocation_metadata())
+        for name in ["session_id", "voice_address", "motion_address"]:
+            if name in request.DESCRIPTOR.fields_by_name and request.HasField(name):
+                values[name.replace("_", "-")] = getattr(request, name)
+        return values
+
+    def get_session(
+        self, request: Any, context: Optional[grpc.ServicerContext]
+    ) -> GptSession:
+        """リクエストのセッションIDからセッションを取得する。存在しない場合は作成する。
+        セッションIDと接続先は、リクエストのフィールド、またはメタデータ("session-id", "voice-address", "motion-address")で指定する。
+
+        Args:
+            request (Any): session_idを持つリクエスト。
+            context (Optional[grpc.ServicerContext]): RPCのコンテキスト。
+
+        Returns:
+            GptSession: セッション。
+
+        """
+        values = self.session_values(request, context)
+        return self.sessions.get(
+            values.get("session-id"),
+            voice_address=values.get("voice-address"),
+            motion_address=values.get("motion-address"),
+        )
+
+    def find_session(
+        self, request: Any, context: Optional[grpc.ServicerContext]
+    ) -> Optional[GptSession]:
+        """リクエストのセッションIDからセッションを取得する。存在しない場合は作成せずにNoneを返す。
+
+        Args:
+            request (Any): session_idを持つリクエスト。
+            context (Optional[grpc.ServicerContext]): RPCのコンテキスト。
+
+        Returns:
+            Optional[GptSession]: セッション。存在しない場合はNone。
+
+        """
+        return self.sessions.find(
+            self.session_values(request, context).get("session-id")
+        )
+
+    def open_sender(
+        self, voice_stream: VoiceTextStream, trace_id: Optional[str] = None
+    ) -> NormalizedTextSender:
+        """voice_serverに音声合成するテキストを、正規化しながら順番に送信するNormalizedTextSenderを作成する。"""
+        return NormalizedTextSender(voice_stream, self.text_normalizer, trace_id)
+
+    def final_sentences(self, session: GptSession, messages: list) -> Iterable[str]:
+        """最終応答を文ごとに生成する。高速生成するために、モデルはgpt-4o"""
+        return session.chat_stream_akari_grpc.chat(messages, model="gpt-4o")
+
+    def start_speculation(self, session: GptSession, text: str) -> None:
+        """音声認識の途中結果から最終応答の生成を開始する。生成した文は最終結果を受信するまで送信しない。"""
+        tmp_messages = session.get_messages()
+        tmp_messages.append(session.chat_stream_akari_grpc.create_message(f"{text}。"))
+        speculation = SpeculativeResponse(
+            text,
+            session.generations.open(
+                "final", self.final_sentences(session, tmp_messages)
+            ),
+        )
+        with session.speculation_lock:
+            previous = session.speculation
+            session.speculation = speculation
+        if previous is not None:
+            previous.cancel()
+        print(f"Start speculation: {text}")
+
+    def take_speculation(
+        self, session: GptSession, text: str
+    ) -> Optional[SpeculativeResponse]:
+        """最終結果と一致する先行生成を取り出す。一致しない先行生成は中断する。
+
+        Args:
+            session (GptSession): セッション。
+            text (str): 音声認識の最終結果。
+
+        Returns:
+            Optional[SpeculativeResponse]: 採用する先行生成。ない場合はNone。
+
+        """
+        with session.speculation_lock:
+            speculation = session.speculation
+            session.speculation = None
+        if speculation is None:
+            return None
+        if is_same_transcript(speculation.text, text, self.speculation_similarity):
+            return speculation
+        speculation.cancel()
+        self.speculation_stats.record_miss()
+        GPT_SPECULATIONS.inc(result="miss")
+        print(f"Speculation miss: {speculation.text}")
+        return None
+
+    def record_speculation_hit(
+        self, speculation: SpeculativeResponse, receive_time: float
+    ) -> None:
+        """先行生成した応答を採用したことと、短縮できた遅延を記録する。"""
+        saved = 0.0
+        if speculation.first_sentence_time is not None:
+            # 最終結果の受信から生成した場合に最初の文が得られる時刻との差
+            ttfs = speculation.first_sentence_time - speculation.start_time
+            saved = (
+                receive_time + ttfs - max(speculation.first_sentence_time, receive_time)
+            )
+        self.speculation_stats.record_hit(saved)
+        GPT_SPECULATIONS.inc(result="hit")
+        GPT_SPECULATION_SAVED_SECONDS.inc(max(saved, 0.0))
+        print(self.speculation_stats.summary())
+
+    def record_generation(
+        self,
+        trace_id: Optional[str],
+        kind: str,
+        receive_time: float,
+        first_sentence_time: Optional[float],
+        handle: Any,
+        num_sentences: int,
+        speculative: bool = False,
+    ) -> None:
+        """1回の応答生成のスパンとメトリクスを記録する。
+
+        Args:
+            trace_id (Optional[str]): 発話のトレースID。Noneの場合はスパンを記録しない。
+            kind (str): 生成の種類("early": 第一声, "final": 最終応答)。
+            receive_time (float): 音声認識の結果を受信した時刻。
+            first_sentence_time (Optional[float]): 最初の文をvoice_serverに送信した時刻。
+            handle (Any): 応答を生成したGenerationHandle。
+            num_sentences (int): 送信した文の数。
+            speculative (bool, optional): 先行生成した応答を採用したかどうか。デフォルトはFalse。
+
+        """
+        tracer = get_tracer()
+        GPT_GENERATIONS.inc(kind=kind)
+        first_token_time = getattr(handle, "first_token_time", None)
+        if first_token_time is not None:
+            LLM_FIRST_TOKEN_SECONDS.observe(
+                first_token_time - handle.start_time, kind=kind
+            )
+            # 先行生成の場合は、受信より前に生成を開始している
+            tracer.record(
+                trace_id,
+                "llm_first_token",
+                handle.start_time,
+                first_token_time,
+                kind=kind,
+                speculative=speculative,
+            )
+        if first_sentence_time is not None:
+            GPT_FIRST_SENTENCE_SECONDS.observe(
+                max(first_sentence_time - receive_time, 0.0),
+                kind=kind,
+                speculative=str(speculative).lower(),
+            )
+            tracer.record(
+                trace_id,
+                "first_sentence",
+                receive_time,
+                first_sentence_time,
+                kind=kind,
+                speculative=speculative,
+            )
+        tracer.record(
+            trace_id,
+            "generation",
+            receive_time,
+            time.time(),
+            kind=kind,
+            speculative=speculative,
+            sentences=num_sentences,
+        )
+
+    def begin_turn(
+        self, request: gpt_server_pb2.SetGptRequest, context: Any
+    ) -> Optional[GptTurn]:
+        """音声認識の結果を受け取り、応答を生成するGptTurnを作成する。
+        先行生成の開始の要求と、短すぎる結果の場合は応答を生成しないためNoneを返す。
+
+        Args:
+            request (gpt_server_pb2.SetGptRequest): 音声認識の結果。
+            context (Any): RPCのコンテキスト。
+
+        Returns:
+            Optional[GptTurn]: 応答を生成するGptTurn。生成しない場合はNone。
+
+        """
         is_finish = True
         if request.HasField("is_finish"):
             is_finish = request.is_finish
+        session = self.get_session(request, context)
+        if request.is_speculative:
+            if len(request.text) >= 2:
+                self.start_speculation(session, request.text)
+            return None
+        speculation = (
+            self.take_speculation(session, request.text) if is_finish else None
+        )
         if len(request.text) < 2:
-            return gpt_server_pb2.SetGptReply(success=True)
-        print(f"Receive: {request.text}")
-        content = f"{request.text}。"
-        tmp_messages = copy.deepcopy(self.messages)
-        tmp_messages.append(self.chat_stream_akari_grpc.create_message(content))
+            return None
+        print(f"Receive({session.session_id}): {request.text}")
+        turn = GptTurn(
+            session,
+            request.text,
+            is_finish,
+            speculation,
+            trace_id_from_context(context),
+        )
         if is_finish:
-            self.messages = copy.deepcopy(tmp_messages)
-            # 最終応答。高速生成するために、モデルはgpt-4o
-            self.stub.StartHeadControl(voice_server_pb2.StartHeadControlRequest())
-            for sentence in self.chat_stream_akari_grpc.chat(
-                tmp_messages, model="gpt-4o"
-            ):
-                print(f"Send to voice server: {sentence}")
-                self.stub.SetText(voice_server_pb2.SetTextRequest(text=sentence))
-                response += sentence
-            # Sentenceの終了を通知
-            self.stub.SentenceEnd(voice_server_pb2.SentenceEndRequest())
-            self.messages.append(
-                self.chat_stream_akari_grpc.create_message(response, role="assistant")
+            session.append_messages([turn.user_message])
+        return turn
+
+    def early_sentences(self, turn: GptTurn) -> Iterable[str]:
+        """途中での第一声とモーション準備を文ごとに生成する。function_callingの確実性のため、モデルはgpt-4-turbo"""
+        return turn.chat.chat_and_motion(
+            turn.messages, model="gpt-4-turbo", short_response=True
+        )
+
+    def end_turn(self, turn: GptTurn, use_stream: bool) -> None:
+        """応答の生成完了を記録し、最終応答の場合は会話履歴に追加する。
+
+        Args:
+            turn (GptTurn): 生成を完了したGptTurn。
+            use_stream (bool): voice_serverがStreamTextを使用できたかどうか。
+
+        """
+        # voice_serverがStreamTextを持たない場合は、以降SetTextを使用する
+        turn.session.stream_text = use_stream
+        if turn.speculation is not None:
+            self.record_speculation_hit(turn.speculation, turn.receive_time)
+        self.record_generation(
+            turn.trace_id,
+            turn.kind,
+            turn.receive_time,
+            turn.first_sentence_time,
+            turn.handle,
+            turn.num_sentences,
+            speculative=turn.speculation is not None,
+        )
+        if turn.is_finish:
+            turn.session.append_messages(
+                [turn.chat.create_message(turn.response, role="assistant")]
             )
-        else:
-            # 途中での第一声とモーション準備。function_callingの確実性のため、モデルはgpt-4-turbo
-            for sentence in self.chat_stream_akari_grpc.chat_and_motion(
-                tmp_messages, model="gpt-4-turbo", short_response=True
-            ):
-                print(f"Send to voice server: {sentence}")
-                self.stub.SetText(voice_server_pb2.SetTextRequest(text=sentence))
-                response += sentence
         print("")
+
+    def generate(
+        self, request: gpt_server_pb2.SetGptRequest, context: grpc.ServicerContext
+    ) -> Iterator[gpt_server_pb2.StreamGptReply]:
+        """音声認識の結果から応答を生成し、voice_serverに送信する。
+        送信した文と、予約したモーションを順次返す。
+
+        Args:
+            request (gpt_server_pb2.SetGptRequest): 音声認識の結果。
+            context (grpc.ServicerContext): RPCのコンテキスト。
+
+        Yields:
+            gpt_server_pb2.StreamGptReply: 送信した文、または予約したモーション名。
+        """
+        turn = self.begin_turn(request, context)
+        if turn is None:
+            return
+        session = turn.session
+        # 1回の応答の文は、1本のStreamTextでvoice_serverに送る
+        voice_stream = VoiceTextStream(
+            session.stub, use_stream=session.stream_text, metadata=turn.metadata
+        )
+        sentences: Iterable[str]
+        if turn.is_finish:
+            session.stub.StartHeadControl(
+                voice_server_pb2.StartHeadControlRequest(), metadata=turn.metadata
+            )
+            if turn.speculation is not None:
+                # 先行生成した応答を採用し、生成済みの文から送信する
+                sentences = turn.speculation.iter_sentences()
+                turn.handle = turn.speculation.source
+            else:
+                turn.handle = session.generations.open(
+                    "final", self.final_sentences(session, turn.messages)
+                )
+                sentences = turn.handle
+        else:
+            turn.handle = session.generations.open("early", self.early_sentences(turn))
+            sentences = turn.handle
+        # 採用した先行生成も、InterruptGptやRPCのキャンセルで中断できるようにする
+        context.add_callback(turn.cancel)
+        with voice_stream:
+            sender = self.open_sender(voice_stream, turn.trace_id)
+            try:
+                for sentence in sentences:
+                    sender.send(sentence)
+                    yield turn.add_sentence(sentence)
+                    motion = turn.take_motion()
+                    if motion is not None:
+                        yield motion
+                if turn.is_finish:
+                    # Sentenceの終了を通知
+                    sender.send("", sentence_end=True)
+            finally:
+                # 正規化中の文を送信し終えてからストリームを閉じる
+                sender.flush()
+        self.end_turn(turn, voice_stream.use_stream)
+
+    def SetGpt(
+        self, request: gpt_server_pb2.SetGptRequest(), context: grpc.ServicerContext
+    ) -> gpt_server_pb2.SetGptReply:
+        for _ in self.generate(request, context):
+            pass
         return gpt_server_pb2.SetGptReply(success=True)
 
+    def StreamGpt(
+        self, request: gpt_server_pb2.SetGptRequest(), context: grpc.ServicerContext
+    ) -> Iterator[gpt_server_pb2.StreamGptReply]:
+        # 文を生成するたびに返すため、クライアントは応答の生成完了を待たずに文とモーションを受け取れる
+        yield from self.generate(request, context)
+
+    def InterruptGpt(
+        self,
+        request: gpt_server_pb2.InterruptGptRequest(),
+        context: grpc.ServicerContext,
+    ) -> gpt_server_pb2.InterruptGptReply:
+        session = self.find_session(request, context)
+        if session is None:
+            # 応答を生成していないセッションに対して、新しいセッションを作成しない
+            return gpt_server_pb2.InterruptGptReply(success=False)
+        with session.speculation_lock:
+            session.speculation = None
+        num_cancelled, avoided_tokens = session.generations.cancel_all()
+        if num_cancelled > 0:
+            GPT_INTERRUPTED_GENERATIONS.inc(num_cancelled)
+            GPT_AVOIDED_TOKENS.inc(avoided_tokens)
+            print(
+                f"Interrupted {num_cancelled} generation(s) of {session.session_id}, "
+                f"avoided about {avoided_tokens} tokens "
+                f"(total: {session.generations.avoided_tokens} tokens in "
+                f"{session.generations.num_cancelled} interruptions)"
+            )
+        return gpt_server_pb2.InterruptGptReply(
+            success=True, num_cancelled=num_cancelled, avoided_tokens=avoided_tokens
+        )
+
     def SendMotion(
         self, request: gpt_server_pb2.SendMotionRequest(), context: grpc.ServicerContext
     ) -> gpt_server_pb2.SendMotionReply:
-        success = self.chat_stream_akari_grpc.send_reserved_motion()
+        session = self.find_session(request, context)
+        if session is None:
+            return gpt_server_pb2.SendMotionReply(success=False)
+        success = session.chat_stream_akari_grpc.send_reserved_motion()
         return gpt_server_pb2.SendMotionReply(success=success)
 
 
+class AioGptServer(GptServer):
+    """
+    GptServerのgrpc.aio版。SetGptとStreamGptをイベントループ上のコルーチンで処理する。
+    OpenAIとAnthropicの最終応答は非同期クライアントで生成し、それ以外の生成はスレッドで行う。
+    InterruptGptとSendMotionはGptServerの実装をスレッドプールで実行する。
+    """
+
+    def final_sentences_async(
+        self, session: GptSession, messages: list
+    ) -> Union[AsyncIterable[str], Iterable[str]]:
+        """最終応答を文ごとに生成する。非同期クライアントを使用できない場合は同期のイテレータを返す。"""
+        chat = session.chat_stream_akari_grpc
+        if chat.supports_async("gpt-4o"):
+            return chat.chat_async(messages, model="gpt-4o")
+        return self.final_sentences(session, messages)
+
+    async def send_text_async(
+        self,
+        voice_stream: AioVoiceTextStream,
+        text: str,
+        trace_id: Optional[str] = None,
+    ) -> None:
+        """voice_serverに音声合成するテキストを送信する。"""
+        if self.text_normalizer is None:
+            await voice_stream.send(text)
+        else:
+            # 正規化はTextNormalizerのワーカースレッドで行い、イベントループを止めない
+            with get_tracer().span(trace_id, "text_normalize", chars=len(text)):
+                text = await asyncio.wrap_future(self.text_normalizer.submit(text))
+            await voice_stream.send(text, normalized=True)
+
+    async def generate_async(
+        self, request: gpt_server_pb2.SetGptRequest, context: grpc.aio.ServicerContext
+    ) -> AsyncIterator[gpt_server_pb2.StreamGptReply]:
+        """音声認識の結果から応答を生成し、voice_serverに送信する。generateのgrpc.aio版。
+
+        Args:
+            request (gpt_server_pb2.SetGptRequest): 音声認識の結果。
+            context (grpc.aio.ServicerContext): RPCのコンテキスト。
+
+        Yields:
+            gpt_server_pb2.StreamGptReply: 送信した文、または予約したモーション名。
+        """
+        turn = self.begin_turn(request, context)
+        if turn is None:
+            return
+        session = turn.session
+        stub = session.get_aio_stub()
+        voice_stream = AioVoiceTextStream(
+            stub, use_stream=session.stream_text, metadata=turn.metadata
+        )
+        sentences: AsyncIterable[str]
+        if turn.is_finish:
+            await stub.StartHeadControl(
+                voice_server_pb2.StartHeadControlRequest(), metadata=turn.metadata
+            )
+            if turn.speculation is not None:
+                sentences = iterate_in_thread(turn.speculation.iter_sentences())
+                turn.handle = turn.speculation.source
+            else:
+                turn.handle = session.generations.open_async(
+                    "final", self.final_sentences_async(session, turn.messages)
+                )
+                sentences = turn.handle
+        else:
+            # function_callingを使用するため、第一声の生成はスレッドで行う
+            turn.handle = session.generations.open_async(
+                "early", self.early_sentences(turn)
+            )
+            sentences = turn.handle
+        async with voice_stream:
+            completed = False
+            try:
+                async for sentence in sentences:
+                    await self.send_text_async(voice_stream, sentence, turn.trace_id)
+                    yield turn.add_sentence(sentence)
+                    motion = turn.take_motion()
+                    if motion is not None:
+                        yield motion
+                if turn.is_finish:
+                    # Sentenceの終了を通知
+                    await voice_stream.send("", sentence_end=True)
+                completed = True
+            finally:
+                if not completed:
+                    # RPCのキャンセルやクライアントの切断で終了した場合は、生成中の応答と採用した先行生成を中断する。
+                    # ストリームを閉じるのを待つ間に生成が終了扱いにならないよう、待機する前に中断する
+                    turn.cancel()
+        self.end_turn(turn, voice_stream.use_stream)
+
+    async def SetGpt(
+        self,
+        request: gpt_server_pb2.SetGptRequest(),
+        context: grpc.aio.ServicerContext,
+    ) -> gpt_server_pb2.SetGptReply:
+        async for _ in self.generate_async(request, context):
+            pass
+        return gpt_server_pb2.SetGptReply(success=True)
+
+    async def StreamGpt(
+        self,
+        request: gpt_server_pb2.SetGptRequest(),
+        context: grpc.aio.ServicerContext,
+    ) -> AsyncIterator[gpt_server_pb2.StreamGptReply]:
+        replies = self.generate_async(request, context)
+        try:
+            async for reply in replies:
+                yield reply
+        finally:
+            # キャンセルされた場合も、generate_asyncを閉じて生成を中断する
+            await replies.aclose()
+
+
+async def serve_aio(gpt_server: AioGptServer, ip: str, port: str) -> None:
+    """grpc.aioのサーバでAioGptServerを起動する。"""
+    # 同期のRPC(InterruptGpt, SendMotion)はスレッドプールで実行する
+    server = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        interceptors=[AioMetricsServerInterceptor()],
+    )
+    gpt_server_pb2_grpc.add_GptServerServiceServicer_to_server(gpt_server, server)
+    server.add_insecure_port(ip + ":" + port)
+    await server.start()
+    print(f"gpt_publisher(aio) start. port: {port}")
+    Thread(target=gpt_server.chat_stream_akari_grpc.warm_up, daemon=True).start()
+    await server.wait_for_termination()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -86,12 +700,96 @@ def main() -> None:
     parser.add_argument(
         "--port", help="Gpt server port number", default="10001", type=str
     )
+    parser.add_argument(
+        "--normalize_text",
+        help="Convert English words to kana before sending to voice server",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--speculation_similarity",
+        help="Use the speculative response if the final text adds no content and is similar over this value",
+        default=0.95,
+        type=float,
+    )
+    parser.add_argument(
+        "--unary_text",
+        help="Send each sentence to voice server with SetText instead of StreamText",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--voice_address",
+        help="Default voice server address of sessions",
+        default="localhost:10002",
+        type=str,
+    )
+    parser.add_argument(
+        "--motion_address",
+        help="Default motion server address of sessions",
+        default="127.0.0.1:50055",
+        type=str,
+    )
+    parser.add_argument(
+        "--max_sessions",
+        help="Maximum number of sessions. Least recently used idle sessions are evicted",
+        default=16,
+        type=int,
+    )
+    parser.add_argument(
+        "--session_idle_timeout",
+        help="Evict sessions not used for this time[sec]. 0 disables",
+        default=1800.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--aio",
+        help="Serve with grpc.aio and generate responses with async LLM clients",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trace_file",
+        help="Append latency trace spans to this jsonl file",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--metrics_port",
+        help="Port of the Prometheus metrics HTTP endpoint. 0 disables",
+        default=10011,
+        type=int,
+    )
+    parser.add_argument(
+        "--metrics_host",
+        help="Address the Prometheus metrics HTTP endpoint listens on",
+        default="127.0.0.1",
+        type=str,
+    )
     args = parser.parse_args()
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
-    gpt_server_pb2_grpc.add_GptServerServiceServicer_to_server(GptServer(), server)
+    configure_tracing(args.trace_file, "gpt_publisher")
+    server_class = AioGptServer if args.aio else GptServer
+    gpt_server = server_class(
+        normalize_text=args.normalize_text,
+        speculation_similarity=args.speculation_similarity,
+        stream_text=not args.unary_text,
+        voice_address=args.voice_address,
+        motion_address=args.motion_address,
+        max_sessions=args.max_sessions,
+        session_idle_timeout=args.session_idle_timeout,
+    )
+    start_metrics_server(args.metrics_port, host=args.metrics_host)
+    if args.aio:
+        asyncio.run(serve_aio(gpt_server, args.ip, args.port))
+        return
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        interceptors=[MetricsServerInterceptor()],
+    )
+    gpt_server_pb2_grpc.add_GptServerServiceServicer_to_server(gpt_server, server)
     server.add_insecure_port(args.ip + ":" + args.port)
     server.start()
     print(f"gpt_publisher start. port: {args.port}")
+    # サーバー起動後に、LLMのSDKの読み込みをバックグラウンドで行う
+    Thread(target=gpt_server.chat_stream_akari_grpc.warm_up, daemon=True).start()
     server.wait_for_termination()
 
 
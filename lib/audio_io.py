@@ -0,0 +1,507 @@
+import os
+import time
+import wave
+from abc import ABCMeta, abstractmethod
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Optional, Tuple, Union
+
+import pyaudio
+
+from .err_handler import ignoreStderr
+
+# PyAudioのstream_callbackと同じ形式のコールバック
+# (in_data, frame_count, time_info, status_flags) -> (None, pyaudio.paContinue or pyaudio.paComplete)
+AudioCallback = Callable[[bytes, int, Any, Any], Tuple[Any, int]]
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class RingBuffer(object):
+    """
+    固定長のバイト列リングバッファ。容量を超えた場合は古いデータから上書きする。
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            capacity (int): バッファの容量[byte]。
+
+        """
+        self.capacity = capacity
+        self._buf = bytearray(capacity)
+        self._view = memoryview(self._buf)
+        self._write_pos = 0  # 次に書き込む位置
+        self._size = 0  # 保持しているデータ量[byte]
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def write(self, data: BytesLike) -> None:
+        """データを書き込む。
+
+        Args:
+            data (BytesLike): 書き込むデータ。
+
+        """
+        data = memoryview(data).cast("B")
+        if len(data) >= self.capacity:
+            data = data[len(data) - self.capacity :]
+        with self._lock:
+            first = min(len(data), self.capacity - self._write_pos)
+            self._view[self._write_pos : self._write_pos + first] = data[:first]
+            self._view[: len(data) - first] = data[first:]
+            self._write_pos = (self._write_pos + len(data)) % self.capacity
+            self._size = min(self._size + len(data), self.capacity)
+
+    def latest(self, size: Optional[int] = None) -> Tuple[memoryview, memoryview]:
+        """直近のデータをコピーせずに取得する。
+        データがリングの終端をまたぐ場合があるため、古い順に2つのmemoryviewで返す。
+
+        Args:
+            size (Optional[int], optional): 取得するデータ量[byte]。Noneの場合は保持している全データ。
+
+        Returns:
+            Tuple[memoryview, memoryview]: 直近のデータ(前半, 後半)。
+
+        """
+        with self._lock:
+            if size is None or size > self._size:
+                size = self._size
+            start = (self._write_pos - size) % self.capacity
+            if start + size <= self.capacity:
+                return self._view[start : start + size], self._view[0:0]
+            return self._view[start:], self._view[: self._write_pos]
+
+    def read(self, size: Optional[int] = None) -> bytes:
+        """古い順にデータを取り出す。取り出したデータはバッファから削除される。
+
+        Args:
+            size (Optional[int], optional): 取り出すデータ量[byte]。Noneの場合は保持している全データ。
+
+        Returns:
+            bytes: 取り出したデータ。
+
+        """
+        with self._lock:
+            if size is None or size > self._size:
+                size = self._size
+            start = (self._write_pos - self._size) % self.capacity
+            end = start + size
+            if end <= self.capacity:
+                data = bytes(self._view[start:end])
+            else:
+                data = bytes(self._view[start:]) + bytes(
+                    self._view[: end - self.capacity]
+                )
+            self._size -= size
+            return data
+
+    def clear(self) -> None:
+        """バッファを空にする。"""
+        with self._lock:
+            self._size = 0
+
+
+class AudioSink(metaclass=ABCMeta):
+    """
+    音声の出力先のインターフェース。
+    """
+
+    @abstractmethod
+    def open(self, sampwidth: int, channels: int, rate: int) -> None:
+        """出力を開始する。
+
+        Args:
+            sampwidth (int): 1サンプルあたりのバイト数。
+            channels (int): チャンネル数。
+            rate (int): サンプリングレート。
+
+        """
+        ...
+
+    @abstractmethod
+    def write(self, data: BytesLike) -> None:
+        """音声データを出力する。再生が追いつくまでブロックする。
+
+        Args:
+            data (BytesLike): フレーム境界に揃えた音声データ。
+
+        """
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        """出力を終了する。"""
+        ...
+
+
+class PyAudioSink(AudioSink):
+    """
+    PyAudioの出力デバイスに音声を出力するクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self._audio_interface: Optional[pyaudio.PyAudio] = None
+        self._stream: Any = None
+
+    def open(self, sampwidth: int, channels: int, rate: int) -> None:
+        with ignoreStderr():
+            self._audio_interface = pyaudio.PyAudio()
+            self._stream = self._audio_interface.open(
+                format=self._audio_interface.get_format_from_width(sampwidth),
+                channels=channels,
+                rate=rate,
+                output=True,
+            )
+
+    def write(self, data: BytesLike) -> None:
+        if self._stream is None:
+            return
+        self._stream.write(data)
+
+    def close(self) -> None:
+        if self._stream is not None:
+            # 出力デバイスのバッファが再生しきるまで待つ
+            time.sleep(0.2)
+            self._stream.close()
+            self._stream = None
+        if self._audio_interface is not None:
+            self._audio_interface.terminate()
+            self._audio_interface = None
+
+
+class NullSink(AudioSink):
+    """
+    音声を破棄し、再生時間分だけ待機するクラス。サウンドカードのない環境での計測用。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.bytes_per_sec = 0
+        self.total_bytes = 0  # これまでに出力したデータ量[byte]
+        self._deadline = 0.0  # 出力済みのデータの再生が終わる時刻
+
+    def open(self, sampwidth: int, channels: int, rate: int) -> None:
+        self.bytes_per_sec = sampwidth * channels * rate
+        self._deadline = time.time()
+
+    def write(self, data: BytesLike) -> None:
+        size = len(memoryview(data).cast("B"))
+        self.total_bytes += size
+        self._deadline += size / self.bytes_per_sec
+        wait_time = self._deadline - time.time()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    def close(self) -> None:
+        pass
+
+
+class WavFileSink(AudioSink):
+    """
+    出力ごとに音声をWAVファイルに書き出すクラス。
+    """
+
+    def __init__(self, output_dir: str) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            output_dir (str): WAVファイルを保存するディレクトリ。ファイル名は出力順の連番。
+
+        """
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.index = 0
+        self._wave: Optional[wave.Wave_write] = None
+
+    def open(self, sampwidth: int, channels: int, rate: int) -> None:
+        path = os.path.join(self.output_dir, f"{self.index:04d}.wav")
+        self.index += 1
+        self._wave = wave.open(path, "wb")
+        self._wave.setsampwidth(sampwidth)
+        self._wave.setnchannels(channels)
+        self._wave.setframerate(rate)
+
+    def write(self, data: BytesLike) -> None:
+        # open()の前やclose()の後に書き込まれた音声は破棄する
+        if self._wave is None:
+            return
+        self._wave.writeframesraw(data)
+
+    def close(self) -> None:
+        if self._wave is not None:
+            self._wave.close()
+            self._wave = None
+
+
+class RingBufferSink(AudioSink):
+    """
+    音声をメモリ上のリングバッファに書き込むクラス。出力内容の検証用。
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            capacity (int): リングバッファの容量[byte]。
+
+        """
+        self.ring = RingBuffer(capacity)
+        self.sampwidth = 0
+        self.channels = 0
+        self.rate = 0
+
+    def open(self, sampwidth: int, channels: int, rate: int) -> None:
+        self.sampwidth = sampwidth
+        self.channels = channels
+        self.rate = rate
+
+    def write(self, data: BytesLike) -> None:
+        self.ring.write(data)
+
+    def close(self) -> None:
+        pass
+
+
+class AudioSource(metaclass=ABCMeta):
+    """
+    音声の入力元のインターフェース。16bit PCMの音声をchunkフレームごとにコールバックに渡す。
+    """
+
+    @abstractmethod
+    def open(
+        self, rate: int, channels: int, chunk: int, callback: AudioCallback
+    ) -> None:
+        """入力を開始する。
+
+        Args:
+            rate (int): サンプリングレート。
+            channels (int): チャンネル数。
+            chunk (int): コールバック1回あたりのフレーム数。
+            callback (AudioCallback): PyAudioのstream_callbackと同じ形式のコールバック。
+                pyaudio.paCompleteを返すと入力を終了する。
+
+        """
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        """入力を終了する。"""
+        ...
+
+
+class PyAudioSource(AudioSource):
+    """
+    PyAudioの入力デバイスから音声を取得するクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self._audio_interface: Optional[pyaudio.PyAudio] = None
+        self._stream: Any = None
+
+    def open(
+        self, rate: int, channels: int, chunk: int, callback: AudioCallback
+    ) -> None:
+        with ignoreStderr():
+            self._audio_interface = pyaudio.PyAudio()
+            self._stream = self._audio_interface.open(
+                format=pyaudio.paInt16,
+                channels=channels,
+                rate=rate,
+                input=True,
+                frames_per_buffer=chunk,
+                stream_callback=callback,
+            )
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._audio_interface is not None:
+            self._audio_interface.terminate()
+            self._audio_interface = None
+
+
+class ThreadedAudioSource(AudioSource):
+    """
+    スレッドからchunkごとにコールバックを呼び出す入力元の基底クラス。
+    realtimeがTrueの場合、実際のマイクと同じ周期でコールバックを呼び出す。
+    """
+
+    def __init__(self, realtime: bool = True) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            realtime (bool, optional): 実時間に合わせてコールバックを呼び出すかどうか。デフォルトはTrue。
+
+        """
+        self.realtime = realtime
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    @abstractmethod
+    def read_chunk(self, size: int) -> bytes:
+        """次のchunkの音声データを取得する。
+
+        Args:
+            size (int): 取得するデータ量[byte]。
+
+        Returns:
+            bytes: 音声データ。データがない場合は無音を返す。
+
+        """
+        ...
+
+    def check_format(self, rate: int, channels: int) -> None:
+        """要求された形式で音声を供給できるかを確認する。供給できない場合はValueErrorを送出する。
+
+        Args:
+            rate (int): サンプリングレート。
+            channels (int): チャンネル数。
+
+        """
+        pass
+
+    def open(
+        self, rate: int, channels: int, chunk: int, callback: AudioCallback
+    ) -> None:
+        self.check_format(rate, channels)
+        self._stop_event.clear()
+        self._thread = Thread(
+            target=self._run, args=(rate, channels, chunk, callback), daemon=True
+        )
+        self._thread.start()
+
+    def _run(
+        self, rate: int, channels: int, chunk: int, callback: AudioCallback
+    ) -> None:
+        interval = chunk / rate
+        next_time = time.time()
+        while not self._stop_event.is_set():
+            if self.realtime:
+                next_time += interval
+                wait_time = next_time - time.time()
+                if wait_time > 0:
+                    time.sleep(wait_time)
+            data = self.read_chunk(chunk * channels * 2)
+            _, flag = callback(data, chunk, None, 0)
+            if flag != pyaudio.paContinue:
+                break
+
+    def close(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class WavFileSource(ThreadedAudioSource):
+    """
+    WAVファイルから音声を取得するクラス。ファイルの終端以降は無音を返す。
+    """
+
+    def __init__(self, path: str, realtime: bool = True, loop: bool = False) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            path (str): 16bit PCMのWAVファイルのパス。
+            realtime (bool, optional): 実時間に合わせてコールバックを呼び出すかどうか。デフォルトはTrue。
+            loop (bool, optional): ファイルの終端に達したら先頭から繰り返すかどうか。デフォルトはFalse。
+
+        """
+        super().__init__(realtime=realtime)
+        self.path = path
+        self.loop = loop
+        with wave.open(path, "rb") as wr:
+            if wr.getsampwidth() != 2:
+                raise ValueError("WavFileSource supports only 16bit PCM")
+            self.rate = wr.getframerate()
+            self.channels = wr.getnchannels()
+            self._data = wr.readframes(wr.getnframes())
+        self._view = memoryview(self._data)
+        self._pos = 0
+
+    def check_format(self, rate: int, channels: int) -> None:
+        # 形式の異なるファイルをそのまま渡すと、VADと音声認識には別の音声として届く
+        if self.rate != rate or self.channels != channels:
+            raise ValueError(
+                f"{self.path} is {self.rate}Hz {self.channels}ch, "
+                f"but {rate}Hz {channels}ch is required"
+            )
+
+    def rewind(self) -> None:
+        """読み出し位置を先頭に戻す。"""
+        self._pos = 0
+
+    def read_chunk(self, size: int) -> bytes:
+        if self.loop and self._pos >= len(self._view) and len(self._view) > 0:
+            self._pos = 0
+        data = self._view[self._pos : self._pos + size]
+        self._pos += len(data)
+        if len(data) < size:
+            return bytes(data) + bytes(size - len(data))
+        return bytes(data)
+
+
+class RingBufferSource(ThreadedAudioSource):
+    """
+    メモリ上のリングバッファから音声を取得するクラス。データが足りない場合は無音で埋める。
+    """
+
+    def __init__(self, ring: RingBuffer, realtime: bool = True) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            ring (RingBuffer): 音声データを書き込むリングバッファ。
+            realtime (bool, optional): 実時間に合わせてコールバックを呼び出すかどうか。デフォルトはTrue。
+
+        """
+        super().__init__(realtime=realtime)
+        self.ring = ring
+
+    def read_chunk(self, size: int) -> bytes:
+        data = self.ring.read(size)
+        if len(data) < size:
+            return data + bytes(size - len(data))
+        return data
+
+
+def create_audio_sink(name: str, output_dir: Optional[str] = None) -> AudioSink:
+    """名前から音声出力先を作成する。
+
+    Args:
+        name (str): 出力先の種類。"pyaudio", "null", "file"のいずれか。
+        output_dir (Optional[str], optional): "file"の場合のWAVファイルの保存先。
+
+    Returns:
+        AudioSink: 音声出力先。
+
+    """
+    if name == "pyaudio":
+        return PyAudioSink()
+    elif name == "null":
+        return NullSink()
+    elif name == "file":
+        if output_dir is None:
+            raise ValueError("output_dir is required for file sink")
+        return WavFileSink(output_dir)
+    raise ValueError(f"Unknown audio sink: {name}")
+
+
+def create_audio_source(input_wav: Optional[str] = None) -> AudioSource:
+    """音声入力元を作成する。
+
+    Args:
+        input_wav (Optional[str], optional): 指定した場合、このWAVファイルを入力とする。Noneの場合はマイクを使用する。
+
+    Returns:
+        AudioSource: 音声入力元。
+
+    """
+    if input_wav is None:
+        return PyAudioSource()
+    return WavFileSource(input_wav)
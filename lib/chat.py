@@ -1,17 +1,13 @@
 import base64
 import copy
-from typing import Any, Generator, Optional, Tuple, Union
+from threading import Lock
+from typing import Any, AsyncGenerator, Generator, Optional, Tuple, Union
 
-import anthropic
-import cv2
 import numpy as np
-from google import genai
-from google.genai import types
-from google.genai.types import Content, Part
 from gpt_stream_parser import force_parse_json
-from openai import OpenAI
 
 from .conf import ANTHROPIC_APIKEY, GEMINI_APIKEY, OPENAI_APIKEY
+from .generation import mark_first_token, register_stream
 
 
 class ChatStream(object):
@@ -20,20 +16,16 @@ class ChatStream(object):
     """
 
     def __init__(self) -> None:
-        """クラスの初期化メソッド。"""
-        self.anthropic_client = None
-        if ANTHROPIC_APIKEY is not None:
-            self.anthropic_client = anthropic.Anthropic(
-                api_key=ANTHROPIC_APIKEY,
-            )
-        self.openai_client = None
-        if OPENAI_APIKEY is not None:
-            self.openai_client = OpenAI(
-                api_key=OPENAI_APIKEY,
-            )
-        self.gemini_client = None
-        if GEMINI_APIKEY is not None:
-            self.gemini_client = genai.Client(api_key=GEMINI_APIKEY)
+        """クラスの初期化メソッド。
+        各LLMのSDKは読み込みに時間がかかるため、クライアントは初回使用時に生成する。
+        """
+        self._anthropic_client = None
+        self._openai_client = None
+        self._gemini_client = None
+        # asyncioで使用する非同期クライアント。grpc.aioのサーバで使用する
+        self._async_anthropic_client = None
+        self._async_openai_client = None
+        self.client_lock = Lock()
         self.last_char = ["。", "！", "!", "?", "？", "\n", "}"]
         self.openai_flagship_model_name = [
             "o1",
@@ -130,6 +122,93 @@ class ChatStream(object):
             "gemini-1.5-flash-8b",
         ]
 
+    @property
+    def anthropic_client(self) -> Optional[Any]:
+        """Anthropicのクライアントを返す。APIキーが未設定の場合はNone。"""
+        if self._anthropic_client is None and ANTHROPIC_APIKEY is not None:
+            with self.client_lock:
+                if self._anthropic_client is None:
+                    import anthropic
+
+                    self._anthropic_client = anthropic.Anthropic(
+                        api_key=ANTHROPIC_APIKEY,
+                    )
+        return self._anthropic_client
+
+    @property
+    def openai_client(self) -> Optional[Any]:
+        """OpenAIのクライアントを返す。APIキーが未設定の場合はNone。"""
+        if self._openai_client is None and OPENAI_APIKEY is not None:
+            with self.client_lock:
+                if self._openai_client is None:
+                    from openai import OpenAI
+
+                    self._openai_client = OpenAI(
+                        api_key=OPENAI_APIKEY,
+                    )
+        return self._openai_client
+
+    @property
+    def gemini_client(self) -> Optional[Any]:
+        """Geminiのクライアントを返す。APIキーが未設定の場合はNone。"""
+        if self._gemini_client is None and GEMINI_APIKEY is not None:
+            with self.client_lock:
+                if self._gemini_client is None:
+                    from google import genai
+
+                    self._gemini_client = genai.Client(api_key=GEMINI_APIKEY)
+        return self._gemini_client
+
+    @property
+    def async_anthropic_client(self) -> Optional[Any]:
+        """Anthropicの非同期クライアントを返す。APIキーが未設定の場合はNone。"""
+        if self._async_anthropic_client is None and ANTHROPIC_APIKEY is not None:
+            with self.client_lock:
+                if self._async_anthropic_client is None:
+                    import anthropic
+
+                    self._async_anthropic_client = anthropic.AsyncAnthropic(
+                        api_key=ANTHROPIC_APIKEY,
+                    )
+        return self._async_anthropic_client
+
+    @property
+    def async_openai_client(self) -> Optional[Any]:
+        """OpenAIの非同期クライアントを返す。APIキーが未設定の場合はNone。"""
+        if self._async_openai_client is None and OPENAI_APIKEY is not None:
+            with self.client_lock:
+                if self._async_openai_client is None:
+                    from openai import AsyncOpenAI
+
+                    self._async_openai_client = AsyncOpenAI(
+                        api_key=OPENAI_APIKEY,
+                    )
+        return self._async_openai_client
+
+    def share_clients(self, other: "ChatStream") -> None:
+        """他のインスタンスが生成済みのLLMのクライアントを共有する。
+        未生成のクライアントは、これまで通り初回使用時に生成する。
+
+        Args:
+            other (ChatStream): クライアントを共有する元のインスタンス。
+
+        """
+        self._anthropic_client = other._anthropic_client
+        self._openai_client = other._openai_client
+        self._gemini_client = other._gemini_client
+        self._async_anthropic_client = other._async_anthropic_client
+        self._async_openai_client = other._async_openai_client
+
+    def warm_up(self) -> None:
+        """APIキーが設定されているLLMのクライアントを事前に生成する。
+        初回の返答生成時の待ち時間を減らすため、バックグラウンドスレッドで呼び出すことを想定している。
+        """
+        for name in ["openai_client", "anthropic_client", "gemini_client"]:
+            try:
+                getattr(self, name)
+            except BaseException as e:
+                print(f"Failed to create {name}: {e}")
+
     def cv_to_base64(self, image: np.ndarray) -> str:
         """OpenCV画像をbase64エンコードした文字列に変換する
         Args:
@@ -139,6 +218,8 @@ class ChatStream(object):
             str: base64エンコードされた画像データ
 
         """
+        import cv2
+
         _, encoded = cv2.imencode(".jpg", image)
         return base64.b64encode(encoded).decode("ascii")
 
@@ -191,6 +272,8 @@ class ChatStream(object):
         for image in image_list:
             if isinstance(image, np.ndarray):
                 if image_width is not None and image_height is not None:
+                    import cv2
+
                     image = cv2.resize(image, (image_width, image_height))
                 image = self.cv_to_base64(image)
             url = f"data:image/jpeg;base64,{image}"
@@ -271,6 +354,8 @@ class ChatStream(object):
         Returns:
             Tuple(str, list, dict): システムメッセージ, メッセージ履歴, ユーザメッセージ
         """
+        from google.genai.types import Content, Part
+
         system_instruction = ""
         history = []
 
@@ -361,6 +446,7 @@ class ChatStream(object):
             if text is None:
                 pass
             else:
+                mark_first_token()
                 full_response += text
                 real_time_response += text
                 if stream_per_sentence:
@@ -401,6 +487,7 @@ class ChatStream(object):
             if text is None:
                 pass
             else:
+                mark_first_token()
                 full_response += text
                 real_time_response += text
                 if stream_per_sentence:
@@ -438,6 +525,7 @@ class ChatStream(object):
             if text is None:
                 pass
             else:
+                mark_first_token()
                 full_response += text
                 real_time_response += text
                 if stream_per_sentence:
@@ -457,6 +545,73 @@ class ChatStream(object):
         if stream_per_sentence and real_time_response != "":
             yield real_time_response
 
+    async def parse_output_stream_gpt_legacy_async(
+        self, response: Any, stream_per_sentence: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """GPT chat completions APIの非同期ストリーム出力を解析してテキストを返す
+
+        Args:
+            result (Any): 非同期ストリーム出力
+            stream_per_sentence (bool): 1文ごとにストリーミングするかどうか (デフォルト: True)
+        Returns:
+            AsyncGenerator[str, None]): 会話の返答を順次生成する
+
+        """
+        real_time_response = ""
+        async for chunk in response:
+            if len(chunk.choices) == 0:
+                continue
+            text = chunk.choices[0].delta.content
+            if text is None:
+                continue
+            mark_first_token()
+            real_time_response += text
+            if not stream_per_sentence:
+                yield text
+                continue
+            for index, char in enumerate(real_time_response):
+                if char in self.last_char:
+                    pos = index + 1  # 区切り位置
+                    sentence = real_time_response[:pos]  # 1文の区切り
+                    real_time_response = real_time_response[pos:]  # 残りの部分
+                    if sentence != "":
+                        yield sentence
+                    break
+        if stream_per_sentence and real_time_response != "":
+            yield real_time_response
+
+    async def parse_output_stream_anthropic_async(
+        self, responses: Any, stream_per_sentence: bool = True
+    ) -> AsyncGenerator[str, None]:
+        """Anthropicの非同期ストリーム出力を解析してテキストを返す
+
+        Args:
+            responses (Any): Anthropicの非同期ストリーム出力
+            stream_per_sentence (bool): 1文ごとにストリーミングするかどうか (デフォルト: True)
+        Returns:
+            AsyncGenerator[str, None]): 会話の返答を順次生成する
+
+        """
+        real_time_response = ""
+        async for text in responses.text_stream:
+            if text is None:
+                continue
+            mark_first_token()
+            real_time_response += text
+            if not stream_per_sentence:
+                yield text
+                continue
+            for index, char in enumerate(real_time_response):
+                if char in self.last_char:
+                    pos = index + 1  # 区切り位置
+                    sentence = real_time_response[:pos]  # 1文の区切り
+                    real_time_response = real_time_response[pos:]  # 残りの部分
+                    if sentence != "":
+                        yield sentence
+                    break
+        if stream_per_sentence and real_time_response != "":
+            yield real_time_response
+
     def parse_output_stream_gemini(
         self, responses: Any, stream_per_sentence: bool = True
     ) -> Generator[str, None, None]:
@@ -476,6 +631,7 @@ class ChatStream(object):
             if text is None:
                 pass
             else:
+                mark_first_token()
                 full_response += text
                 real_time_response += text
                 if stream_per_sentence:
@@ -495,6 +651,105 @@ class ChatStream(object):
         if stream_per_sentence and real_time_response != "":
             yield real_time_response
 
+    def gpt_legacy_args(
+        self,
+        messages: list,
+        model: str = "gpt-5",
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        verbosity: str = "low",
+        reasoning_effort: str = "minimal",
+        timeout: Optional[float] = None,
+    ) -> dict:
+        """GPT chat completions APIのストリーミングリクエストの引数を作成する
+
+        Args:
+            messages (list): 会話のメッセージ
+            model (str): 使用するモデル名 (デフォルト: "gpt-5")
+            temperature (float): ChatGPTのtemperatureパラメータ (デフォルト: 0.7)
+            max_tokens (int): 1回のリクエストで生成する最大トークン数 (デフォルト: 1024)
+            verbosity (str): レスポンスの冗長性 ("low","medium", "high") (デフォルト: "low")
+            reasoning_effort (str): 推論の努力レベル ("minimal", "low", "medium", "high") (デフォルト: "minimal")
+            timeout (float): リクエストのタイムアウト時間 (デフォルト: None)
+        Returns:
+            dict: chat.completions.createの引数
+
+        """
+        # 通常モード用の基本パラメータ
+        messages = self.convert_messages_from_gpt_to_gpt_legacy(copy.deepcopy(messages))
+        args = {
+            "model": model,
+            "messages": messages,
+            "timeout": timeout,
+            "stream": True,
+        }
+        # モデルに応じて追加パラメータを設定
+        if model in self.openai_flagship_model_name:
+            args["reasoning_effort"] = reasoning_effort
+        elif model in self.openai_gpt5_model_name:
+            args["n"] = 1
+            args["reasoning_effort"] = reasoning_effort
+            args["verbosity"] = verbosity
+        else:
+            args["max_tokens"] = max_tokens
+            args["n"] = 1
+            args["temperature"] = temperature
+        return args
+
+    def anthropic_args(
+        self,
+        messages: list,
+        model: str = "claude-3-7-sonnet-latest",
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        budget_tokens: int = 0,
+        web_search: bool = False,
+        timeout: Optional[float] = None,
+    ) -> dict:
+        """Anthropicのストリーミングリクエストの引数を作成する
+
+        Args:
+            messages (list): 会話のメッセージ
+            model (str): 使用するモデル名 (デフォルト: "claude-3-7-sonnet-latest")
+            temperature (float): Claude3のtemperatureパラメータ (デフォルト: 0.7)
+            max_tokens (int): 1回のリクエストで生成する最大トークン数 (デフォルト: 1024)
+            budget_tokens (int): 1回のリクエストで思考に使用するトークン数 (デフォルト: 0)
+            web_search (bool): ウェブ検索を行うかどうか (デフォルト: False)
+            timeout (float): リクエストのタイムアウト時間 (デフォルト: None)
+        Returns:
+            dict: messages.streamの引数
+
+        """
+        # anthropicではsystemメッセージは引数として与えるので、メッセージから抜き出す
+        system_message = ""
+        user_messages = []
+        system_message, user_messages = self.convert_messages_from_gpt_to_anthropic(
+            copy.deepcopy(messages)
+        )
+        # 基本パラメータ
+        args = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "messages": user_messages,
+            "system": system_message,
+            "timeout": timeout,
+        }
+        if web_search:
+            args["tools"] = [
+                {
+                    "type": "web_search_20250305",
+                    "name": "web_search",
+                    "max_uses": 5,
+                }
+            ]
+        # budget_tokensが0より大きい場合のみthinking引数を追加
+        if budget_tokens > 0:
+            args["thinking"] = {"type": "enabled", "budget_tokens": budget_tokens}
+            args["temperature"] = 1.0  # thinkingではtemperatureは1.0固定
+        else:
+            args["temperature"] = temperature
+        return args
+
     def chat_gpt(
         self,
         messages: list,
@@ -551,35 +806,24 @@ class ChatStream(object):
             except BaseException as e:
                 print(f"OpenAIレスポンスエラー: {e}")
                 raise (e)
+            register_stream(result)
             yield from self.parse_output_stream_gpt(result, stream_per_sentence)
         else:
-            # 通常モード用の基本パラメータ
-            messages = self.convert_messages_from_gpt_to_gpt_legacy(
-                copy.deepcopy(messages)
+            args = self.gpt_legacy_args(
+                messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                verbosity=verbosity,
+                reasoning_effort=reasoning_effort,
+                timeout=timeout,
             )
-            args = {
-                "model": model,
-                "messages": messages,
-                "timeout": timeout,
-                "stream": True,
-            }
-            # モデルに応じて追加パラメータを設定
-            if model in self.openai_flagship_model_name:
-                args["reasoning_effort"] = reasoning_effort
-            elif model in self.openai_gpt5_model_name:
-                args["n"] = 1
-                args["reasoning_effort"] = reasoning_effort
-                args["verbosity"] = verbosity
-            else:
-                args["max_tokens"] = max_tokens
-                args["n"] = 1
-                args["temperature"] = temperature
-
             try:
                 result = self.openai_client.chat.completions.create(**args)
             except BaseException as e:
                 print(f"OpenAIレスポンスエラー: {e}")
                 raise (e)
+            register_stream(result)
             yield from self.parse_output_stream_gpt_legacy(result, stream_per_sentence)
 
     def chat_anthropic(
@@ -608,35 +852,17 @@ class ChatStream(object):
             Generator[str, None, None]): 会話の返答を順次生成する
 
         """
-        # anthropicではsystemメッセージは引数として与えるので、メッセージから抜き出す
-        system_message = ""
-        user_messages = []
-        system_message, user_messages = self.convert_messages_from_gpt_to_anthropic(
-            copy.deepcopy(messages)
+        args = self.anthropic_args(
+            messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            budget_tokens=budget_tokens,
+            web_search=web_search,
+            timeout=timeout,
         )
-        # 基本パラメータ
-        args = {
-            "model": model,
-            "max_tokens": max_tokens,
-            "messages": user_messages,
-            "system": system_message,
-            "timeout": timeout,
-        }
-        if web_search:
-            args["tools"] = [
-                {
-                    "type": "web_search_20250305",
-                    "name": "web_search",
-                    "max_uses": 5,
-                }
-            ]
-        # budget_tokensが0より大きい場合のみthinking引数を追加
-        if budget_tokens > 0:
-            args["thinking"] = {"type": "enabled", "budget_tokens": budget_tokens}
-            args["temperature"] = 1.0  # thinkingではtemperatureは1.0固定
-        else:
-            args["temperature"] = temperature
         with self.anthropic_client.messages.stream(**args) as result:
+            register_stream(result)
             yield from self.parse_output_stream_anthropic(result, stream_per_sentence)
 
     def chat_gemini(
@@ -673,6 +899,8 @@ class ChatStream(object):
             history,
             cur_message,
         ) = self.convert_messages_from_gpt_to_gemini(copy.deepcopy(messages))
+        from google.genai import types
+
         timeout_ms = timeout * 1000 if timeout else None
         # 基本configパラメータ
         config_args = {
@@ -777,6 +1005,95 @@ class ChatStream(object):
             print(f"Model name {model} can't use for this function")
             return
 
+    def supports_async(self, model: str, web_search: bool = False) -> bool:
+        """chat_asyncで非同期クライアントを使用できるモデルかどうかを返す。
+        OpenAIのchat completions APIとAnthropicのみ対応する。
+
+        Args:
+            model (str): 使用するモデル名
+            web_search (bool): ウェブ検索を行うかどうか (デフォルト: False)
+        Returns:
+            bool: 非同期クライアントを使用できる場合はTrue
+
+        """
+        if (
+            model in self.openai_model_name
+            or model in self.openai_gpt5_model_name
+            or model in self.openai_flagship_model_name
+        ):
+            return not web_search and OPENAI_APIKEY is not None
+        return model in self.anthropic_model_name and ANTHROPIC_APIKEY is not None
+
+    async def chat_async(
+        self,
+        messages: list,
+        model: str = "gpt-5",
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        budget_tokens: int = 0,
+        reasoning_effort: str = "minimal",
+        verbosity: str = "low",
+        timeout: Optional[float] = None,
+        stream_per_sentence: bool = True,
+    ) -> AsyncGenerator[str, None]:
+        """指定したモデルを使用して、非同期クライアントでレスポンスを取得する
+        イベントループのスレッドを占有しないため、grpc.aioのサーバから使用する。
+        対応するモデルはsupports_asyncで確認する。
+
+        Args:
+            messages (list): 会話のメッセージリスト
+            model (str): 使用するモデル名 (デフォルト: "gpt-5")
+            temperature (float): サンプリングの温度パラメータ (デフォルト: 0.7)
+            max_tokens (int): 1回のリクエストで生成する最大トークン数 (デフォルト: 1024)
+            budget_tokens (int): 1回のリクエストで拡張思考に使用するトークン数。claudeでのみ使用可能。 (デフォルト: 0)
+            reasoning_effort (str): 推論の努力レベル。gptでのみ使用可能。 ("minimal", "low", "medium", "high") (デフォルト: "minimal")
+            verbosity (str): レスポンスの冗長性。gpt-5でのみ使用可能。 ("low", "medium", "high") (デフォルト: "low")
+            timeout (float): リクエストのタイムアウト時間 (デフォルト: None)
+            stream_per_sentence (bool): 1文ごとにストリーミングするかどうか (デフォルト: True)
+        Returns:
+            AsyncGenerator[str, None]): 会話の返答を順次生成する
+
+        """
+        if not self.supports_async(model):
+            raise ValueError(f"Model name {model} can't use for async chat")
+        if model in self.anthropic_model_name:
+            args = self.anthropic_args(
+                messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                budget_tokens=budget_tokens,
+                timeout=timeout,
+            )
+            # 中断時はasync withを抜けてストリームが閉じられる
+            async with self.async_anthropic_client.messages.stream(**args) as result:
+                async for sentence in self.parse_output_stream_anthropic_async(
+                    result, stream_per_sentence
+                ):
+                    yield sentence
+            return
+        args = self.gpt_legacy_args(
+            messages,
+            model=model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            verbosity=verbosity,
+            reasoning_effort=reasoning_effort,
+            timeout=timeout,
+        )
+        try:
+            result = await self.async_openai_client.chat.completions.create(**args)
+        except BaseException as e:
+            print(f"OpenAIレスポンスエラー: {e}")
+            raise (e)
+        try:
+            async for sentence in self.parse_output_stream_gpt_legacy_async(
+                result, stream_per_sentence
+            ):
+                yield sentence
+        finally:
+            await result.close()
+
     def chat_thinking(
         self,
         messages: list,
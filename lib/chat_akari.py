@@ -5,11 +5,10 @@ import sys
 import threading
 from typing import Generator
 
-import grpc
-from google.genai import types
 from gpt_stream_parser import force_parse_json
 
 from .chat import ChatStream
+from .grpc_channel import get_channel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
 import motion_server_pb2
@@ -32,7 +31,9 @@ class ChatStreamAkari(ChatStream):
 
         """
         super().__init__()
-        motion_channel = grpc.insecure_channel(motion_host + ":" + motion_port)
+        motion_channel = get_channel(
+            motion_host + ":" + motion_port, keepalive_without_calls=False
+        )
         self.motion_stub = motion_server_pb2_grpc.MotionServerServiceStub(
             motion_channel
         )
@@ -293,6 +294,8 @@ class ChatStreamAkari(ChatStream):
         if self.gemini_client is None:
             print("Gemini API key is not set.")
             return
+        from google.genai import types
+
         new_messages = copy.deepcopy(messages)
         new_messages[-1]["content"] = (
             f"「{new_messages[-1]['content']}」に対する返答を下記のJSON形式で出力してください。"
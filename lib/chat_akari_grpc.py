@@ -3,11 +3,11 @@ import os
 import sys
 from typing import Generator
 
-import google.generativeai as genai
 from gpt_stream_parser import force_parse_json
 
 from .chat_akari import ChatStreamAkari
 from .conf import GEMINI_APIKEY
+from .generation import mark_first_token, register_stream
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
 import motion_server_pb2
@@ -128,6 +128,7 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
             },
             stream=True,
         )
+        register_stream(result)
         full_response = ""
         real_time_response = ""
         sentence_index = 0
@@ -135,6 +136,7 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
         for chunk in result:
             if chunk.type != "response.function_call_arguments.delta":
                 continue
+            mark_first_token()
             full_response += chunk.delta
             try:
                 data_json = json.loads(full_response)
@@ -227,6 +229,7 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
             messages=user_messages,
             system=system_message,
         ) as result:
+            register_stream(result)
             full_response = ""
             real_time_response = ""
             sentence_index = 0
@@ -235,6 +238,7 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
                 if text is None:
                     pass
                 else:
+                    mark_first_token()
                     full_response += text
                     real_time_response += text
                     try:
@@ -320,6 +324,8 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
             elif message["role"] == "assistant":
                 message["role"] = "model"
             new_messages.append(message)
+        import google.generativeai as genai
+
         if system_instruction == "":
             model = genai.GenerativeModel(
                 model_name=model,
@@ -348,6 +354,7 @@ class ChatStreamAkariGrpc(ChatStreamAkari):
             if text is None:
                 pass
             else:
+                mark_first_token()
                 full_response += text
                 real_time_response += text
                 try:
@@ -0,0 +1,165 @@
+import json
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from .recognizer import RecognitionResult
+
+# 判定結果
+DISPATCH_EARLY = "early"  # 途中結果から第一声(短い返答)を生成する
+DISPATCH_SPECULATE = "speculate"  # 途中結果から最終応答を先行して生成する
+
+
+def common_prefix_len(a: str, b: str) -> int:
+    """2つの文字列の先頭から一致する文字数を返す。"""
+    num = min(len(a), len(b))
+    for i in range(num):
+        if a[i] != b[i]:
+            return i
+    return num
+
+
+class DispatchPolicy(object):
+    """
+    音声認識の途中結果を、いつgpt_serverに送るかを判定するクラス。
+    途中結果のstability、連続する途中結果の先頭一致率(agreement)、最初の途中結果からの経過時間から、
+    第一声の生成(early)と最終応答の先行生成(speculate)の開始を判定する。
+    log_pathを指定すると、全ての途中結果に対する特徴量と判定結果をjsonlで記録する。
+    """
+
+    def __init__(
+        self,
+        early_min_chars: int = 8,
+        early_stability: float = 0.6,
+        early_agreement: float = 0.9,
+        early_max_wait: float = 1.5,
+        speculate: bool = False,
+        speculate_min_chars: int = 8,
+        speculate_stability: float = 0.8,
+        speculate_agreement: float = 0.95,
+        speculate_min_elapsed: float = 1.0,
+        max_speculations: int = 2,
+        log_path: Optional[str] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            early_min_chars (int, optional): 第一声を生成する途中結果の文字数。この文字数を超えると判定を行う。0の場合は第一声を生成しない。デフォルトは8。
+            early_stability (float, optional): 第一声を生成するstabilityの閾値。デフォルトは0.6。
+            early_agreement (float, optional): 第一声を生成する、直前の途中結果との先頭一致率の閾値。デフォルトは0.9。
+            early_max_wait (float, optional): 最初の途中結果からこの時間[sec]が経過した場合は、stabilityと先頭一致率によらず第一声を生成する。デフォルトは1.5。
+            speculate (bool, optional): 最終応答の先行生成を判定するかどうか。デフォルトはFalse。
+            speculate_min_chars (int, optional): 先行生成を行う途中結果の最小文字数。デフォルトは8。
+            speculate_stability (float, optional): 先行生成を行うstabilityの閾値。デフォルトは0.8。
+            speculate_agreement (float, optional): 先行生成を行う、直前の途中結果との先頭一致率の閾値。デフォルトは0.95。
+            speculate_min_elapsed (float, optional): 先行生成を行う最初の途中結果からの最小経過時間[sec]。デフォルトは1.0。
+            max_speculations (int, optional): 1回の発話で先行生成を行う最大回数。デフォルトは2。
+            log_path (Optional[str], optional): 判定結果を記録するjsonlファイルのパス。Noneの場合は記録しない。デフォルトはNone。
+
+        """
+        self.early_min_chars = early_min_chars
+        self.early_stability = early_stability
+        self.early_agreement = early_agreement
+        self.early_max_wait = early_max_wait
+        self.speculate = speculate
+        self.speculate_min_chars = speculate_min_chars
+        self.speculate_stability = speculate_stability
+        self.speculate_agreement = speculate_agreement
+        self.speculate_min_elapsed = speculate_min_elapsed
+        self.max_speculations = max_speculations
+        self.log_path = log_path
+        self.log_lock = Lock()
+        self.utterance_id = 0
+        self.start_time: Optional[float] = None
+        self.prev_transcript = ""
+        self.early_sent = False
+        self.speculated: List[str] = []
+
+    def reset(self) -> None:
+        """発話ごとの状態を初期化する。発話の認識開始時に呼び出す。"""
+        self.utterance_id += 1
+        self.start_time = None
+        self.prev_transcript = ""
+        self.early_sent = False
+        self.speculated = []
+
+    def update(self, result: RecognitionResult) -> List[str]:
+        """認識結果を入力し、gpt_serverに送るべきかを判定する。
+
+        Args:
+            result (RecognitionResult): 音声認識の途中結果または最終結果。
+
+        Returns:
+            List[str]: 判定結果(DISPATCH_EARLY, DISPATCH_SPECULATE)のリスト。送らない場合は空のリスト。
+
+        """
+        transcript = result.transcript
+        now = time.time()
+        # 音声認識の開始から発話が始まるまでの待ち時間を含めないよう、最初の結果を基準とする
+        if self.start_time is None:
+            self.start_time = now
+        elapsed = now - self.start_time
+        chars = len(transcript)
+        if len(self.prev_transcript) > 0:
+            agreement = common_prefix_len(self.prev_transcript, transcript) / len(
+                self.prev_transcript
+            )
+        else:
+            agreement = 0.0
+        decisions = []
+        reason = ""
+        if (
+            not self.early_sent
+            and self.early_min_chars > 0
+            and chars > self.early_min_chars
+        ):
+            if result.is_final:
+                reason = "final"
+            elif result.stability >= self.early_stability:
+                reason = "stability"
+            elif agreement >= self.early_agreement:
+                reason = "agreement"
+            elif elapsed >= self.early_max_wait:
+                reason = "max_wait"
+            if reason != "":
+                decisions.append(DISPATCH_EARLY)
+                self.early_sent = True
+        if (
+            self.speculate
+            and not result.is_final
+            and len(self.speculated) < self.max_speculations
+            and chars >= self.speculate_min_chars
+            and result.stability >= self.speculate_stability
+            and agreement >= self.speculate_agreement
+            and elapsed >= self.speculate_min_elapsed
+            and transcript not in self.speculated
+        ):
+            decisions.append(DISPATCH_SPECULATE)
+            self.speculated.append(transcript)
+        self.log(
+            {
+                "utterance": self.utterance_id,
+                "elapsed": round(elapsed, 3),
+                "transcript": transcript,
+                "is_final": result.is_final,
+                "chars": chars,
+                "stability": round(float(result.stability), 3),
+                "agreement": round(agreement, 3),
+                "decisions": decisions,
+                "early_reason": reason,
+            }
+        )
+        self.prev_transcript = transcript
+        return decisions
+
+    def log(self, record: Dict[str, Any]) -> None:
+        """判定結果をjsonlファイルに追記する。"""
+        if self.log_path is None:
+            return
+        record["time"] = time.time()
+        try:
+            with self.log_lock:
+                with open(self.log_path, mode="a") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except BaseException as e:
+            print(f"Failed to write dispatch log: {e}")
@@ -1,28 +1,107 @@
 import csv
 import os
 import re
-from typing import Tuple
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Optional, Tuple
 
 import alkana
 from pyjapanglish import Japanglish
 
+from .phrase_replacer import PhraseReplacer
+
+EN_TO_JP_DICT_PATH = (
+    os.path.dirname(os.path.abspath(__file__)) + "/../config/en_to_jp_fix_dict.csv"
+)
+
+# 英単語の検索パターン
+ALKANA_WORD_PATTERN = re.compile(r"[a-zA-Z]{1,}")
+JAPANGLISH_WORD_PATTERN = re.compile(r"[a-zA-Z]{3,}")
+# 先頭大文字の単語が連結された単語(CamelCase)のパターン
+ALKANA_CAMEL_PATTERN = re.compile(r"(?:[A-Z][a-z]{1,}){2,}")
+ALKANA_CAMEL_HEAD_PATTERN = re.compile(r"[A-Z][a-z]{1,}")
+JAPANGLISH_CAMEL_PATTERN = re.compile(r"(?:[A-Z][a-z]{3,}){2,}")
+JAPANGLISH_CAMEL_HEAD_PATTERN = re.compile(r"[A-Z][a-z]{3,}")
+
 
 class EnToJp(object):
-    def __init__(self) -> None:
-        self.japanglish = Japanglish()
-        self.user_dict_list: Tuple[str, str] = []
-        EN_TO_JP_DICT_PATH = (
-            os.path.dirname(os.path.abspath(__file__))
-            + "/../config/en_to_jp_fix_dict.csv"
-        )
-        if os.path.exists(EN_TO_JP_DICT_PATH):
-            with open(EN_TO_JP_DICT_PATH, mode="r") as fix_dict_file:
+    # 修正辞書の更新を確認する間隔(秒)
+    FIX_DICT_CHECK_INTERVAL = 1.0
+
+    def __init__(
+        self, memo_size: int = 4096, fix_dict_path: str = EN_TO_JP_DICT_PATH
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            memo_size (int, optional): 単語ごとの変換結果を保持する最大数。デフォルトは4096。
+            fix_dict_path (str, optional): 修正辞書(csv)のパス。デフォルトはconfig/en_to_jp_fix_dict.csv。
+
+        """
+        self.japanglish = Japanglish(user_dict={})
+        self.user_dict: Dict[str, str] = {}
+        self.phrase_replacer = PhraseReplacer({})
+        self.memo_size = memo_size
+        # 単語ごとの変換結果のメモ。キーは(単語, alkana, japanglish, inference)
+        self.memo: OrderedDict[Tuple[str, bool, bool, bool], str] = OrderedDict()
+        self.memo_lock = Lock()
+        self.fix_dict_path = fix_dict_path
+        self.fix_dict_mtime: Optional[float] = None
+        self.fix_dict_check_time = 0.0
+        self.fix_dict_lock = Lock()
+        self.load_fix_dict()
+
+    def load_fix_dict(self) -> None:
+        """修正辞書を読み込み、単語・フレーズの置換オートマトンを構築する。
+        読み込み後は変換結果のメモを破棄する。
+        """
+        fix_dict: Dict[str, str] = {}
+        mtime = None
+        if os.path.exists(self.fix_dict_path):
+            mtime = os.path.getmtime(self.fix_dict_path)
+            with open(self.fix_dict_path, mode="r") as fix_dict_file:
                 csv_reader = csv.reader(fix_dict_file)
-                next(csv_reader)  # 1行目を無視
+                next(csv_reader, None)  # 1行目を無視
                 for row in csv_reader:
                     if len(row) >= 2:
-                        self.japanglish.user_dict[row[0]] = row[1]
-                        self.user_dict_list.append((row[0], row[1]))
+                        fix_dict[row[0].lower()] = row[1]
+        phrase_replacer = PhraseReplacer(fix_dict)
+        with self.memo_lock:
+            self.user_dict = fix_dict
+            self.japanglish.user_dict = fix_dict
+            self.phrase_replacer = phrase_replacer
+            self.fix_dict_mtime = mtime
+            self.memo.clear()
+
+    def reload_fix_dict_if_updated(self) -> bool:
+        """修正辞書が更新されていれば再読み込みする。
+        確認はFIX_DICT_CHECK_INTERVAL秒に1回のみ行う。
+
+        Returns:
+            bool: 再読み込みした場合はTrue。
+
+        """
+        now = time.monotonic()
+        if now - self.fix_dict_check_time < self.FIX_DICT_CHECK_INTERVAL:
+            return False
+        with self.fix_dict_lock:
+            if now - self.fix_dict_check_time < self.FIX_DICT_CHECK_INTERVAL:
+                return False
+            self.fix_dict_check_time = now
+            try:
+                mtime = os.path.getmtime(self.fix_dict_path)
+            except OSError:
+                mtime = None
+            if mtime == self.fix_dict_mtime:
+                return False
+            try:
+                self.load_fix_dict()
+            except BaseException as e:
+                print(f"Failed to reload fix dict: {e}")
+                return False
+            print(f"Reloaded fix dict: {self.fix_dict_path}")
+            return True
 
     def replace_english_to_alkana(self, text: str) -> str:
         """テキストに含まれている英単語をalkanaでカタカナに変換して返す
@@ -33,12 +112,9 @@ class EnToJp(object):
         Returns:
             str: 変換後のテキスト
         """
-        output = ""
-        # 先頭から順番に英単語を検索しカタカナに変換
-        while word := re.search(r"[a-zA-Z]{1,}", text):
-            output += text[: word.start()] + self.word_to_alkana(word.group())
-            text = text[word.end() :]
-        return output + text
+        return ALKANA_WORD_PATTERN.sub(
+            lambda word: self.word_to_alkana(word.group()), text
+        )
 
     def word_to_alkana(self, word: str) -> str:
         """英単語がカタカナに変換できる場合はカタカナにして返す
@@ -49,22 +125,20 @@ class EnToJp(object):
         Returns:
             str: 変換後のカタカナ
         """
-
+        # ユーザー辞書に登録されている場合はユーザー辞書の値を返す
+        if (user_word := self.user_dict.get(word.lower())) is not None:
+            return user_word
         if kana := alkana.get_kana(word.lower()):
-            # ユーザー辞書に登録されている場合はユーザー辞書の値を返す
-            for user_dict in self.user_dict_list:
-                if word.lower() == user_dict[0]:
-                    return user_dict[1]
             return kana
         else:
-            if re.fullmatch(r"(?:[A-Z][a-z]{1,}){2,}", word):
-                m = re.match(r"[A-Z][a-z]{1,}", word)
+            if ALKANA_CAMEL_PATTERN.fullmatch(word):
+                m = ALKANA_CAMEL_HEAD_PATTERN.match(word)
                 first = self.word_to_alkana(m.group())
                 second = self.word_to_alkana(word[m.end() :])
                 return first + second
             return word
 
-    def replace_english_to_japanglish(self, text, inference: bool = False) -> str:
+    def replace_english_to_japanglish(self, text: str, inference: bool = False) -> str:
         """ "テキストに含まれている英単語をjapanglishでカタカナに変換して返す。3文字以上の文字数の単語が対象
 
         Args:
@@ -74,14 +148,9 @@ class EnToJp(object):
         Returns:
             str: 変換後のテキスト
         """
-
-        output = ""
-        while word := re.search(r"[a-zA-Z]{3,}", text):
-            output += text[: word.start()] + self.word_to_japanglish(
-                word.group(), inference
-            )
-            text = text[word.end() :]
-        return output + text
+        return JAPANGLISH_WORD_PATTERN.sub(
+            lambda word: self.word_to_japanglish(word.group(), inference), text
+        )
 
     def word_to_japanglish(self, word: str, inference: bool = False) -> str:
         """英単語がカタカナに変換できる場合はjapanglishでカタカナにして返す。3文字以上の文字数の単語が対象
@@ -93,16 +162,59 @@ class EnToJp(object):
         Returns:
             str: 変換後のカタカナ
         """
-        if self.japanglish.convert(word.lower(), inference) is not None:
-            return self.japanglish.convert(word.lower(), inference)
+        if (kana := self.japanglish.convert(word.lower(), inference)) is not None:
+            return kana
         else:
-            if re.fullmatch(r"(?:[A-Z][a-z]{3,}){2,}", word):
-                m = re.match(r"[A-Z][a-z]{3,}", word)
+            if JAPANGLISH_CAMEL_PATTERN.fullmatch(word):
+                m = JAPANGLISH_CAMEL_HEAD_PATTERN.match(word)
                 first = self.word_to_japanglish(m.group())
                 second = self.word_to_japanglish(word[m.end() :])
                 return first + second
             return word
 
+    def word_to_kana(
+        self,
+        word: str,
+        alkana: bool = True,
+        japanglish: bool = True,
+        inference: bool = False,
+    ) -> str:
+        """英単語をカタカナに変換して返す。変換結果はメモに保持し、次回以降は再利用する。
+
+        Args:
+            word (str): 変換対象の英単語
+            alkana (bool, optional): alkanaで変換するかのフラグ。デフォルトはTrue。
+            japanglish (bool, optional): japanglishで変換するかのフラグ。デフォルトはTrue。
+            inference (bool, optional): 変換できない場合に推論変換するかのフラグ。デフォルトはFalse。
+
+        Returns:
+            str: 変換後のカタカナ
+        """
+        key = (word, alkana, japanglish, inference)
+        with self.memo_lock:
+            if (kana := self.memo.get(key)) is not None:
+                self.memo.move_to_end(key)
+                return kana
+        kana = self._word_to_kana(word, alkana, japanglish, inference)
+        with self.memo_lock:
+            self.memo[key] = kana
+            while len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return kana
+
+    def _word_to_kana(
+        self, word: str, alkana: bool, japanglish: bool, inference: bool
+    ) -> str:
+        # ユーザー辞書の値はそのまま使用し、以降の変換は行わない
+        if (user_word := self.user_dict.get(word.lower())) is not None:
+            return user_word
+        if alkana:
+            word = self.word_to_alkana(word)
+        if japanglish:
+            # alkanaで変換しきれなかった部分のみjapanglishで変換する
+            word = self.replace_english_to_japanglish(word, inference)
+        return word
+
     def text_to_kana(
         self,
         text: str,
@@ -111,6 +223,7 @@ class EnToJp(object):
         inference: bool = False,
     ) -> str:
         """テキストに含まれている英単語をカタカナに変換して返す
+        修正辞書の単語・フレーズは最長一致で置換し、残りの英単語は単語ごとに変換する。
 
         Args:
             text (str): 変換対象のテキスト
@@ -121,8 +234,15 @@ class EnToJp(object):
         Returns:
             str: 変換後のテキスト
         """
-        if alkana:
-            text = self.replace_english_to_alkana(text)
-        if japanglish:
-            text = self.replace_english_to_japanglish(text, inference)
-        return text
+        if not alkana and not japanglish:
+            return text
+        self.reload_fix_dict_if_updated()
+        return self.phrase_replacer.replace(
+            text,
+            lambda part: ALKANA_WORD_PATTERN.sub(
+                lambda word: self.word_to_kana(
+                    word.group(), alkana, japanglish, inference
+                ),
+                part,
+            ),
+        )
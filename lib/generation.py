@@ -0,0 +1,387 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from threading import Lock
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# 応答を生成中のスレッドまたはタスクに対応するGenerationHandle
+_current: ContextVar[Optional["GenerationHandle"]] = ContextVar(
+    "generation_handle", default=None
+)
+
+
+def register_stream(stream: Any) -> None:
+    """LLMのプロバイダのストリームを、現在のスレッドで実行中のGenerationHandleに登録する。
+    ChatStreamがストリームを開いた直後に呼び出す。GenerationHandle外で呼ばれた場合は何もしない。
+
+    Args:
+        stream (Any): close()を持つプロバイダのストリーム。
+
+    """
+    handle = _current.get()
+    if handle is not None:
+        handle.attach(stream)
+
+
+def mark_first_token() -> None:
+    """実行中のGenerationHandleに、LLMから最初のトークンを受信した時刻を記録する。
+    ChatStreamがストリームからテキストを受信するたびに呼び出す。GenerationHandle外で呼ばれた場合は何もしない。
+    """
+    handle = _current.get()
+    if handle is not None and handle.first_token_time is None:
+        handle.first_token_time = time.time()
+
+
+async def iterate_in_thread(iterable: Iterable[Any]) -> AsyncIterator[Any]:
+    """同期イテレータの要素を専用のスレッドで取り出して返す。待機中もイベントループを占有しない。
+    スレッドプールを使用しないため、同時に実行する生成の数はワーカー数に制限されない。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stopped = threading.Event()
+
+    def put(item: Optional[Tuple[Any, Optional[BaseException]]]) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # イベントループが終了している
+            stopped.set()
+
+    def run() -> None:
+        try:
+            for item in iterable:
+                if stopped.is_set():
+                    break
+                put((item, None))
+        except BaseException as e:
+            put((None, e))
+        finally:
+            put(None)
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            result = await queue.get()
+            if result is None:
+                return
+            item, error = result
+            if error is not None:
+                raise error
+            yield item
+    finally:
+        stopped.set()
+
+
+def estimate_tokens(text: str) -> int:
+    """テキストのトークン数を概算する。日本語は1文字1トークン、ASCII文字は4文字1トークンとみなす。"""
+    num_ascii = sum(1 for c in text if ord(c) < 128)
+    return len(text) - num_ascii + (num_ascii + 3) // 4
+
+
+class GenerationHandle(object):
+    """
+    gpt_serverの1回の応答生成を表すクラス。
+    cancel()を呼ぶと、生成を中断し、プロバイダのHTTPストリームを閉じる。
+    """
+
+    def __init__(
+        self,
+        generation_id: int,
+        kind: str,
+        sentences: Iterable[str],
+        on_finish: Optional[Callable[["GenerationHandle"], None]] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            generation_id (int): 生成のID。
+            kind (str): 生成の種類("early": 第一声, "final": 最終応答)。先行生成も"final"とする。
+            sentences (Iterable[str]): 応答を文ごとに返すイテレータ。
+            on_finish (Callable[[GenerationHandle], None], optional): 生成の終了時(中断を含む)に呼び出す関数。デフォルトはNone。
+
+        """
+        self.generation_id = generation_id
+        self.kind = kind
+        self.sentences = sentences
+        self.on_finish = on_finish
+        self.start_time = time.time()
+        # LLMから最初のトークンを受信した時刻。トークン単位で受信しない生成ではNoneのまま
+        self.first_token_time: Optional[float] = None
+        self.generated_text = ""
+        self.is_cancelled = False
+        self.is_finished = False
+        self.streams: List[Any] = []
+        self.lock = Lock()
+
+    def attach(self, stream: Any) -> None:
+        """cancel()で閉じるプロバイダのストリームを登録する。"""
+        with self.lock:
+            if not self.is_cancelled:
+                self.streams.append(stream)
+                return
+        # 登録前に中断されていた場合はすぐに閉じる
+        self._close_stream(stream)
+
+    def _close_stream(self, stream: Any) -> None:
+        try:
+            stream.close()
+        except BaseException:
+            # 生成中のジェネレータなど、他スレッドから閉じられないものは中断フラグで止める
+            pass
+
+    def cancel(self) -> None:
+        """生成を中断する。生成を待っているスレッドは、ストリームが閉じられた時点で終了する。"""
+        with self.lock:
+            if self.is_cancelled or self.is_finished:
+                return
+            self.is_cancelled = True
+            streams = self.streams
+            self.streams = []
+        for stream in streams:
+            self._close_stream(stream)
+
+    @property
+    def generated_tokens(self) -> int:
+        """これまでに生成したトークン数の概算。"""
+        return estimate_tokens(self.generated_text)
+
+    def _iterate(self) -> Iterator[str]:
+        """中断されるまで応答の文を返す。実行中のスレッドにこのハンドルを設定し、ストリームを登録できるようにする。"""
+        iterator = iter(self.sentences)
+        try:
+            while not self.is_cancelled:
+                token = _current.set(self)
+                try:
+                    sentence = next(iterator)
+                except StopIteration:
+                    break
+                except BaseException as e:
+                    # ストリームを閉じたことによるエラーは無視する
+                    if self.is_cancelled:
+                        break
+                    raise (e)
+                finally:
+                    _current.reset(token)
+                if self.is_cancelled:
+                    break
+                yield sentence
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except BaseException:
+                    pass
+
+    def _finish(self) -> None:
+        with self.lock:
+            if self.is_finished:
+                return
+            self.is_finished = True
+            streams = self.streams
+            self.streams = []
+        for stream in streams:
+            self._close_stream(stream)
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def __iter__(self) -> Iterator[str]:
+        try:
+            for sentence in self._iterate():
+                self.generated_text += sentence
+                yield sentence
+        finally:
+            self._finish()
+
+
+class AsyncGenerationHandle(GenerationHandle):
+    """
+    asyncioのイベントループ上で応答を生成するGenerationHandle。
+    非同期イテレータ(非同期クライアントのストリーム)はタスクで取り出し、cancel()でタスクを中断してストリームを閉じる。
+    同期イテレータはスレッドで1文ずつ取り出し、イベントループを占有しない。
+    """
+
+    def __init__(
+        self,
+        generation_id: int,
+        kind: str,
+        sentences: Union[AsyncIterable[str], Iterable[str]],
+        on_finish: Optional[Callable[["GenerationHandle"], None]] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            generation_id (int): 生成のID。
+            kind (str): 生成の種類("early": 第一声, "final": 最終応答)。先行生成も"final"とする。
+            sentences (Union[AsyncIterable[str], Iterable[str]]): 応答を文ごとに返すイテレータ。
+            on_finish (Callable[[GenerationHandle], None], optional): 生成の終了時(中断を含む)に呼び出す関数。デフォルトはNone。
+
+        """
+        super().__init__(generation_id, kind, sentences, on_finish=on_finish)  # type: ignore
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional["asyncio.Future[None]"] = None
+
+    def cancel(self) -> None:
+        """生成を中断する。他のスレッドからも呼び出せる。"""
+        super().cancel()
+        if self.loop is not None and self.task is not None:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+
+    async def _produce(self, queue: asyncio.Queue, done: object) -> None:
+        try:
+            if hasattr(self.sentences, "__aiter__"):
+                # タスクごとにコンテキストがコピーされるため、他の生成のハンドルとは混ざらない
+                _current.set(self)
+                async for sentence in self.sentences:  # type: ignore
+                    await queue.put(sentence)
+            else:
+                async for sentence in iterate_in_thread(self._iterate()):
+                    await queue.put(sentence)
+        except asyncio.CancelledError:
+            pass
+        except BaseException as e:
+            if not self.is_cancelled:
+                await queue.put(e)
+        finally:
+            queue.put_nowait(done)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        self.loop = asyncio.get_running_loop()
+        self.task = asyncio.ensure_future(self._produce(queue, done))
+        try:
+            while True:
+                item = await queue.get()
+                if item is done or self.is_cancelled:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                self.generated_text += item
+                yield item
+        except asyncio.CancelledError:
+            # RPCがキャンセルされた場合は、中断した生成として扱う
+            self.cancel()
+            raise
+        finally:
+            if not self.task.done():
+                self.task.cancel()
+            self._finish()
+
+
+class GenerationRegistry(object):
+    """
+    実行中のGenerationHandleを管理し、中断により生成しなかったトークン数を記録するクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.lock = Lock()
+        self.handles: Dict[int, GenerationHandle] = {}
+        self.next_id = 0
+        # 最後まで生成した応答のトークン数。中断した応答の長さの見積もりに使用する
+        self.completed_tokens: Dict[str, List[int]] = {}
+        self.num_cancelled = 0
+        self.avoided_tokens = 0
+
+    def open(self, kind: str, sentences: Iterable[str]) -> GenerationHandle:
+        """生成を登録し、GenerationHandleを返す。
+
+        Args:
+            kind (str): 生成の種類("early": 第一声, "final": 最終応答)。先行生成も"final"とする。
+            sentences (Iterable[str]): 応答を文ごとに返すイテレータ。
+
+        Returns:
+            GenerationHandle: 登録した生成。イテレートすると応答を文ごとに返す。
+
+        """
+        with self.lock:
+            self.next_id += 1
+            handle = GenerationHandle(
+                self.next_id, kind, sentences, on_finish=self._on_finish
+            )
+            self.handles[handle.generation_id] = handle
+        return handle
+
+    def open_async(
+        self, kind: str, sentences: Union[AsyncIterable[str], Iterable[str]]
+    ) -> AsyncGenerationHandle:
+        """asyncioのイベントループ上で生成する応答を登録し、AsyncGenerationHandleを返す。
+
+        Args:
+            kind (str): 生成の種類("early": 第一声, "final": 最終応答)。
+            sentences (Union[AsyncIterable[str], Iterable[str]]): 応答を文ごとに返すイテレータ。
+
+        Returns:
+            AsyncGenerationHandle: 登録した生成。async forで応答を文ごとに返す。
+
+        """
+        with self.lock:
+            self.next_id += 1
+            handle = AsyncGenerationHandle(
+                self.next_id, kind, sentences, on_finish=self._on_finish
+            )
+            self.handles[handle.generation_id] = handle
+        return handle
+
+    def _on_finish(self, handle: GenerationHandle) -> None:
+        with self.lock:
+            self.handles.pop(handle.generation_id, None)
+            if not handle.is_cancelled:
+                completed = self.completed_tokens.setdefault(handle.kind, [])
+                completed.append(handle.generated_tokens)
+                # 直近の応答の長さのみを見積もりに使用する
+                del completed[:-20]
+
+    def estimate_avoided_tokens(self, handle: GenerationHandle) -> int:
+        """中断した生成で、生成せずに済んだトークン数を見積もる。
+        同じ種類の最後まで生成した応答の平均トークン数から、中断までに生成したトークン数を引いた値とする。
+        """
+        with self.lock:
+            completed = self.completed_tokens.get(handle.kind, [])
+            if len(completed) == 0:
+                return 0
+            expected = sum(completed) / len(completed)
+        return max(0, int(expected) - handle.generated_tokens)
+
+    def cancel(self, handle: GenerationHandle) -> int:
+        """生成を中断し、生成せずに済んだトークン数の見積もりを返す。"""
+        if handle.is_cancelled or handle.is_finished:
+            return 0
+        handle.cancel()
+        avoided = self.estimate_avoided_tokens(handle)
+        with self.lock:
+            self.num_cancelled += 1
+            self.avoided_tokens += avoided
+        return avoided
+
+    def cancel_all(self) -> Tuple[int, int]:
+        """実行中の全ての生成を中断する。
+
+        Returns:
+            Tuple[int, int]: 中断した生成の数と、生成せずに済んだトークン数の見積もり。
+
+        """
+        with self.lock:
+            handles = list(self.handles.values())
+        num_cancelled = 0
+        avoided = 0
+        for handle in handles:
+            if handle.is_cancelled or handle.is_finished:
+                continue
+            avoided += self.cancel(handle)
+            num_cancelled += 1
+        return num_cancelled, avoided
@@ -1,22 +1,84 @@
 from __future__ import division
 
 import math
-import struct
 import sys
 import time
 from queue import Queue
-from typing import Any, Generator, Iterable, Optional, Union
+from threading import Event
+from typing import Any, Generator, Iterable, Iterator, Optional, Union
 
-import numpy as np
 import pyaudio
 from google.cloud import speech
 from six.moves import queue  # type: ignore
 
-from .err_handler import ignoreStderr
+from .audio_io import AudioSource, PyAudioSource, RingBuffer
+from .recognizer import RecognitionResult, Recognizer
+from .vad import LevelMeter, NoiseFloorEstimator, PowerThresholdVad, Vad
 
 # Audio recording parameters
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms
+# 1回のストリーミング認識リクエストで送信する音声の最大バイト数(speech v2の上限)
+MAX_REQUEST_BYTES = 15360
+
+
+def responses_to_results(
+    responses: Iterable[Any], check_error: bool = True
+) -> Iterator[RecognitionResult]:
+    """Google Cloud Speech-to-Text APIの応答を認識結果に変換する。
+
+    Args:
+        responses (Iterable[Any]): ストリーミング認識の応答
+        check_error (bool, optional): 応答のエラーを確認し、エラーがあれば終了するかどうか。デフォルトはTrue。
+
+    Yields:
+        RecognitionResult: 認識結果
+    """
+    for response in responses:
+        if check_error and response.error.code:
+            break
+        if not response.results:
+            continue
+        result = response.results[0]
+        if not result.alternatives:
+            continue
+        yield RecognitionResult(
+            result.alternatives[0].transcript, result.is_final, result.stability
+        )
+
+
+class GoogleSpeechRecognizer(Recognizer):
+    """
+    Google Cloud Speech-to-Text API(v1)で音声認識を行うクラス。
+
+    """
+
+    def __init__(self, rate: int = RATE, language_code: str = "ja-JP") -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (int, optional): サンプリングレート。デフォルトは16000。
+            language_code (str, optional): 認識する言語(BCP-47)。デフォルトは"ja-JP"。
+
+        """
+        self.client = speech.SpeechClient()
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=rate,
+            language_code=language_code,
+        )
+        self.streaming_config = speech.StreamingRecognitionConfig(
+            config=config, interim_results=True
+        )
+
+    def streaming_recognize(
+        self, audio: Iterable[bytes]
+    ) -> Iterator[RecognitionResult]:
+        requests = (
+            speech.StreamingRecognizeRequest(audio_content=content) for content in audio
+        )
+        responses = self.client.streaming_recognize(self.streaming_config, requests)
+        return responses_to_results(responses)
 
 
 class MicrophoneStream(object):
@@ -32,6 +94,12 @@ class MicrophoneStream(object):
         _timeout_thresh: float = 0.5,
         _start_timeout_thresh: float = 4.0,
         _db_thresh: float = 55.0,
+        audio_source: Optional[AudioSource] = None,
+        vad: Optional[Vad] = None,
+        pre_roll: float = 0.3,
+        persistent: bool = False,
+        noise_floor_estimator: Optional[NoiseFloorEstimator] = None,
+        recognizer: Optional[Recognizer] = None,
     ) -> None:
         """クラスの初期化メソッド。
 
@@ -41,44 +109,138 @@ class MicrophoneStream(object):
             _timeout_thresh (float): 音声が停止したと判断するタイムアウト閾値（秒）。デフォルトは0.5秒。
             _start_timeout_thresh (float): マイクの入力が開始しないまま終了するまでのタイムアウト閾値（秒）。デフォルトは4.0秒。
             _db_thresh (float): 音声が開始されたと判断する音量閾値（デシベル）。デフォルトは55.0デシベル。
+            audio_source (AudioSource, optional): 音声の入力元。Noneの場合はPyAudioの入力デバイス。
+            vad (Vad, optional): 発話区間の検出方法。Noneの場合は音量閾値で判定する。
+            pre_roll (float, optional): 発話開始前の音声を遡って送信する時間（秒）。0の場合は無効。デフォルトは0.3秒。
+            persistent (bool, optional): Trueの場合、withを抜けても音声入力デバイスを開いたままにし、次の発話で再利用する。close()で閉じる。デフォルトはFalse。
+            noise_floor_estimator (NoiseFloorEstimator, optional): 周囲音量の推定器。指定した場合は推定したノイズフロアから発話判定の音量閾値を随時更新する。デフォルトはNone。
+            recognizer (Recognizer, optional): 音声認識の方法。Noneの場合はGoogle Cloud Speech-to-Text API(v1)を使用する。
 
         """
+        self.init_capture(
+            rate,
+            chunk,
+            _timeout_thresh,
+            _start_timeout_thresh,
+            _db_thresh,
+            audio_source,
+            vad,
+            pre_roll,
+            persistent,
+            noise_floor_estimator,
+        )
+        if recognizer is None:
+            recognizer = GoogleSpeechRecognizer(RATE, "ja-JP")
+        self.recognizer = recognizer
+
+    def init_capture(
+        self,
+        rate: float,
+        chunk: float,
+        _timeout_thresh: float,
+        _start_timeout_thresh: float,
+        _db_thresh: float,
+        audio_source: Optional[AudioSource],
+        vad: Optional[Vad],
+        pre_roll: float,
+        persistent: bool,
+        noise_floor_estimator: Optional[NoiseFloorEstimator] = None,
+    ) -> None:
+        """音声入力と発話区間検出の設定を行う。引数は__init__と同じ。"""
         self._rate = rate
         self._chunk = chunk
+        self.audio_source = (
+            audio_source if audio_source is not None else PyAudioSource()
+        )
         self._buff: Queue[Union[None, bytes]] = queue.Queue()
         self.closed = True
         self.is_start = False
         self.is_start_callback = False
         self.is_finish = False
-        self.timeout_thresh = _timeout_thresh
+        self.persistent = persistent
+        self.is_open = False  # 音声入力デバイスを開いているか
         # マイクの入力が開始しないまま終了するまでのthreshold時間[s]
         self.start_timeout_thresh = _start_timeout_thresh
-        self.db_thresh = _db_thresh
-        language_code = "ja-JP"  # a BCP-47 language tag
-        self.client = speech.SpeechClient()
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=RATE,
-            language_code=language_code,
-        )
-        self.streaming_config = speech.StreamingRecognitionConfig(
-            config=config, interim_results=True
+        if vad is None:
+            vad = PowerThresholdVad(int(rate), _db_thresh, _timeout_thresh, int(chunk))
+        self.vad = vad
+        self.vad_confidence = 0.0  # 直近のVADの発話の確からしさ
+        self.noise_floor_estimator = noise_floor_estimator
+        # 発話開始の判定前の音声を保持するリングバッファ(16bitモノラル)
+        self.pre_roll = pre_roll
+        pre_roll_bytes = int(rate * pre_roll) * 2
+        self.pre_roll_buffer = (
+            RingBuffer(pre_roll_bytes) if pre_roll_bytes > 0 else None
         )
 
+    def store_pre_roll(self, in_data: bytes) -> None:
+        """発話開始前の音声をリングバッファに書き込む。"""
+        if self.pre_roll_buffer is not None:
+            self.pre_roll_buffer.write(in_data)
+
+    def flush_pre_roll(self) -> None:
+        """リングバッファに保持した発話開始前の音声を、認識用のバッファに送る。"""
+        if self.pre_roll_buffer is None or len(self.pre_roll_buffer) == 0:
+            return
+        first, second = self.pre_roll_buffer.latest()
+        # リングバッファは以降の入力で上書きされるため、ここで1回だけコピーする
+        self._buff.put(b"".join((first, second)))
+        self.pre_roll_buffer.clear()
+
+    def track_noise_floor(self, in_data: bytes) -> None:
+        """周囲音量の推定を更新し、発話中でなければ発話判定の音量閾値に反映する。"""
+        if self.noise_floor_estimator is None:
+            return
+        # 発話の途中で閾値が変わると終了判定がぶれるため、発話中は反映しない
+        if self.noise_floor_estimator.update(in_data) and not self.is_start:
+            self.apply_noise_floor()
+
+    def apply_noise_floor(self) -> None:
+        """推定したノイズフロアから求めた音量閾値を発話判定に設定する。"""
+        if self.noise_floor_estimator is None:
+            return
+        threshold = self.noise_floor_estimator.threshold
+        if threshold is not None:
+            self.vad.db_thresh = threshold
+
+    @property
+    def db_thresh(self) -> float:
+        """音声が開始されたと判断する音量閾値[dB]。"""
+        return self.vad.db_thresh
+
+    @db_thresh.setter
+    def db_thresh(self, value: float) -> None:
+        self.vad.db_thresh = value
+
+    @property
+    def timeout_thresh(self) -> float:
+        """音声が停止したと判断するタイムアウト閾値[sec]。"""
+        return self.vad.timeout_thresh
+
+    @timeout_thresh.setter
+    def timeout_thresh(self, value: float) -> None:
+        self.vad.timeout_thresh = value
+
+    def open(self) -> None:
+        """音声入力デバイスを開く。既に開いている場合は何もしない。"""
+        if not self.is_open:
+            self.audio_source.open(self._rate, 1, self._chunk, self._fill_buffer)
+            self.is_open = True
+
+    def close(self) -> None:
+        """音声入力デバイスを閉じる。"""
+        if self.is_open:
+            self.audio_source.close()
+            self.is_open = False
+
     def __enter__(self) -> Any:
-        """PyAudioストリームを開く。"""
-        with ignoreStderr():
-            self._audio_interface = pyaudio.PyAudio()
-            self._audio_stream = self._audio_interface.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=self._rate,
-                input=True,
-                frames_per_buffer=self._chunk,
-                stream_callback=self._fill_buffer,
-            )
-            self.closed = False
-            return self
+        """音声入力ストリームを開き、1回の発話の受付を準備する。"""
+        # 前回の発話の終端(None)が残らないよう、発話ごとにバッファを作り直す
+        self._buff = queue.Queue()
+        self.is_start = False
+        self.open()
+        self.closed = False
+        return self
 
     def __exit__(
         self,
@@ -88,7 +250,7 @@ class MicrophoneStream(object):
         _start_timeout_thresh: float = 4.0,
         _db_thresh: float = 55.0,
     ) -> None:
-        """PyAudioストリームを閉じます。
+        """音声入力ストリームを閉じます。
 
         Args:
             rate (float): サンプリングレート。
@@ -98,15 +260,18 @@ class MicrophoneStream(object):
             _db_thresh (float, optional): 音声が開始されたと判断する音量閾値（デシベル）。デフォルトは55.0デシベル。
 
         """
-        self._audio_stream.stop_stream()
-        self._audio_stream.close()
+        if not self.persistent:
+            self.close()
         self.closed = True
         self._buff.put(None)
-        self._audio_interface.terminate()
         self.is_start_callback = False
 
     def start_callback(self) -> None:
         """開始コールバックを呼び出す。"""
+        self.apply_noise_floor()
+        self.vad.reset()
+        if self.pre_roll_buffer is not None:
+            self.pre_roll_buffer.clear()
         self.is_start_callback = True
 
     def _fill_buffer(
@@ -124,110 +289,133 @@ class MicrophoneStream(object):
             Union[None, Any]: Noneまたは続行のためのフラグ
 
         """
-        if self.is_start_callback:
-            in_data2 = struct.unpack(f"{len(in_data) / 2:.0f}h", in_data)
-            rms = math.sqrt(np.square(in_data2).mean())
-            power = 20 * math.log10(rms) if rms > 0.0 else -math.inf  # RMS to db
-            if power > self.db_thresh:
-                if not self.is_start:
-                    self.is_start = True
-                self.start_time = time.time()
+        self.track_noise_floor(in_data)
+        if self.is_start_callback and not self.closed:
+            vad_result = self.vad.process(in_data)
+            self.vad_confidence = vad_result.confidence
+            if vad_result.speech_started and not self.is_start:
+                self.is_start = True
+                self.flush_pre_roll()
             if self.is_start:
                 self._buff.put(in_data)
-                if time.time() - self.start_time >= self.timeout_thresh:
-                    self.closed = True
+                if vad_result.speech_ended:
+                    self.finish_stream()
             else:
+                self.store_pre_roll(in_data)
                 if time.time() - self.start_time >= self.start_timeout_thresh:
-                    self.closed = True
+                    self.finish_stream()
         return None, pyaudio.paContinue
 
+    def finish_stream(self) -> None:
+        """発話の終了を通知し、音声認識のストリームをすぐに終了させる。"""
+        self.closed = True
+        self._buff.put(None)
+
     def generator(self) -> Union[None, Generator[Any, None, None]]:
         """bufferから音声データを生成するジェネレーター
+        音声データが届くまでブロックして待ち、溜まっているデータはMAX_REQUEST_BYTES以下にまとめて返す。
+        Noneを受け取った時点で終了する。
 
         Yields:
             Union[None, Any]: 音声データ
         """
-        while not self.closed:
-            try:
-                chunk = self._buff.get(block=False, timeout=0.01)
+        buff = self._buff
+        pending = None  # サイズ上限のため次回に送るデータ
+        while True:
+            chunk = pending if pending is not None else buff.get()
+            pending = None
+            if chunk is None:
+                return
+            data = [chunk]
+            size = len(chunk)
+            is_end = False
+            while size < MAX_REQUEST_BYTES:
+                try:
+                    chunk = buff.get(block=False)
+                except queue.Empty:
+                    break
                 if chunk is None:
-                    return
-                data = [chunk]
-                while True:
-                    try:
-                        chunk = self._buff.get(block=False)
-                        if chunk is None:
-                            return
-                        data.append(chunk)
-                    except queue.Empty:
-                        break
-                yield b"".join(data)
-            except queue.Empty:
-                time.sleep(0.01)
-                continue
+                    is_end = True
+                    break
+                if size + len(chunk) > MAX_REQUEST_BYTES:
+                    pending = chunk
+                    break
+                data.append(chunk)
+                size += len(chunk)
+            audio = data[0] if len(data) == 1 else b"".join(data)
+            for start in range(0, len(audio), MAX_REQUEST_BYTES):
+                yield audio[start : start + MAX_REQUEST_BYTES]
+            if is_end:
+                return
 
     def transcribe(
         self,
-    ) -> Optional[Iterable[speech.StreamingRecognizeResponse]]:
-        """ストリームからの音声をGoogle Cloud Speech-to-Text APIでテキストに変換する。
+    ) -> Optional[Iterable[RecognitionResult]]:
+        """ストリームからの音声をrecognizerでテキストに変換する。
 
         Returns:
-            Optional[Iterable[speech.StreamingRecognizeResponse]]: ストリーミング認識の応答
+            Optional[Iterable[RecognitionResult]]: ストリーミング認識の結果
         """
         audio_generator = self.generator()
         self.start_time = time.time()
         self.start_callback()
-        responses = None
-        requests = (
-            speech.StreamingRecognizeRequest(audio_content=content)
-            for content in audio_generator
-        )
+        results = None
         try:
-            responses = self.client.streaming_recognize(self.streaming_config, requests)
+            results = self.recognizer.streaming_recognize(audio_generator)
         except BaseException:
             pass
-        return responses
+        return results
 
 
-def get_db_thresh() -> float:
+def get_db_thresh(
+    audio_source: Optional[AudioSource] = None, timeout: float = 5.0
+) -> float:
     """マイクからの周囲音量を測定。
 
+    Args:
+        audio_source (AudioSource, optional): 音声の入力元。Noneの場合はPyAudioの入力デバイス。
+        timeout (float, optional): 測定に使う音声を待つ最大時間[sec]。超えた場合はそれまでの音声で測定する。デフォルトは5.0。
+
     Returns:
         float: 測定された音量[db]
     """
-    with ignoreStderr():
-        p = pyaudio.PyAudio()
-        stream = p.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=RATE,
-            input=True,
-            frames_per_buffer=CHUNK,
-        )
-        frames = []
-        print("Measuring Ambient Sound Levels…")
-        for _ in range(int(RATE / CHUNK * 2)):
-            data = stream.read(CHUNK)
-            frames.append(data)
-        audio_data = np.frombuffer(b"".join(frames), dtype=np.int16)
-        rms2 = np.square(audio_data).mean()
-        if rms2 > 0.0:
-            rms = math.sqrt(np.square(audio_data).mean())
-            power = 20 * math.log10(rms) if rms > 0.0 else -math.inf  # RMS to db
-        else:
-            power = 20
-        print(f"Sound Levels: {power:.3f}db")
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+    if audio_source is None:
+        audio_source = PyAudioSource()
+    frames = []
+    num_chunks = int(RATE / CHUNK * 2)
+    finished = Event()
+
+    def callback(
+        in_data: bytes, frame_count: int, time_info: Any, status_flags: Any
+    ) -> Union[None, Any]:
+        frames.append(in_data)
+        if len(frames) >= num_chunks:
+            finished.set()
+            return None, pyaudio.paComplete
+        return None, pyaudio.paContinue
+
+    print("Measuring Ambient Sound Levels…")
+    audio_source.open(RATE, 1, CHUNK, callback)
+    if not finished.wait(timeout):
+        print(f"Audio input did not arrive in {timeout:.1f}s")
+    audio_source.close()
+    audio_data = b"".join(frames[:num_chunks])
+    power = -math.inf
+    if len(audio_data) >= 2:
+        level_meter = LevelMeter(len(audio_data) // 2)
+        power = level_meter.power_db(audio_data)
+    # 音声が届かなかった、もしくは無音の場合はデフォルトの値とする
+    if power == -math.inf:
+        power = 20
+    print(f"Sound Levels: {power:.3f}db")
     return power
 
 
-def listen_print_loop(responses: object) -> str:
-    """Google Cloud Speech-to-Text APIの応答からテキストを取得し、リアルタイムで出力。
+def listen_print_loop(results: Iterable[RecognitionResult]) -> str:
+    """ストリーミング認識の結果からテキストを取得し、リアルタイムで出力。
 
     Args:
-        responses (Any): ストリーミング認識の応答
+        results (Iterable[RecognitionResult]): ストリーミング認識の結果
 
     Returns:
         str: 認識されたテキスト
@@ -236,15 +424,8 @@ def listen_print_loop(responses: object) -> str:
     num_chars_printed = 0
     transcript = ""
     overwrite_chars = ""
-    for response in responses:
-        if response.error.code:
-            break
-        if not response.results:
-            continue
-        result = response.results[0]
-        if not result.alternatives:
-            continue
-        transcript = result.alternatives[0].transcript
+    for result in results:
+        transcript = result.transcript
         overwrite_chars = " " * (num_chars_printed - len(transcript))
         if not result.is_final:
             sys.stdout.write(transcript + overwrite_chars + "\r")
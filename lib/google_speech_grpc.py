@@ -1,17 +1,29 @@
 from __future__ import division
 
-import math
 import os
-import struct
 import sys
 import time
-from typing import Any, Optional, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Iterable, Optional, Union
 
 import grpc
-import numpy as np
 import pyaudio
 
+from .audio_io import AudioSource
+from .dispatch_policy import DISPATCH_EARLY, DISPATCH_SPECULATE, DispatchPolicy
 from .google_speech import MicrophoneStream
+from .grpc_channel import get_channel
+from .metrics import counter, histogram
+from .recognizer import RecognitionResult, Recognizer
+from .tracing import (
+    Trace,
+    current_trace,
+    end_speech,
+    get_tracer,
+    start_trace,
+    trace_metadata,
+)
+from .vad import NoiseFloorEstimator, Vad
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
 import gpt_server_pb2
@@ -21,6 +33,18 @@ import motion_server_pb2_grpc
 import voice_server_pb2
 import voice_server_pb2_grpc
 
+STT_SESSIONS = counter(
+    "stt_sessions_total",
+    "Number of recognized utterances by how the recognition ended",
+    ["outcome"],
+)
+STT_FINAL_SECONDS = histogram(
+    "stt_final_seconds", "Time from the end of speech detected by VAD to final result"
+)
+GPT_DISPATCHES = counter(
+    "stt_gpt_dispatches_total", "Number of transcripts sent to gpt server", ["kind"]
+)
+
 
 class MicrophoneStreamGrpc(MicrophoneStream):
     """
@@ -41,6 +65,13 @@ class MicrophoneStreamGrpc(MicrophoneStream):
         voice_port: str = "10002",
         motion_server_host: Optional[str] = "127.0.0.1",
         motion_server_port: Optional[str] = "50055",
+        audio_source: Optional[AudioSource] = None,
+        vad: Optional[Vad] = None,
+        pre_roll: float = 0.3,
+        persistent: bool = False,
+        noise_floor_estimator: Optional[NoiseFloorEstimator] = None,
+        recognizer: Optional[Recognizer] = None,
+        session_id: Optional[str] = None,
     ) -> None:
         """クラスの初期化メソッド。
 
@@ -55,6 +86,13 @@ class MicrophoneStreamGrpc(MicrophoneStream):
             voice_port (str, optional): VoiceVoxサーバーのポート番号。デフォルトは"10002"。
             motion_server_host (str, optional): モーションサーバーのIPアドレス。デフォルトは"127.0.0.1"。
             motion_server_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            audio_source (AudioSource, optional): 音声の入力元。Noneの場合はPyAudioの入力デバイス。
+            vad (Vad, optional): 発話区間の検出方法。Noneの場合は音量閾値で判定する。
+            pre_roll (float, optional): 発話開始前の音声を遡って送信する時間（秒）。0の場合は無効。デフォルトは0.3秒。
+            persistent (bool, optional): Trueの場合、withを抜けても音声入力デバイスを開いたままにし、次の発話で再利用する。close()で閉じる。デフォルトはFalse。
+            noise_floor_estimator (NoiseFloorEstimator, optional): 周囲音量の推定器。指定した場合は推定したノイズフロアから発話判定の音量閾値を随時更新する。デフォルトはNone。
+            recognizer (Recognizer, optional): 音声認識の方法。Noneの場合はGoogle Cloud Speech-to-Text API(v1)を使用する。
+            session_id (str, optional): gpt_serverのセッションID。Noneの場合はデフォルトのセッションを使用する。
         """
         super().__init__(
             rate=rate,
@@ -62,15 +100,23 @@ class MicrophoneStreamGrpc(MicrophoneStream):
             _timeout_thresh=_timeout_thresh,
             _start_timeout_thresh=_start_timeout_thresh,
             _db_thresh=_db_thresh,
+            audio_source=audio_source,
+            vad=vad,
+            pre_roll=pre_roll,
+            persistent=persistent,
+            noise_floor_estimator=noise_floor_estimator,
+            recognizer=recognizer,
         )
-        gpt_channel = grpc.insecure_channel(gpt_host + ":" + gpt_port)
+        gpt_channel = get_channel(gpt_host + ":" + gpt_port)
         self.gpt_stub = gpt_server_pb2_grpc.GptServerServiceStub(gpt_channel)
-        voice_channel = grpc.insecure_channel(voice_host + ":" + voice_port)
+        voice_channel = get_channel(voice_host + ":" + voice_port)
         self.voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+        self.session_id = session_id
         self.motion_stub = None
         if motion_server_host is not None and motion_server_port is not None:
-            motion_channel = grpc.insecure_channel(
-                motion_server_host + ":" + motion_server_port
+            motion_channel = get_channel(
+                motion_server_host + ":" + motion_server_port,
+                keepalive_without_calls=False,
             )
             self.motion_stub = motion_server_pb2_grpc.MotionServerServiceStub(
                 motion_channel
@@ -84,7 +130,7 @@ class MicrophoneStreamGrpc(MicrophoneStream):
         _start_timeout_thresh: float = 4.0,
         _db_thresh: float = 55.0,
     ) -> None:
-        """PyAudioストリームを閉じます。
+        """音声入力ストリームを閉じます。
 
         Args:
             rate (float): サンプリングレート。
@@ -98,7 +144,9 @@ class MicrophoneStreamGrpc(MicrophoneStream):
             rate, chunk, _timeout_thresh, _start_timeout_thresh, _db_thresh
         )
         try:
-            self.gpt_stub.SendMotion(gpt_server_pb2.SendMotionRequest())
+            self.gpt_stub.SendMotion(
+                gpt_server_pb2.SendMotionRequest(session_id=self.session_id)
+            )
         except BaseException:
             print("Send motion error")
             pass
@@ -118,42 +166,49 @@ class MicrophoneStreamGrpc(MicrophoneStream):
             Union[None, Any]: Noneまたは続行のためのフラグ
 
         """
-        if self.is_start_callback:
-            in_data2 = struct.unpack(f"{len(in_data) / 2:.0f}h", in_data)
-            rms = math.sqrt(np.square(in_data2).mean())
-            power = 20 * math.log10(rms) if rms > 0.0 else -math.inf  # RMS to db
-            if power > self.db_thresh:
-                if not self.is_start:
-                    self.is_start = True
-                    if self.motion_stub is not None:
-                        try:
-                            self.motion_stub.SetMotion(
-                                motion_server_pb2.SetMotionRequest(
-                                    name="nod", priority=3, repeat=True
-                                )
+        self.track_noise_floor(in_data)
+        if self.is_start_callback and not self.closed:
+            vad_result = self.vad.process(in_data)
+            self.vad_confidence = vad_result.confidence
+            if vad_result.speech_started and not self.is_start:
+                self.is_start = True
+                start_trace()
+                self.flush_pre_roll()
+                if self.motion_stub is not None:
+                    try:
+                        self.motion_stub.SetMotion(
+                            motion_server_pb2.SetMotionRequest(
+                                name="nod", priority=3, repeat=True
                             )
-                        except BaseException:
-                            pass
-                self.start_time = time.time()
+                        )
+                    except BaseException:
+                        pass
             if self.is_start:
                 self._buff.put(in_data)
-                if time.time() - self.start_time >= self.timeout_thresh:
+                if vad_result.speech_ended:
                     self.is_start = False
-                    self.closed = True
+                    self.finish_stream()
+                    trace_id = end_speech()
                     try:
                         self.voice_stub.EnableVoicePlay(
-                            voice_server_pb2.EnableVoicePlayRequest()
+                            voice_server_pb2.EnableVoicePlayRequest(),
+                            metadata=trace_metadata(trace_id),
                         )
                     except BaseException:
                         print("EnableVoicePlay error")
                         pass
+                    # 音声入力デバイスを開いたままにする場合は、入力を止めずに次の発話を待つ
+                    if self.persistent:
+                        return None, pyaudio.paContinue
                     return None, pyaudio.paComplete
+            else:
+                self.store_pre_roll(in_data)
         return None, pyaudio.paContinue
 
 
 class GoogleSpeechGrpc(object):
     """
-    Google Speech-to-Text APIのレスポンスを処理するクラス。
+    音声認識の結果を処理し、gpt_serverに送信するクラス。
 
     """
 
@@ -163,6 +218,11 @@ class GoogleSpeechGrpc(object):
         gpt_port: str = "10001",
         voice_host: str = "127.0.0.1",
         voice_port: str = "10002",
+        dispatch_policy: Optional[DispatchPolicy] = None,
+        stream_gpt: bool = True,
+        session_id: Optional[str] = None,
+        session_voice_address: Optional[str] = None,
+        session_motion_address: Optional[str] = None,
     ) -> None:
         """GoogleSpeechGrpcオブジェクトを初期化する。
 
@@ -171,27 +231,126 @@ class GoogleSpeechGrpc(object):
             gpt_port (str, optional): GPTサーバーのポート番号。デフォルトは"10001"。
             voice_host (str, optional): VoiceVoxサーバーのホスト名。デフォルトは"127.0.0.1"。
             voice_port (str, optional): VoiceVoxサーバーのポート番号。デフォルトは"10002"。
+            dispatch_policy (DispatchPolicy, optional): 途中結果をgpt_serverに送る判定方法。Noneの場合はlisten_publisher_grpcのprogress_report_lenから作成する。
+            stream_gpt (bool, optional): StreamGptで応答の文とモーションを逐次受け取るかどうか。gpt_serverがStreamGptを持たない場合はSetGptを使用する。デフォルトはTrue。
+            session_id (str, optional): gpt_serverのセッションID。複数のロボットで1つのgpt_serverを共有する場合に、ロボットごとに指定する。Noneの場合はデフォルトのセッションを使用する。
+            session_voice_address (str, optional): gpt_serverから見たこのロボットのvoice_serverのアドレス("host:port")。Noneの場合はgpt_serverのデフォルト。
+            session_motion_address (str, optional): gpt_serverから見たこのロボットのモーションサーバーのアドレス("host:port")。Noneの場合はgpt_serverのデフォルト。
         """
+        self.dispatch_policy = dispatch_policy
+        self.stream_gpt = stream_gpt
+        self.session_id = session_id
+        self.session_voice_address = session_voice_address
+        self.session_motion_address = session_motion_address
 
-        gpt_channel = grpc.insecure_channel(gpt_host + ":" + gpt_port)
+        gpt_channel = get_channel(gpt_host + ":" + gpt_port)
         self.gpt_stub = gpt_server_pb2_grpc.GptServerServiceStub(gpt_channel)
-        voice_channel = grpc.insecure_channel(voice_host + ":" + voice_port)
+        voice_channel = get_channel(voice_host + ":" + voice_port)
         self.voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+        # StreamGptの応答は、認識結果の処理を止めないようにワーカースレッドで受け取る。
+        # 第一声と最終応答の順番が入れ替わらないよう、送信は1つのスレッドで順番に行う
+        self.gpt_executor = ThreadPoolExecutor(max_workers=1)
+
+    def send_gpt(
+        self,
+        text: str,
+        is_finish: bool,
+        is_speculative: bool = False,
+        trace_id: Optional[str] = None,
+    ) -> "Future[None]":
+        """gpt_serverに音声認識の結果を送信する。応答の受信はワーカースレッドで行い、すぐに返る。
+
+        Args:
+            text (str): 音声認識の結果。
+            is_finish (bool): 最終結果かどうか。Falseの場合、gpt_serverは第一声を生成する。
+            is_speculative (bool, optional): Trueの場合、gpt_serverは最終応答の先行生成を開始する。デフォルトはFalse。
+            trace_id (Optional[str], optional): メタデータで送る発話のトレースID。デフォルトはNone。
+
+        Returns:
+            Future[None]: gpt_serverの応答を受信し終えると完了するFuture。
+
+        """
+        request = gpt_server_pb2.SetGptRequest(
+            text=text,
+            is_finish=is_finish,
+            is_speculative=is_speculative,
+            session_id=self.session_id,
+            voice_address=self.session_voice_address,
+            motion_address=self.session_motion_address,
+        )
+        if is_finish:
+            GPT_DISPATCHES.inc(kind="final")
+        else:
+            GPT_DISPATCHES.inc(kind="speculate" if is_speculative else "early")
+        return self.gpt_executor.submit(
+            self._receive_gpt, request, trace_metadata(trace_id)
+        )
+
+    def _receive_gpt(
+        self, request: gpt_server_pb2.SetGptRequest, metadata: Any
+    ) -> None:
+        """gpt_serverにリクエストを送信し、応答の完了まで受信する。"""
+        if self.stream_gpt:
+            try:
+                for reply in self.gpt_stub.StreamGpt(request, metadata=metadata):
+                    if reply.motion != "":
+                        print(f"Reserved motion: {reply.motion}")
+                return
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    print("StreamGpt error:", e)
+                    return
+                # StreamGptを持たない古いgpt_serverにはSetGptで送る
+                print("StreamGpt is not implemented on gpt server. Use SetGpt.")
+                self.stream_gpt = False
+            except BaseException as e:
+                print("StreamGpt error:", e)
+                return
+        try:
+            self.gpt_stub.SetGpt(request, metadata=metadata)
+        except BaseException as e:
+            print("SetGpt error:", e)
+
+    def interrupt_gpt(self) -> None:
+        """gpt_serverで生成中の応答を中断する。"""
+        try:
+            reply = self.gpt_stub.InterruptGpt(
+                gpt_server_pb2.InterruptGptRequest(session_id=self.session_id)
+            )
+            if reply.num_cancelled > 0:
+                print(
+                    f"Interrupted {reply.num_cancelled} generation(s), "
+                    f"avoided about {reply.avoided_tokens} tokens"
+                )
+        except BaseException as e:
+            print("InterruptGpt error:", e)
+
+    def interrupt(self) -> None:
+        """gpt_serverの応答生成と、voice_serverの再生待ちの音声を中断する。"""
+        self.interrupt_gpt()
+        try:
+            self.voice_stub.InterruptVoice(voice_server_pb2.InterruptVoiceRequest())
+        except BaseException:
+            print("InterruptVoice error")
+            pass
 
     def listen_publisher_grpc(
-        self, responses: Any, progress_report_len: int = 0
+        self, results: Iterable[RecognitionResult], progress_report_len: int = 0
     ) -> str:
         """
-        Google Cloud Speech-to-Text APIの応答からテキストを取得し、リアルタイムで出力。
+        ストリーミング認識の結果からテキストを取得し、リアルタイムで出力。
 
         Args:
-            responses (Any): ストリーミング認識の応答
-            progress_report_len (int, optional): ここで指定した文字数以上になると、その時点で一度GPTに結果を送信する。0の場合は途中での送信は無効となる。デフォルトは0。
+            results (Iterable[RecognitionResult]): ストリーミング認識の結果
+            progress_report_len (int, optional): ここで指定した文字数以上になると、その時点で一度GPTに結果を送信する。0の場合は途中での送信は無効となる。dispatch_policyを指定している場合は使用しない。デフォルトは0。
 
         Returns:
             str: 認識されたテキスト
         """
-        is_progress_report = False
+        policy = self.dispatch_policy
+        if policy is None:
+            policy = DispatchPolicy(early_min_chars=progress_report_len)
+        policy.reset()
         num_chars_printed = 0
         transcript = ""
         overwrite_chars = ""
@@ -205,55 +364,62 @@ class GoogleSpeechGrpc(object):
         except BaseException:
             print("InterruptVoice error")
             pass
-        for response in responses:
-            if response.error.code:
-                break
-            if not response.results:
-                continue
-            result = response.results[0]
-            if not result.alternatives:
-                continue
-            transcript = result.alternatives[0].transcript
-            overwrite_chars = " " * (num_chars_printed - len(transcript))
-            if not result.is_final:
-                sys.stdout.write(transcript + overwrite_chars + "\r")
-                sys.stdout.flush()
-                num_chars_printed = len(transcript)
-                if not is_progress_report and num_chars_printed > progress_report_len:
-                    if progress_report_len > 0:
-                        try:
-                            self.gpt_stub.SetGpt(
-                                gpt_server_pb2.SetGptRequest(
-                                    text=transcript + overwrite_chars, is_finish=False
-                                )
-                            )
-                        except BaseException as e:
-                            print("SetGpt error:", e)
-                            pass
-                        is_progress_report = True
-            else:
-                if progress_report_len > 0:
-                    if (
-                        not is_progress_report
-                        and num_chars_printed > progress_report_len
-                    ):
-                        try:
-                            self.gpt_stub.SetGpt(
-                                gpt_server_pb2.SetGptRequest(
-                                    text=transcript + overwrite_chars, is_finish=False
-                                )
-                            )
-                        except BaseException as e:
-                            print("SetGpt error:", e)
-                            pass
-                break
+        is_first = True
+        trace: Optional[Trace] = None
+        trace_id: Optional[str] = None
+        is_final = False
         try:
-            self.gpt_stub.SetGpt(
-                gpt_server_pb2.SetGptRequest(
-                    text=transcript + overwrite_chars, is_finish=True
-                )
+            for result in results:
+                if is_first:
+                    # 新しい発話が始まったら、前の発話に対する応答の生成を中断する
+                    self.interrupt_gpt()
+                    is_first = False
+                    # 認識結果はVADが発話の開始を検出した後に届くため、この時点のトレースをこの発話のトレースとする
+                    trace = current_trace()
+                    if trace is not None:
+                        trace_id = trace.trace_id
+                transcript = result.transcript
+                overwrite_chars = " " * (num_chars_printed - len(transcript))
+                decisions = policy.update(result)
+                if not result.is_final:
+                    sys.stdout.write(transcript + overwrite_chars + "\r")
+                    sys.stdout.flush()
+                    num_chars_printed = len(transcript)
+                if DISPATCH_EARLY in decisions:
+                    self.send_gpt(
+                        transcript + overwrite_chars, is_finish=False, trace_id=trace_id
+                    )
+                if DISPATCH_SPECULATE in decisions:
+                    self.send_gpt(
+                        transcript,
+                        is_finish=False,
+                        is_speculative=True,
+                        trace_id=trace_id,
+                    )
+                if result.is_final:
+                    is_final = True
+                    break
+        except BaseException:
+            STT_SESSIONS.inc(outcome="error")
+            raise
+        if is_first:
+            STT_SESSIONS.inc(outcome="no_result")
+        else:
+            STT_SESSIONS.inc(outcome="final" if is_final else "partial")
+        if trace is not None:
+            # VADの発話終了から最終結果までの時間。最終結果が先に届いた場合は時点として記録する
+            final_time = time.time()
+            if "vad_end" in trace.marks:
+                STT_FINAL_SECONDS.observe(max(final_time - trace.marks["vad_end"], 0.0))
+            get_tracer().record(
+                trace_id,
+                "stt_final",
+                min(trace.marks.get("vad_end", final_time), final_time),
+                final_time,
+                chars=len(transcript),
             )
-        except BaseException as e:
-            print("SetGpt error:", e)
-            pass
+        # 最終応答の生成が終わるまで待ち、次の発話の認識開始(再生の停止)で応答を止めないようにする
+        self.send_gpt(
+            transcript + overwrite_chars, is_finish=True, trace_id=trace_id
+        ).result()
         return transcript + overwrite_chars
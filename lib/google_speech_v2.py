@@ -1,72 +1,52 @@
 from __future__ import division
 
-import math
-import sys
-import time
-from queue import Queue
-from typing import Iterable, Optional, Union
-
-import numpy as np
-import pyaudio
+from typing import Any, Iterable, Iterator, Optional
 
 # from google.cloud import speech
 from google.cloud.speech_v2 import SpeechClient
 from google.cloud.speech_v2.types import cloud_speech as cloud_speech_types
-from six.moves import queue  # type: ignore
 
+from .audio_io import AudioSource
 from .conf import GOOGLE_SPEECH_PROJECT_ID
-from .err_handler import ignoreStderr
-from .google_speech import MicrophoneStream
+from .google_speech import (  # noqa: F401
+    MicrophoneStream,
+    get_db_thresh,
+    listen_print_loop,
+    responses_to_results,
+)
+from .recognizer import RecognitionResult, Recognizer
+from .vad import NoiseFloorEstimator, Vad
 
 # Audio recording parameters
 RATE = 16000
 CHUNK = int(RATE / 10)  # 100ms
 
 
-class MicrophoneStreamV2(MicrophoneStream):
+class GoogleSpeechV2Recognizer(Recognizer):
     """
-    マイクから音声をストリーミングするためのクラス。google STT v2用。
+    Google Cloud Speech-to-Text API(v2)で音声認識を行うクラス。
 
     """
 
-    def __init__(
-        self,
-        rate: float,
-        chunk: float,
-        _timeout_thresh: float = 0.5,
-        _start_timeout_thresh: float = 4.0,
-        _db_thresh: float = 55.0,
-    ) -> None:
+    def __init__(self, rate: int = RATE, language_code: str = "ja-JP") -> None:
         """クラスの初期化メソッド。
 
         Args:
-            rate (float): サンプリングレート。
-            chunk (float): チャンクサイズ。
-            _timeout_thresh (float): 音声が停止したと判断するタイムアウト閾値（秒）。デフォルトは0.5秒。
-            _start_timeout_thresh (float): マイクの入力が開始しないまま終了するまでのタイムアウト閾値（秒）。デフォルトは4.0秒。
-            _db_thresh (float): 音声が開始されたと判断する音量閾値（デシベル）。デフォルトは55.0デシベル。
+            rate (int, optional): サンプリングレート。デフォルトは16000。
+            language_code (str, optional): 認識する言語(BCP-47)。デフォルトは"ja-JP"。
+
+        Raises:
+            ValueError: GOOGLE_SPEECH_PROJECT_IDが設定されていない場合。
 
         """
-        self._rate = rate
-        self._chunk = chunk
-        self._buff: Queue[Union[None, bytes]] = queue.Queue()
-        self.closed = True
-        self.is_start = False
-        self.is_start_callback = False
-        self.is_finish = False
-        self.timeout_thresh = _timeout_thresh
-        # マイクの入力が開始しないまま終了するまでのthreshold時間[s]
-        self.start_timeout_thresh = _start_timeout_thresh
-        self.db_thresh = _db_thresh
-        language_codes = ["ja-JP"]  # a BCP-47 language tag
         self.client = SpeechClient()
         recognition_config = cloud_speech_types.RecognitionConfig(
             explicit_decoding_config=cloud_speech_types.ExplicitDecodingConfig(
-                sample_rate_hertz=RATE,
+                sample_rate_hertz=rate,
                 encoding=cloud_speech_types.ExplicitDecodingConfig.AudioEncoding.LINEAR16,
                 audio_channel_count=1,
             ),
-            language_codes=language_codes,
+            language_codes=[language_code],
             model="long",
         )
         streaming_config = cloud_speech_types.StreamingRecognitionConfig(
@@ -83,95 +63,71 @@ class MicrophoneStreamV2(MicrophoneStream):
         )
 
     def requests(
-        self, config: cloud_speech_types.RecognitionConfig, audio: list
-    ) -> list:
+        self,
+        config: cloud_speech_types.StreamingRecognizeRequest,
+        audio: Iterable[bytes],
+    ) -> Iterator[Any]:
         yield config
         for chunk in audio:
             yield cloud_speech_types.StreamingRecognizeRequest(audio=chunk)
 
-    def transcribe(
-        self,
-    ) -> Optional[Iterable[cloud_speech_types.StreamingRecognizeResponse]]:
-        """ストリームからの音声をGoogle Cloud Speech-to-Text APIでテキストに変換する。
+    def streaming_recognize(
+        self, audio: Iterable[bytes]
+    ) -> Iterator[RecognitionResult]:
+        responses = self.client.streaming_recognize(
+            requests=self.requests(self.config_request, audio)
+        )
+        return responses_to_results(responses, check_error=False)
 
-        Returns:
-            Optional[Iterable[speech.StreamingRecognizeResponse]]: ストリーミング認識の応答
-        """
-        audio_generator = self.generator()
-        self.start_time = time.time()
-        self.start_callback()
-        responses = None
-        try:
-            responses = self.client.streaming_recognize(
-                requests=self.requests(self.config_request, audio_generator)
-            )
-        except BaseException:
-            pass
-        return responses
-
-
-def get_db_thresh() -> float:
-    """マイクからの周囲音量を測定。
-
-    Returns:
-        float: 測定された音量[db]
+
+class MicrophoneStreamV2(MicrophoneStream):
     """
-    with ignoreStderr():
-        p = pyaudio.PyAudio()
-        stream = p.open(
-            format=pyaudio.paInt16,
-            channels=1,
-            rate=RATE,
-            input=True,
-            frames_per_buffer=CHUNK,
-        )
-        frames = []
-        print("Measuring Ambient Sound Levels…")
-        for _ in range(int(RATE / CHUNK * 2)):
-            data = stream.read(CHUNK)
-            frames.append(data)
-        audio_data = np.frombuffer(b"".join(frames), dtype=np.int16)
-        rms2 = np.square(audio_data).mean()
-        if rms2 > 0.0:
-            rms = math.sqrt(np.square(audio_data).mean())
-            power = 20 * math.log10(rms) if rms > 0.0 else -math.inf  # RMS to db
-        else:
-            power = 20
-        print(f"Sound Levels: {power:.3f}db")
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
-    return power
-
-
-def listen_print_loop(responses: object) -> str:
-    """Google Cloud Speech-to-Text APIの応答からテキストを取得し、リアルタイムで出力。
-
-    Args:
-        responses (Any): ストリーミング認識の応答
-
-    Returns:
-        str: 認識されたテキスト
+    マイクから音声をストリーミングするためのクラス。google STT v2用。
 
     """
-    num_chars_printed = 0
-    transcript = ""
-    overwrite_chars = ""
-    for response in responses:
-        # if response.error.code:
-        #    break
-        if not response.results:
-            continue
-        result = response.results[0]
-        if not result.alternatives:
-            continue
-        transcript = result.alternatives[0].transcript
-        overwrite_chars = " " * (num_chars_printed - len(transcript))
-        if not result.is_final:
-            sys.stdout.write(transcript + overwrite_chars + "\r")
-            sys.stdout.flush()
-            num_chars_printed = len(transcript)
-        else:
-            print(transcript + overwrite_chars)
-            break
-    return transcript + overwrite_chars
+
+    def __init__(
+        self,
+        rate: float,
+        chunk: float,
+        _timeout_thresh: float = 0.5,
+        _start_timeout_thresh: float = 4.0,
+        _db_thresh: float = 55.0,
+        audio_source: Optional[AudioSource] = None,
+        vad: Optional[Vad] = None,
+        pre_roll: float = 0.3,
+        persistent: bool = False,
+        noise_floor_estimator: Optional[NoiseFloorEstimator] = None,
+        recognizer: Optional[Recognizer] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (float): サンプリングレート。
+            chunk (float): チャンクサイズ。
+            _timeout_thresh (float): 音声が停止したと判断するタイムアウト閾値（秒）。デフォルトは0.5秒。
+            _start_timeout_thresh (float): マイクの入力が開始しないまま終了するまでのタイムアウト閾値（秒）。デフォルトは4.0秒。
+            _db_thresh (float): 音声が開始されたと判断する音量閾値（デシベル）。デフォルトは55.0デシベル。
+            audio_source (AudioSource, optional): 音声の入力元。Noneの場合はPyAudioの入力デバイス。
+            vad (Vad, optional): 発話区間の検出方法。Noneの場合は音量閾値で判定する。
+            pre_roll (float, optional): 発話開始前の音声を遡って送信する時間（秒）。0の場合は無効。デフォルトは0.3秒。
+            persistent (bool, optional): Trueの場合、withを抜けても音声入力デバイスを開いたままにし、次の発話で再利用する。close()で閉じる。デフォルトはFalse。
+            noise_floor_estimator (NoiseFloorEstimator, optional): 周囲音量の推定器。指定した場合は推定したノイズフロアから発話判定の音量閾値を随時更新する。デフォルトはNone。
+            recognizer (Recognizer, optional): 音声認識の方法。Noneの場合はGoogle Cloud Speech-to-Text API(v2)を使用する。
+
+        """
+        self.init_capture(
+            rate,
+            chunk,
+            _timeout_thresh,
+            _start_timeout_thresh,
+            _db_thresh,
+            audio_source,
+            vad,
+            pre_roll,
+            persistent,
+            noise_floor_estimator,
+        )
+        if recognizer is None:
+            recognizer = GoogleSpeechV2Recognizer(RATE, "ja-JP")
+        self.recognizer = recognizer
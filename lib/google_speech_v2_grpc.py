@@ -1,17 +1,18 @@
 from __future__ import division
 
-import math
 import os
-import struct
 import sys
-import time
 from typing import Any, Optional, Union
 
-import grpc
-import numpy as np
 import pyaudio
 
+from .audio_io import AudioSource
+from .google_speech_grpc import GoogleSpeechGrpc
 from .google_speech_v2 import MicrophoneStreamV2
+from .grpc_channel import get_channel
+from .recognizer import Recognizer
+from .tracing import end_speech, start_trace, trace_metadata
+from .vad import NoiseFloorEstimator, Vad
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
 import gpt_server_pb2
@@ -41,6 +42,13 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
         voice_port: str = "10002",
         motion_server_host: Optional[str] = "127.0.0.1",
         motion_server_port: Optional[str] = "50055",
+        audio_source: Optional[AudioSource] = None,
+        vad: Optional[Vad] = None,
+        pre_roll: float = 0.3,
+        persistent: bool = False,
+        noise_floor_estimator: Optional[NoiseFloorEstimator] = None,
+        recognizer: Optional[Recognizer] = None,
+        session_id: Optional[str] = None,
     ) -> None:
         """クラスの初期化メソッド。
 
@@ -55,6 +63,13 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
             voice_port (str, optional): VoiceVoxサーバーのポート番号。デフォルトは"10002"。
             motion_server_host (str, optional): モーションサーバーのIPアドレス。デフォルトは"127.0.0.1"。
             motion_server_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            audio_source (AudioSource, optional): 音声の入力元。Noneの場合はPyAudioの入力デバイス。
+            vad (Vad, optional): 発話区間の検出方法。Noneの場合は音量閾値で判定する。
+            pre_roll (float, optional): 発話開始前の音声を遡って送信する時間（秒）。0の場合は無効。デフォルトは0.3秒。
+            persistent (bool, optional): Trueの場合、withを抜けても音声入力デバイスを開いたままにし、次の発話で再利用する。close()で閉じる。デフォルトはFalse。
+            noise_floor_estimator (NoiseFloorEstimator, optional): 周囲音量の推定器。指定した場合は推定したノイズフロアから発話判定の音量閾値を随時更新する。デフォルトはNone。
+            recognizer (Recognizer, optional): 音声認識の方法。Noneの場合はGoogle Cloud Speech-to-Text API(v2)を使用する。
+            session_id (str, optional): gpt_serverのセッションID。Noneの場合はデフォルトのセッションを使用する。
         """
         super().__init__(
             rate=rate,
@@ -62,15 +77,23 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
             _timeout_thresh=_timeout_thresh,
             _start_timeout_thresh=_start_timeout_thresh,
             _db_thresh=_db_thresh,
+            audio_source=audio_source,
+            vad=vad,
+            pre_roll=pre_roll,
+            persistent=persistent,
+            noise_floor_estimator=noise_floor_estimator,
+            recognizer=recognizer,
         )
-        gpt_channel = grpc.insecure_channel(gpt_host + ":" + gpt_port)
+        gpt_channel = get_channel(gpt_host + ":" + gpt_port)
         self.gpt_stub = gpt_server_pb2_grpc.GptServerServiceStub(gpt_channel)
-        voice_channel = grpc.insecure_channel(voice_host + ":" + voice_port)
+        voice_channel = get_channel(voice_host + ":" + voice_port)
         self.voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+        self.session_id = session_id
         self.motion_stub = None
         if motion_server_host is not None and motion_server_port is not None:
-            motion_channel = grpc.insecure_channel(
-                motion_server_host + ":" + motion_server_port
+            motion_channel = get_channel(
+                motion_server_host + ":" + motion_server_port,
+                keepalive_without_calls=False,
             )
             self.motion_stub = motion_server_pb2_grpc.MotionServerServiceStub(
                 motion_channel
@@ -84,7 +107,7 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
         _start_timeout_thresh: float = 4.0,
         _db_thresh: float = 55.0,
     ) -> None:
-        """PyAudioストリームを閉じます。
+        """音声入力ストリームを閉じます。
 
         Args:
             rate (float): サンプリングレート。
@@ -98,7 +121,9 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
             rate, chunk, _timeout_thresh, _start_timeout_thresh, _db_thresh
         )
         try:
-            self.gpt_stub.SendMotion(gpt_server_pb2.SendMotionRequest())
+            self.gpt_stub.SendMotion(
+                gpt_server_pb2.SendMotionRequest(session_id=self.session_id)
+            )
         except BaseException:
             print("Send motion error")
             pass
@@ -118,142 +143,49 @@ class MicrophoneStreamV2Grpc(MicrophoneStreamV2):
             Union[None, Any]: Noneまたは続行のためのフラグ
 
         """
-        if self.is_start_callback:
-            in_data2 = struct.unpack(f"{len(in_data) / 2:.0f}h", in_data)
-            rms = math.sqrt(np.square(in_data2).mean())
-            power = 20 * math.log10(rms) if rms > 0.0 else -math.inf  # RMS to db
-            if power > self.db_thresh:
-                if not self.is_start:
-                    self.is_start = True
-                    if self.motion_stub is not None:
-                        try:
-                            self.motion_stub.SetMotion(
-                                motion_server_pb2.SetMotionRequest(
-                                    name="nod", priority=3, repeat=True
-                                )
+        self.track_noise_floor(in_data)
+        if self.is_start_callback and not self.closed:
+            vad_result = self.vad.process(in_data)
+            self.vad_confidence = vad_result.confidence
+            if vad_result.speech_started and not self.is_start:
+                self.is_start = True
+                start_trace()
+                self.flush_pre_roll()
+                if self.motion_stub is not None:
+                    try:
+                        self.motion_stub.SetMotion(
+                            motion_server_pb2.SetMotionRequest(
+                                name="nod", priority=3, repeat=True
                             )
-                        except BaseException:
-                            pass
-                self.start_time = time.time()
+                        )
+                    except BaseException:
+                        pass
             if self.is_start:
                 self._buff.put(in_data)
-                if time.time() - self.start_time >= self.timeout_thresh:
+                if vad_result.speech_ended:
                     self.is_start = False
-                    self.closed = True
+                    self.finish_stream()
+                    trace_id = end_speech()
                     try:
                         self.voice_stub.EnableVoicePlay(
-                            voice_server_pb2.EnableVoicePlayRequest()
+                            voice_server_pb2.EnableVoicePlayRequest(),
+                            metadata=trace_metadata(trace_id),
                         )
                     except BaseException:
                         print("EnableVoicePlay error")
                         pass
+                    # 音声入力デバイスを開いたままにする場合は、入力を止めずに次の発話を待つ
+                    if self.persistent:
+                        return None, pyaudio.paContinue
                     return None, pyaudio.paComplete
+            else:
+                self.store_pre_roll(in_data)
         return None, pyaudio.paContinue
 
 
-class GoogleSpeechV2Grpc(object):
+class GoogleSpeechV2Grpc(GoogleSpeechGrpc):
     """
-    Google Speech-to-Text APIのレスポンスを処理するクラス。
+    音声認識の結果を処理し、gpt_serverに送信するクラス。google STT v2用。
+    認識結果はRecognitionResultに変換済みのため、処理はv1と共通。
 
     """
-
-    def __init__(
-        self,
-        gpt_host: str = "127.0.0.1",
-        gpt_port: str = "10001",
-        voice_host: str = "127.0.0.1",
-        voice_port: str = "10002",
-    ) -> None:
-        """GoogleSpeechGrpcオブジェクトを初期化する。
-
-        Args:
-            gpt_host (str, optional): GPTサーバーのホスト名。デフォルトは"127.0.0.1"。
-            gpt_port (str, optional): GPTサーバーのポート番号。デフォルトは"10001"。
-            voice_host (str, optional): VoiceVoxサーバーのホスト名。デフォルトは"127.0.0.1"。
-            voice_port (str, optional): VoiceVoxサーバーのポート番号。デフォルトは"10002"。
-        """
-
-        gpt_channel = grpc.insecure_channel(gpt_host + ":" + gpt_port)
-        self.gpt_stub = gpt_server_pb2_grpc.GptServerServiceStub(gpt_channel)
-        voice_channel = grpc.insecure_channel(voice_host + ":" + voice_port)
-        self.voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
-
-    def listen_publisher_grpc(
-        self, responses: Any, progress_report_len: int = 0
-    ) -> str:
-        """
-        Google Cloud Speech-to-Text APIの応答からテキストを取得し、リアルタイムで出力。
-
-        Args:
-            responses (Any): ストリーミング認識の応答
-            progress_report_len (int, optional): ここで指定した文字数以上になると、その時点で一度GPTに結果を送信する。0の場合は途中での送信は無効となる。デフォルトは0。
-
-        Returns:
-            str: 認識されたテキスト
-        """
-        is_progress_report = False
-        num_chars_printed = 0
-        transcript = ""
-        overwrite_chars = ""
-        try:
-            self.voice_stub.DisableVoicePlay(voice_server_pb2.DisableVoicePlayRequest())
-        except BaseException:
-            print("DisableVoicePlay error")
-            pass
-        try:
-            self.voice_stub.InterruptVoice(voice_server_pb2.InterruptVoiceRequest())
-        except BaseException:
-            print("InterruptVoice error")
-            pass
-        for response in responses:
-            # if response.error.code:
-            #    break
-            if not response.results:
-                continue
-            result = response.results[0]
-            if not result.alternatives:
-                continue
-            transcript = result.alternatives[0].transcript
-            overwrite_chars = " " * (num_chars_printed - len(transcript))
-            if not result.is_final:
-                sys.stdout.write(transcript + overwrite_chars + "\r")
-                sys.stdout.flush()
-                num_chars_printed = len(transcript)
-                if not is_progress_report and num_chars_printed > progress_report_len:
-                    if progress_report_len > 0:
-                        try:
-                            self.gpt_stub.SetGpt(
-                                gpt_server_pb2.SetGptRequest(
-                                    text=transcript + overwrite_chars, is_finish=False
-                                )
-                            )
-                        except BaseException as e:
-                            print("SetGpt error:", e)
-                            pass
-                        is_progress_report = True
-            else:
-                if progress_report_len > 0:
-                    if (
-                        not is_progress_report
-                        and num_chars_printed > progress_report_len
-                    ):
-                        try:
-                            self.gpt_stub.SetGpt(
-                                gpt_server_pb2.SetGptRequest(
-                                    text=transcript + overwrite_chars, is_finish=False
-                                )
-                            )
-                        except BaseException as e:
-                            print("SetGpt error:", e)
-                            pass
-                break
-        try:
-            self.gpt_stub.SetGpt(
-                gpt_server_pb2.SetGptRequest(
-                    text=transcript + overwrite_chars, is_finish=True
-                )
-            )
-        except BaseException as e:
-            print("SetGpt error:", e)
-            pass
-        return transcript + overwrite_chars
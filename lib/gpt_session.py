@@ -0,0 +1,221 @@
+import copy
+import os
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional, Tuple
+
+from .chat_akari_grpc import ChatStreamAkariGrpc
+from .generation import GenerationRegistry
+from .grpc_channel import get_aio_channel, get_channel
+from .speculation import SpeculativeResponse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
+import voice_server_pb2_grpc
+
+DEFAULT_SESSION_ID = "default"
+
+
+def split_address(address: str) -> Tuple[str, str]:
+    """ "host:port"形式のアドレスをホストとポートに分割する。"""
+    host, port = address.rsplit(":", 1)
+    return host, port
+
+
+class GptSession(object):
+    """
+    gpt_serverに接続する1台のロボットとの会話の状態を保持するクラス。
+    会話履歴、音声合成サーバとモーションサーバの接続先、先行生成、実行中の応答生成をセッションごとに持つ。
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        system_prompt: str,
+        voice_address: str = "127.0.0.1:10002",
+        motion_address: str = "127.0.0.1:50055",
+        stream_text: bool = True,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            session_id (str): セッションID。
+            system_prompt (str): 会話履歴の先頭に設定するシステムプロンプト。
+            voice_address (str, optional): 音声合成サーバのアドレス("host:port")。デフォルトは"127.0.0.1:10002"。
+            motion_address (str, optional): モーションサーバのアドレス("host:port")。デフォルトは"127.0.0.1:50055"。
+            stream_text (bool, optional): 応答の文をStreamTextで送信するかどうか。デフォルトはTrue。
+
+        """
+        self.session_id = session_id
+        motion_host, motion_port = split_address(motion_address)
+        self.motion_address = motion_address
+        self.chat_stream_akari_grpc = ChatStreamAkariGrpc(motion_host, motion_port)
+        self.messages = [
+            self.chat_stream_akari_grpc.create_message(system_prompt, role="system")
+        ]
+        # 会話履歴の読み書きを排他する
+        self.lock = Lock()
+        self.voice_address = ""
+        self.stub = None
+        # grpc.aioのサーバから使用するスタブ。イベントループ上で初めて使用する時に作成する
+        self.aio_stub = None
+        self.set_voice_address(voice_address)
+        self.stream_text = stream_text
+        # 音声認識の途中結果から先行生成している最終応答
+        self.speculation: Optional[SpeculativeResponse] = None
+        self.speculation_lock = Lock()
+        # 実行中の応答生成。InterruptGptで中断する
+        self.generations = GenerationRegistry()
+        self.last_used = time.time()
+
+    def set_voice_address(self, voice_address: str) -> None:
+        """音声合成サーバの接続先を設定する。接続先が変わった場合のみチャンネルを作り直す。"""
+        if voice_address == self.voice_address:
+            return
+        voice_channel = get_channel(voice_address)
+        self.stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+        self.aio_stub = None
+        self.voice_address = voice_address
+
+    def get_aio_stub(self) -> voice_server_pb2_grpc.VoiceServerServiceStub:
+        """grpc.aioのチャンネルで作成した音声合成サーバのスタブを返す。イベントループ上で呼び出す。"""
+        if self.aio_stub is None:
+            voice_channel = get_aio_channel(self.voice_address)
+            self.aio_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
+        return self.aio_stub
+
+    def get_messages(self) -> list:
+        """会話履歴のコピーを返す。"""
+        with self.lock:
+            return copy.deepcopy(self.messages)
+
+    def append_messages(self, messages: list) -> None:
+        """会話履歴にメッセージを追加する。"""
+        with self.lock:
+            self.messages.extend(messages)
+
+    @property
+    def is_busy(self) -> bool:
+        """応答を生成中かどうか。"""
+        return len(self.generations.handles) > 0
+
+
+class GptSessionManager(object):
+    """
+    セッションIDごとのGptSessionを管理するクラス。
+    セッション数が上限を超えた場合や、一定時間使用されなかった場合は、最も古く使用されたセッションから破棄する。
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        voice_address: str = "127.0.0.1:10002",
+        motion_address: str = "127.0.0.1:50055",
+        stream_text: bool = True,
+        max_sessions: int = 16,
+        idle_timeout: float = 1800.0,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            system_prompt (str): 各セッションの会話履歴の先頭に設定するシステムプロンプト。
+            voice_address (str, optional): 接続先の指定がないセッションの音声合成サーバのアドレス。デフォルトは"127.0.0.1:10002"。
+            motion_address (str, optional): 接続先の指定がないセッションのモーションサーバのアドレス。デフォルトは"127.0.0.1:50055"。
+            stream_text (bool, optional): 応答の文をStreamTextで送信するかどうか。デフォルトはTrue。
+            max_sessions (int, optional): 保持するセッション数の上限。デフォルトは16。
+            idle_timeout (float, optional): この時間[sec]使用されなかったセッションを破棄する。0以下の場合は時間では破棄しない。デフォルトは1800。
+
+        """
+        self.system_prompt = system_prompt
+        self.voice_address = voice_address
+        self.motion_address = motion_address
+        self.stream_text = stream_text
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions: "OrderedDict[str, GptSession]" = OrderedDict()
+        self.lock = Lock()
+        # LLMのクライアントを全セッションで共有するため、最初に作成したChatStreamを保持する
+        self.shared_chat: Optional[ChatStreamAkariGrpc] = None
+
+    def get(
+        self,
+        session_id: Optional[str] = None,
+        voice_address: Optional[str] = None,
+        motion_address: Optional[str] = None,
+    ) -> GptSession:
+        """セッションを取得する。存在しない場合は作成する。
+
+        Args:
+            session_id (Optional[str], optional): セッションID。Noneまたは空の場合は"default"。
+            voice_address (Optional[str], optional): 音声合成サーバのアドレス。指定した場合はセッションの接続先を更新する。
+            motion_address (Optional[str], optional): モーションサーバのアドレス。セッションの作成時のみ使用する。
+
+        Returns:
+            GptSession: セッション。
+
+        """
+        if not session_id:
+            session_id = DEFAULT_SESSION_ID
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = GptSession(
+                    session_id,
+                    self.system_prompt,
+                    voice_address=voice_address or self.voice_address,
+                    motion_address=motion_address or self.motion_address,
+                    stream_text=self.stream_text,
+                )
+                if self.shared_chat is None:
+                    self.shared_chat = session.chat_stream_akari_grpc
+                else:
+                    session.chat_stream_akari_grpc.share_clients(self.shared_chat)
+                self.sessions[session_id] = session
+                print(f"Create session: {session_id} (voice: {session.voice_address})")
+            elif voice_address:
+                session.set_voice_address(voice_address)
+            session.last_used = time.time()
+            self.sessions.move_to_end(session_id)
+            self.evict(keep=session_id)
+        return session
+
+    def find(self, session_id: Optional[str] = None) -> Optional[GptSession]:
+        """セッションを取得する。存在しない場合はNoneを返し、作成しない。"""
+        if not session_id:
+            session_id = DEFAULT_SESSION_ID
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """上限を超えたセッションと、一定時間使用されなかったセッションを破棄する。応答を生成中のセッションは破棄しない。
+        self.lockを取得した状態で呼び出す。
+
+        Args:
+            keep (Optional[str], optional): 破棄しないセッションのID。デフォルトはNone。
+
+        """
+        now = time.time()
+        for session_id, session in list(self.sessions.items()):
+            if session_id == keep:
+                continue
+            is_idle = (
+                self.idle_timeout > 0 and now - session.last_used > self.idle_timeout
+            )
+            if len(self.sessions) <= self.max_sessions and not is_idle:
+                # 古い順に並んでいるため、以降のセッションは破棄しない
+                break
+            if session.is_busy:
+                continue
+            del self.sessions[session_id]
+            with session.speculation_lock:
+                speculation = session.speculation
+                session.speculation = None
+            if speculation is not None:
+                speculation.cancel()
+            print(f"Evict session: {session_id}")
+
+    def all(self) -> List[GptSession]:
+        """全てのセッションを返す。"""
+        with self.lock:
+            return list(self.sessions.values())
@@ -14,25 +14,27 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10gpt_server.proto\x12\ngpt_server\"C\n\rSetGptRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x16\n\tis_finish\x18\x02 \x01(\x08H\x00\x88\x01\x01\x42\x0c\n\n_is_finish\"\x1e\n\x0bSetGptReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x15\n\x13InterruptGptRequest\"$\n\x11InterruptGptReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x13\n\x11SendMotionRequest\"\"\n\x0fSendMotionReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\xea\x01\n\x10GptServerService\x12<\n\x06SetGpt\x12\x19.gpt_server.SetGptRequest\x1a\x17.gpt_server.SetGptReply\x12N\n\x0cInterruptGpt\x12\x1f.gpt_server.InterruptGptRequest\x1a\x1d.gpt_server.InterruptGptReply\x12H\n\nSendMotion\x12\x1d.gpt_server.SendMotionRequest\x1a\x1b.gpt_server.SendMotionReplyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10gpt_server.proto\x12\ngpt_server\"\xf9\x01\n\rSetGptRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x16\n\tis_finish\x18\x02 \x01(\x08H\x00\x88\x01\x01\x12\x1b\n\x0eis_speculative\x18\x03 \x01(\x08H\x01\x88\x01\x01\x12\x17\n\nsession_id\x18\x04 \x01(\tH\x02\x88\x01\x01\x12\x1a\n\rvoice_address\x18\x05 \x01(\tH\x03\x88\x01\x01\x12\x1b\n\x0emotion_address\x18\x06 \x01(\tH\x04\x88\x01\x01\x42\x0c\n\n_is_finishB\x11\n\x0f_is_speculativeB\r\n\x0b_session_idB\x10\n\x0e_voice_addressB\x11\n\x0f_motion_address\"\x1e\n\x0bSetGptReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\".\n\x0eStreamGptReply\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x0e\n\x06motion\x18\x02 \x01(\t\"=\n\x13InterruptGptRequest\x12\x17\n\nsession_id\x18\x01 \x01(\tH\x00\x88\x01\x01\x42\r\n\x0b_session_id\"S\n\x11InterruptGptReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x15\n\rnum_cancelled\x18\x02 \x01(\x05\x12\x16\n\x0e\x61voided_tokens\x18\x03 \x01(\x05\";\n\x11SendMotionRequest\x12\x17\n\nsession_id\x18\x01 \x01(\tH\x00\x88\x01\x01\x42\r\n\x0b_session_id\"\"\n\x0fSendMotionReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\xb0\x02\n\x10GptServerService\x12<\n\x06SetGpt\x12\x19.gpt_server.SetGptRequest\x1a\x17.gpt_server.SetGptReply\x12\x44\n\tStreamGpt\x12\x19.gpt_server.SetGptRequest\x1a\x1a.gpt_server.StreamGptReply0\x01\x12N\n\x0cInterruptGpt\x12\x1f.gpt_server.InterruptGptRequest\x1a\x1d.gpt_server.InterruptGptReply\x12H\n\nSendMotion\x12\x1d.gpt_server.SendMotionRequest\x1a\x1b.gpt_server.SendMotionReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'gpt_server_pb2', _globals)
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
-  _globals['_SETGPTREQUEST']._serialized_start=32
-  _globals['_SETGPTREQUEST']._serialized_end=99
-  _globals['_SETGPTREPLY']._serialized_start=101
-  _globals['_SETGPTREPLY']._serialized_end=131
-  _globals['_INTERRUPTGPTREQUEST']._serialized_start=133
-  _globals['_INTERRUPTGPTREQUEST']._serialized_end=154
-  _globals['_INTERRUPTGPTREPLY']._serialized_start=156
-  _globals['_INTERRUPTGPTREPLY']._serialized_end=192
-  _globals['_SENDMOTIONREQUEST']._serialized_start=194
-  _globals['_SENDMOTIONREQUEST']._serialized_end=213
-  _globals['_SENDMOTIONREPLY']._serialized_start=215
-  _globals['_SENDMOTIONREPLY']._serialized_end=249
-  _globals['_GPTSERVERSERVICE']._serialized_start=252
-  _globals['_GPTSERVERSERVICE']._serialized_end=486
+  _globals['_SETGPTREQUEST']._serialized_start=33
+  _globals['_SETGPTREQUEST']._serialized_end=282
+  _globals['_SETGPTREPLY']._serialized_start=284
+  _globals['_SETGPTREPLY']._serialized_end=314
+  _globals['_STREAMGPTREPLY']._serialized_start=316
+  _globals['_STREAMGPTREPLY']._serialized_end=362
+  _globals['_INTERRUPTGPTREQUEST']._serialized_start=364
+  _globals['_INTERRUPTGPTREQUEST']._serialized_end=425
+  _globals['_INTERRUPTGPTREPLY']._serialized_start=427
+  _globals['_INTERRUPTGPTREPLY']._serialized_end=510
+  _globals['_SENDMOTIONREQUEST']._serialized_start=512
+  _globals['_SENDMOTIONREQUEST']._serialized_end=571
+  _globals['_SENDMOTIONREPLY']._serialized_start=573
+  _globals['_SENDMOTIONREPLY']._serialized_end=607
+  _globals['_GPTSERVERSERVICE']._serialized_start=610
+  _globals['_GPTSERVERSERVICE']._serialized_end=914
 # @@protoc_insertion_point(module_scope)
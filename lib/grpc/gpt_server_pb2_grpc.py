@@ -19,6 +19,11 @@ class GptServerServiceStub(object):
                 request_serializer=gpt__server__pb2.SetGptRequest.SerializeToString,
                 response_deserializer=gpt__server__pb2.SetGptReply.FromString,
                 )
+        self.StreamGpt = channel.unary_stream(
+                '/gpt_server.GptServerService/StreamGpt',
+                request_serializer=gpt__server__pb2.SetGptRequest.SerializeToString,
+                response_deserializer=gpt__server__pb2.StreamGptReply.FromString,
+                )
         self.InterruptGpt = channel.unary_unary(
                 '/gpt_server.GptServerService/InterruptGpt',
                 request_serializer=gpt__server__pb2.InterruptGptRequest.SerializeToString,
@@ -40,6 +45,12 @@ class GptServerServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamGpt(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def InterruptGpt(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -60,6 +71,11 @@ def add_GptServerServiceServicer_to_server(servicer, server):
                     request_deserializer=gpt__server__pb2.SetGptRequest.FromString,
                     response_serializer=gpt__server__pb2.SetGptReply.SerializeToString,
             ),
+            'StreamGpt': grpc.unary_stream_rpc_method_handler(
+                    servicer.StreamGpt,
+                    request_deserializer=gpt__server__pb2.SetGptRequest.FromString,
+                    response_serializer=gpt__server__pb2.StreamGptReply.SerializeToString,
+            ),
             'InterruptGpt': grpc.unary_unary_rpc_method_handler(
                     servicer.InterruptGpt,
                     request_deserializer=gpt__server__pb2.InterruptGptRequest.FromString,
@@ -97,6 +113,23 @@ class GptServerService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def StreamGpt(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/gpt_server.GptServerService/StreamGpt',
+            gpt__server__pb2.SetGptRequest.SerializeToString,
+            gpt__server__pb2.StreamGptReply.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def InterruptGpt(request,
             target,
@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13speech_server.proto\x12\rspeech_server\"%\n\x13ToggleSpeechRequest\x12\x0e\n\x06\x65nable\x18\x01 \x01(\x08\"$\n\x11ToggleSpeechReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32k\n\x13SpeechServerService\x12T\n\x0cToggleSpeech\x12\".speech_server.ToggleSpeechRequest\x1a .speech_server.ToggleSpeechReplyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x13speech_server.proto\x12\rspeech_server\"%\n\x13ToggleSpeechRequest\x12\x0e\n\x06\x65nable\x18\x01 \x01(\x08\"$\n\x11ToggleSpeechReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x16\n\x14GetNoiseLevelRequest\"T\n\x12GetNoiseLevelReply\x12\x10\n\x08\x61\x64\x61ptive\x18\x01 \x01(\x08\x12\x13\n\x0bnoise_floor\x18\x02 \x01(\x02\x12\x17\n\x0fpower_threshold\x18\x03 \x01(\x02\x32\xc4\x01\n\x13SpeechServerService\x12T\n\x0cToggleSpeech\x12\".speech_server.ToggleSpeechRequest\x1a .speech_server.ToggleSpeechReply\x12W\n\rGetNoiseLevel\x12#.speech_server.GetNoiseLevelRequest\x1a!.speech_server.GetNoiseLevelReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -25,6 +25,10 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _globals['_TOGGLESPEECHREQUEST']._serialized_end=75
   _globals['_TOGGLESPEECHREPLY']._serialized_start=77
   _globals['_TOGGLESPEECHREPLY']._serialized_end=113
-  _globals['_SPEECHSERVERSERVICE']._serialized_start=115
-  _globals['_SPEECHSERVERSERVICE']._serialized_end=222
+  _globals['_GETNOISELEVELREQUEST']._serialized_start=115
+  _globals['_GETNOISELEVELREQUEST']._serialized_end=137
+  _globals['_GETNOISELEVELREPLY']._serialized_start=139
+  _globals['_GETNOISELEVELREPLY']._serialized_end=223
+  _globals['_SPEECHSERVERSERVICE']._serialized_start=226
+  _globals['_SPEECHSERVERSERVICE']._serialized_end=422
 # @@protoc_insertion_point(module_scope)
@@ -19,6 +19,11 @@ class SpeechServerServiceStub(object):
                 request_serializer=speech__server__pb2.ToggleSpeechRequest.SerializeToString,
                 response_deserializer=speech__server__pb2.ToggleSpeechReply.FromString,
                 )
+        self.GetNoiseLevel = channel.unary_unary(
+                '/speech_server.SpeechServerService/GetNoiseLevel',
+                request_serializer=speech__server__pb2.GetNoiseLevelRequest.SerializeToString,
+                response_deserializer=speech__server__pb2.GetNoiseLevelReply.FromString,
+                )
 
 
 class SpeechServerServiceServicer(object):
@@ -30,6 +35,12 @@ class SpeechServerServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetNoiseLevel(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_SpeechServerServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -38,6 +49,11 @@ def add_SpeechServerServiceServicer_to_server(servicer, server):
                     request_deserializer=speech__server__pb2.ToggleSpeechRequest.FromString,
                     response_serializer=speech__server__pb2.ToggleSpeechReply.SerializeToString,
             ),
+            'GetNoiseLevel': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetNoiseLevel,
+                    request_deserializer=speech__server__pb2.GetNoiseLevelRequest.FromString,
+                    response_serializer=speech__server__pb2.GetNoiseLevelReply.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'speech_server.SpeechServerService', rpc_method_handlers)
@@ -64,3 +80,20 @@ class SpeechServerService(object):
             speech__server__pb2.ToggleSpeechReply.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetNoiseLevel(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/speech_server.SpeechServerService/GetNoiseLevel',
+            speech__server__pb2.GetNoiseLevelRequest.SerializeToString,
+            speech__server__pb2.GetNoiseLevelReply.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -14,7 +14,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12voice_server.proto\x12\x0cvoice_server\"\x1e\n\x0eSetTextRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\"\x1f\n\x0cSetTextReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\xd4\x01\n\x1cSetStyleBertVitsParamRequest\x12\x17\n\nmodel_name\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x15\n\x08model_id\x18\x02 \x01(\x05H\x01\x88\x01\x01\x12\x13\n\x06length\x18\x03 \x01(\x02H\x02\x88\x01\x01\x12\x12\n\x05style\x18\x04 \x01(\tH\x03\x88\x01\x01\x12\x19\n\x0cstyle_weight\x18\x05 \x01(\x02H\x04\x88\x01\x01\x42\r\n\x0b_model_nameB\x0b\n\t_model_idB\t\n\x07_lengthB\x08\n\x06_styleB\x0f\n\r_style_weight\"-\n\x1aSetStyleBertVitsParamReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"e\n\x17SetVoicevoxParamRequest\x12\x14\n\x07speaker\x18\x01 \x01(\x05H\x00\x88\x01\x01\x12\x18\n\x0bspeed_scale\x18\x02 \x01(\x02H\x01\x88\x01\x01\x42\n\n\x08_speakerB\x0e\n\x0c_speed_scale\"(\n\x15SetVoicevoxParamReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x17\n\x15InterruptVoiceRequest\"&\n\x13InterruptVoiceReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x18\n\x16\x45nableVoicePlayRequest\"\'\n\x14\x45nableVoicePlayReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x19\n\x17\x44isableVoicePlayRequest\"(\n\x15\x44isableVoicePlayReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x17\n\x15IsVoicePlayingRequest\")\n\x13IsVoicePlayingReply\x12\x12\n\nis_playing\x18\x01 \x01(\x08\"\x14\n\x12SentenceEndRequest\"#\n\x10SentenceEndReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x19\n\x17StartHeadControlRequest\"(\n\x15StartHeadControlReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\xca\x06\n\x12VoiceServerService\x12\x43\n\x07SetText\x12\x1c.voice_server.SetTextRequest\x1a\x1a.voice_server.SetTextReply\x12m\n\x15SetStyleBertVitsParam\x12*.voice_server.SetStyleBertVitsParamRequest\x1a(.voice_server.SetStyleBertVitsParamReply\x12^\n\x10SetVoicevoxParam\x12%.voice_server.SetVoicevoxParamRequest\x1a#.voice_server.SetVoicevoxParamReply\x12X\n\x0eInterruptVoice\x12#.voice_server.InterruptVoiceRequest\x1a!.voice_server.InterruptVoiceReply\x12[\n\x0f\x45nableVoicePlay\x12$.voice_server.EnableVoicePlayRequest\x1a\".voice_server.EnableVoicePlayReply\x12^\n\x10\x44isableVoicePlay\x12%.voice_server.DisableVoicePlayRequest\x1a#.voice_server.DisableVoicePlayReply\x12X\n\x0eIsVoicePlaying\x12#.voice_server.IsVoicePlayingRequest\x1a!.voice_server.IsVoicePlayingReply\x12O\n\x0bSentenceEnd\x12 .voice_server.SentenceEndRequest\x1a\x1e.voice_server.SentenceEndReply\x12^\n\x10StartHeadControl\x12%.voice_server.StartHeadControlRequest\x1a#.voice_server.StartHeadControlReplyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12voice_server.proto\x12\x0cvoice_server\"F\n\x0eSetTextRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x17\n\nnormalized\x18\x02 \x01(\x08H\x00\x88\x01\x01\x42\r\n\x0b_normalized\"\x1f\n\x0cSetTextReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"u\n\x11StreamTextRequest\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x17\n\nnormalized\x18\x02 \x01(\x08H\x00\x88\x01\x01\x12\x19\n\x0csentence_end\x18\x03 \x01(\x08H\x01\x88\x01\x01\x42\r\n\x0b_normalizedB\x0f\n\r_sentence_end\"5\n\x0fStreamTextReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x11\n\tnum_texts\x18\x02 \x01(\x05\"\xd4\x01\n\x1cSetStyleBertVitsParamRequest\x12\x17\n\nmodel_name\x18\x01 \x01(\tH\x00\x88\x01\x01\x12\x15\n\x08model_id\x18\x02 \x01(\x05H\x01\x88\x01\x01\x12\x13\n\x06length\x18\x03 \x01(\x02H\x02\x88\x01\x01\x12\x12\n\x05style\x18\x04 \x01(\tH\x03\x88\x01\x01\x12\x19\n\x0cstyle_weight\x18\x05 \x01(\x02H\x04\x88\x01\x01\x42\r\n\x0b_model_nameB\x0b\n\t_model_idB\t\n\x07_lengthB\x08\n\x06_styleB\x0f\n\r_style_weight\"-\n\x1aSetStyleBertVitsParamReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"e\n\x17SetVoicevoxParamRequest\x12\x14\n\x07speaker\x18\x01 \x01(\x05H\x00\x88\x01\x01\x12\x18\n\x0bspeed_scale\x18\x02 \x01(\x02H\x01\x88\x01\x01\x42\n\n\x08_speakerB\x0e\n\x0c_speed_scale\"(\n\x15SetVoicevoxParamReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x17\n\x15InterruptVoiceRequest\"&\n\x13InterruptVoiceReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x18\n\x16\x45nableVoicePlayRequest\"\'\n\x14\x45nableVoicePlayReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x19\n\x17\x44isableVoicePlayRequest\"(\n\x15\x44isableVoicePlayReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x17\n\x15IsVoicePlayingRequest\")\n\x13IsVoicePlayingReply\x12\x12\n\nis_playing\x18\x01 \x01(\x08\"\x14\n\x12SentenceEndRequest\"#\n\x10SentenceEndReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\"\x19\n\x17StartHeadControlRequest\"(\n\x15StartHeadControlReply\x12\x0f\n\x07success\x18\x01 \x01(\x08\x32\x9a\x07\n\x12VoiceServerService\x12\x43\n\x07SetText\x12\x1c.voice_server.SetTextRequest\x1a\x1a.voice_server.SetTextReply\x12N\n\nStreamText\x12\x1f.voice_server.StreamTextRequest\x1a\x1d.voice_server.StreamTextReply(\x01\x12m\n\x15SetStyleBertVitsParam\x12*.voice_server.SetStyleBertVitsParamRequest\x1a(.voice_server.SetStyleBertVitsParamReply\x12^\n\x10SetVoicevoxParam\x12%.voice_server.SetVoicevoxParamRequest\x1a#.voice_server.SetVoicevoxParamReply\x12X\n\x0eInterruptVoice\x12#.voice_server.InterruptVoiceRequest\x1a!.voice_server.InterruptVoiceReply\x12[\n\x0f\x45nableVoicePlay\x12$.voice_server.EnableVoicePlayRequest\x1a\".voice_server.EnableVoicePlayReply\x12^\n\x10\x44isableVoicePlay\x12%.voice_server.DisableVoicePlayRequest\x1a#.voice_server.DisableVoicePlayReply\x12X\n\x0eIsVoicePlaying\x12#.voice_server.IsVoicePlayingRequest\x1a!.voice_server.IsVoicePlayingReply\x12O\n\x0bSentenceEnd\x12 .voice_server.SentenceEndRequest\x1a\x1e.voice_server.SentenceEndReply\x12^\n\x10StartHeadControl\x12%.voice_server.StartHeadControlRequest\x1a#.voice_server.StartHeadControlReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -22,41 +22,45 @@ _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'voice_server_pb2', _globals
 if _descriptor._USE_C_DESCRIPTORS == False:
   DESCRIPTOR._options = None
   _globals['_SETTEXTREQUEST']._serialized_start=36
-  _globals['_SETTEXTREQUEST']._serialized_end=66
-  _globals['_SETTEXTREPLY']._serialized_start=68
-  _globals['_SETTEXTREPLY']._serialized_end=99
-  _globals['_SETSTYLEBERTVITSPARAMREQUEST']._serialized_start=102
-  _globals['_SETSTYLEBERTVITSPARAMREQUEST']._serialized_end=314
-  _globals['_SETSTYLEBERTVITSPARAMREPLY']._serialized_start=316
-  _globals['_SETSTYLEBERTVITSPARAMREPLY']._serialized_end=361
-  _globals['_SETVOICEVOXPARAMREQUEST']._serialized_start=363
-  _globals['_SETVOICEVOXPARAMREQUEST']._serialized_end=464
-  _globals['_SETVOICEVOXPARAMREPLY']._serialized_start=466
-  _globals['_SETVOICEVOXPARAMREPLY']._serialized_end=506
-  _globals['_INTERRUPTVOICEREQUEST']._serialized_start=508
-  _globals['_INTERRUPTVOICEREQUEST']._serialized_end=531
-  _globals['_INTERRUPTVOICEREPLY']._serialized_start=533
-  _globals['_INTERRUPTVOICEREPLY']._serialized_end=571
-  _globals['_ENABLEVOICEPLAYREQUEST']._serialized_start=573
-  _globals['_ENABLEVOICEPLAYREQUEST']._serialized_end=597
-  _globals['_ENABLEVOICEPLAYREPLY']._serialized_start=599
-  _globals['_ENABLEVOICEPLAYREPLY']._serialized_end=638
-  _globals['_DISABLEVOICEPLAYREQUEST']._serialized_start=640
-  _globals['_DISABLEVOICEPLAYREQUEST']._serialized_end=665
-  _globals['_DISABLEVOICEPLAYREPLY']._serialized_start=667
-  _globals['_DISABLEVOICEPLAYREPLY']._serialized_end=707
-  _globals['_ISVOICEPLAYINGREQUEST']._serialized_start=709
-  _globals['_ISVOICEPLAYINGREQUEST']._serialized_end=732
-  _globals['_ISVOICEPLAYINGREPLY']._serialized_start=734
-  _globals['_ISVOICEPLAYINGREPLY']._serialized_end=775
-  _globals['_SENTENCEENDREQUEST']._serialized_start=777
-  _globals['_SENTENCEENDREQUEST']._serialized_end=797
-  _globals['_SENTENCEENDREPLY']._serialized_start=799
-  _globals['_SENTENCEENDREPLY']._serialized_end=834
-  _globals['_STARTHEADCONTROLREQUEST']._serialized_start=836
-  _globals['_STARTHEADCONTROLREQUEST']._serialized_end=861
-  _globals['_STARTHEADCONTROLREPLY']._serialized_start=863
-  _globals['_STARTHEADCONTROLREPLY']._serialized_end=903
-  _globals['_VOICESERVERSERVICE']._serialized_start=906
-  _globals['_VOICESERVERSERVICE']._serialized_end=1748
+  _globals['_SETTEXTREQUEST']._serialized_end=106
+  _globals['_SETTEXTREPLY']._serialized_start=108
+  _globals['_SETTEXTREPLY']._serialized_end=139
+  _globals['_STREAMTEXTREQUEST']._serialized_start=141
+  _globals['_STREAMTEXTREQUEST']._serialized_end=258
+  _globals['_STREAMTEXTREPLY']._serialized_start=260
+  _globals['_STREAMTEXTREPLY']._serialized_end=313
+  _globals['_SETSTYLEBERTVITSPARAMREQUEST']._serialized_start=316
+  _globals['_SETSTYLEBERTVITSPARAMREQUEST']._serialized_end=528
+  _globals['_SETSTYLEBERTVITSPARAMREPLY']._serialized_start=530
+  _globals['_SETSTYLEBERTVITSPARAMREPLY']._serialized_end=575
+  _globals['_SETVOICEVOXPARAMREQUEST']._serialized_start=577
+  _globals['_SETVOICEVOXPARAMREQUEST']._serialized_end=678
+  _globals['_SETVOICEVOXPARAMREPLY']._serialized_start=680
+  _globals['_SETVOICEVOXPARAMREPLY']._serialized_end=720
+  _globals['_INTERRUPTVOICEREQUEST']._serialized_start=722
+  _globals['_INTERRUPTVOICEREQUEST']._serialized_end=745
+  _globals['_INTERRUPTVOICEREPLY']._serialized_start=747
+  _globals['_INTERRUPTVOICEREPLY']._serialized_end=785
+  _globals['_ENABLEVOICEPLAYREQUEST']._serialized_start=787
+  _globals['_ENABLEVOICEPLAYREQUEST']._serialized_end=811
+  _globals['_ENABLEVOICEPLAYREPLY']._serialized_start=813
+  _globals['_ENABLEVOICEPLAYREPLY']._serialized_end=852
+  _globals['_DISABLEVOICEPLAYREQUEST']._serialized_start=854
+  _globals['_DISABLEVOICEPLAYREQUEST']._serialized_end=879
+  _globals['_DISABLEVOICEPLAYREPLY']._serialized_start=881
+  _globals['_DISABLEVOICEPLAYREPLY']._serialized_end=921
+  _globals['_ISVOICEPLAYINGREQUEST']._serialized_start=923
+  _globals['_ISVOICEPLAYINGREQUEST']._serialized_end=946
+  _globals['_ISVOICEPLAYINGREPLY']._serialized_start=948
+  _globals['_ISVOICEPLAYINGREPLY']._serialized_end=989
+  _globals['_SENTENCEENDREQUEST']._serialized_start=991
+  _globals['_SENTENCEENDREQUEST']._serialized_end=1011
+  _globals['_SENTENCEENDREPLY']._serialized_start=1013
+  _globals['_SENTENCEENDREPLY']._serialized_end=1048
+  _globals['_STARTHEADCONTROLREQUEST']._serialized_start=1050
+  _globals['_STARTHEADCONTROLREQUEST']._serialized_end=1075
+  _globals['_STARTHEADCONTROLREPLY']._serialized_start=1077
+  _globals['_STARTHEADCONTROLREPLY']._serialized_end=1117
+  _globals['_VOICESERVERSERVICE']._serialized_start=1120
+  _globals['_VOICESERVERSERVICE']._serialized_end=2042
 # @@protoc_insertion_point(module_scope)
@@ -19,6 +19,11 @@ class VoiceServerServiceStub(object):
                 request_serializer=voice__server__pb2.SetTextRequest.SerializeToString,
                 response_deserializer=voice__server__pb2.SetTextReply.FromString,
                 )
+        self.StreamText = channel.stream_unary(
+                '/voice_server.VoiceServerService/StreamText',
+                request_serializer=voice__server__pb2.StreamTextRequest.SerializeToString,
+                response_deserializer=voice__server__pb2.StreamTextReply.FromString,
+                )
         self.SetStyleBertVitsParam = channel.unary_unary(
                 '/voice_server.VoiceServerService/SetStyleBertVitsParam',
                 request_serializer=voice__server__pb2.SetStyleBertVitsParamRequest.SerializeToString,
@@ -70,6 +75,12 @@ class VoiceServerServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamText(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def SetStyleBertVitsParam(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -126,6 +137,11 @@ def add_VoiceServerServiceServicer_to_server(servicer, server):
                     request_deserializer=voice__server__pb2.SetTextRequest.FromString,
                     response_serializer=voice__server__pb2.SetTextReply.SerializeToString,
             ),
+            'StreamText': grpc.stream_unary_rpc_method_handler(
+                    servicer.StreamText,
+                    request_deserializer=voice__server__pb2.StreamTextRequest.FromString,
+                    response_serializer=voice__server__pb2.StreamTextReply.SerializeToString,
+            ),
             'SetStyleBertVitsParam': grpc.unary_unary_rpc_method_handler(
                     servicer.SetStyleBertVitsParam,
                     request_deserializer=voice__server__pb2.SetStyleBertVitsParamRequest.FromString,
@@ -193,6 +209,23 @@ class VoiceServerService(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def StreamText(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/voice_server.VoiceServerService/StreamText',
+            voice__server__pb2.StreamTextRequest.SerializeToString,
+            voice__server__pb2.StreamTextReply.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def SetStyleBertVitsParam(request,
             target,
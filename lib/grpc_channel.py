@@ -0,0 +1,305 @@
+import asyncio
+import json
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import grpc
+
+# サービスごとのRPCのデッドライン[sec]。(デフォルト, メソッドごとの値)
+# 応答の生成と、1回の応答の文を送るストリームは長時間になるため、個別に設定する
+RPC_TIMEOUTS: Dict[str, Tuple[float, Dict[str, float]]] = {
+    "gpt_server.GptServerService": (10.0, {"SetGpt": 120.0, "StreamGpt": 120.0}),
+    "voice_server.VoiceServerService": (5.0, {"StreamText": 120.0}),
+    "speech_server.SpeechServerService": (5.0, {}),
+    "motion_server.MotionServerService": (5.0, {}),
+}
+
+# 接続できない場合(UNAVAILABLE)のみ、バックオフしながら再送する
+RETRY_POLICY = {
+    "maxAttempts": 3,
+    "initialBackoff": "0.1s",
+    "maxBackoff": "1s",
+    "backoffMultiplier": 2,
+    "retryableStatusCodes": ["UNAVAILABLE"],
+}
+
+# wait_for_readyと再送を行わないメソッド
+# SetGpt/StreamGpt/StreamTextは再送すると応答の生成や音声合成が重複し、遅れて届いた場合は古い発話の応答になるため、
+# InterruptGpt/InterruptVoiceは次の発話の処理を遅らせないため、接続できない場合はすぐに失敗させる
+FAIL_FAST_METHODS: Dict[str, Set[str]] = {
+    "gpt_server.GptServerService": {"SetGpt", "StreamGpt", "InterruptGpt"},
+    "voice_server.VoiceServerService": {"StreamText", "InterruptVoice"},
+}
+
+KEEPALIVE_TIME_MS = 20000  # keepaliveのpingの間隔
+KEEPALIVE_TIMEOUT_MS = 5000  # pingの応答がなければ切断とみなす時間
+CLIENT_IDLE_TIMEOUT_MS = 2**31 - 1  # 使用されないチャンネルを切断しない
+# 再接続の間隔。サーバの起動待ちで接続が遅れないよう、gRPCのデフォルト(1秒から最大120秒)より短くする
+RECONNECT_BACKOFF_MS = (200, 2000)
+
+
+def build_service_config() -> str:
+    """全サービスのデッドライン、wait_for_ready、再送ポリシーを設定したservice configを返す。
+    FAIL_FAST_METHODSのメソッドはデッドラインのみを設定する。
+    """
+    method_configs: List[Dict[str, Any]] = []
+    for service, (timeout, method_timeouts) in RPC_TIMEOUTS.items():
+        fail_fast = FAIL_FAST_METHODS.get(service, set())
+        names = [({"service": service}, timeout, False)]
+        for method in sorted(set(method_timeouts) | fail_fast):
+            names.append(
+                (
+                    {"service": service, "method": method},
+                    method_timeouts.get(method, timeout),
+                    method in fail_fast,
+                )
+            )
+        for name, name_timeout, is_fail_fast in names:
+            method_config: Dict[str, Any] = {
+                "name": [name],
+                "timeout": f"{name_timeout:g}s",
+            }
+            if not is_fail_fast:
+                # サーバの起動前や再接続中は、失敗せずにデッドラインまで接続を待つ
+                method_config["waitForReady"] = True
+                method_config["retryPolicy"] = RETRY_POLICY
+            method_configs.append(method_config)
+    return json.dumps({"methodConfig": method_configs})
+
+
+def channel_options(keepalive_without_calls: bool = True) -> List[Tuple[str, Any]]:
+    """クライアントのチャンネルのオプションを返す。
+
+    Args:
+        keepalive_without_calls (bool, optional): RPCを実行していない間もkeepaliveのpingを送るかどうか。
+            server_options()を設定していない外部のサーバ(モーションサーバ)では、pingが多すぎると切断されるためFalseにする。デフォルトはTrue。
+
+    Returns:
+        List[Tuple[str, Any]]: チャンネルのオプション。
+
+    """
+    return [
+        ("grpc.keepalive_time_ms", KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1 if keepalive_without_calls else 0),
+        ("grpc.http2.max_pings_without_data", 0),
+        ("grpc.client_idle_timeout_ms", CLIENT_IDLE_TIMEOUT_MS),
+        ("grpc.initial_reconnect_backoff_ms", RECONNECT_BACKOFF_MS[0]),
+        ("grpc.min_reconnect_backoff_ms", RECONNECT_BACKOFF_MS[0]),
+        ("grpc.max_reconnect_backoff_ms", RECONNECT_BACKOFF_MS[1]),
+        ("grpc.enable_retries", 1),
+        ("grpc.service_config", build_service_config()),
+    ]
+
+
+def server_options() -> List[Tuple[str, Any]]:
+    """channel_options()のkeepaliveのpingを受け付けるサーバのオプションを返す。"""
+    return [
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.min_ping_interval_without_data_ms", KEEPALIVE_TIME_MS // 2),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+
+class ChannelStats(object):
+    """
+    チャンネルの接続状態の遷移を記録するクラス。
+    """
+
+    def __init__(self, target: str) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            target (str): 接続先("host:port")。
+
+        """
+        self.target = target
+        self.state = grpc.ChannelConnectivity.IDLE
+        self.last_change = time.time()
+        self.num_connects = 0  # READYになった回数
+        self.num_failures = 0  # TRANSIENT_FAILUREになった回数
+        self.connecting_time: Optional[float] = None
+        # 直近の接続開始からREADYまでの時間[sec]
+        self.last_connect_latency: Optional[float] = None
+        self.lock = Lock()
+
+    def update(self, state: grpc.ChannelConnectivity) -> None:
+        """接続状態の遷移を記録する。"""
+        now = time.time()
+        with self.lock:
+            if state == self.state:
+                return
+            if state == grpc.ChannelConnectivity.CONNECTING:
+                self.connecting_time = now
+            elif state == grpc.ChannelConnectivity.READY:
+                self.num_connects += 1
+                if self.connecting_time is not None:
+                    self.last_connect_latency = now - self.connecting_time
+                    self.connecting_time = None
+            elif state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+                self.num_failures += 1
+            self.state = state
+            self.last_change = now
+
+    def to_dict(self) -> Dict[str, Any]:
+        """記録した値を辞書で返す。"""
+        with self.lock:
+            return {
+                "target": self.target,
+                "state": self.state.name,
+                "state_seconds": time.time() - self.last_change,
+                "num_connects": self.num_connects,
+                "num_failures": self.num_failures,
+                "last_connect_latency": self.last_connect_latency,
+            }
+
+    def summary(self) -> str:
+        """記録した値の概要を返す。"""
+        stats = self.to_dict()
+        latency = stats["last_connect_latency"]
+        latency_text = f"{latency * 1000:.0f}ms" if latency is not None else "-"
+        return (
+            f"{stats['target']}: {stats['state']} for {stats['state_seconds']:.0f}s, "
+            f"connects {stats['num_connects']}, failures {stats['num_failures']}, "
+            f"last connect {latency_text}"
+        )
+
+
+class ChannelRegistry(object):
+    """
+    接続先ごとに1つのgRPCチャンネルを共有するクラス。
+    チャンネルは作成時に接続を開始し、切断された場合もバックグラウンドで再接続するため、
+    アイドル後の最初のRPCで接続を待つ必要がない。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.lock = Lock()
+        self.channels: Dict[str, grpc.Channel] = {}
+        self.aio_channels: Dict[Tuple[str, asyncio.AbstractEventLoop], Any] = {}
+        self.stats: Dict[str, ChannelStats] = {}
+        # aioチャンネルの状態を監視するタスク
+        self.watch_tasks: Set["asyncio.Task[None]"] = set()
+
+    def _get_stats(self, target: str) -> ChannelStats:
+        stats = self.stats.get(target)
+        if stats is None:
+            stats = ChannelStats(target)
+            self.stats[target] = stats
+        return stats
+
+    def get_channel(
+        self, target: str, keepalive_without_calls: bool = True
+    ) -> grpc.Channel:
+        """接続先のチャンネルを返す。初めての接続先の場合は作成し、接続を開始する。
+
+        Args:
+            target (str): 接続先("host:port")。
+            keepalive_without_calls (bool, optional): RPCを実行していない間もkeepaliveのpingを送るかどうか。
+                同じ接続先には最初に作成した時の設定を使用する。デフォルトはTrue。
+
+        Returns:
+            grpc.Channel: 共有するチャンネル。
+
+        """
+        with self.lock:
+            channel = self.channels.get(target)
+            if channel is not None:
+                return channel
+            channel = grpc.insecure_channel(
+                target, options=channel_options(keepalive_without_calls)
+            )
+            self.channels[target] = channel
+            stats = self._get_stats(target)
+        # try_to_connectにより、作成時と切断後に接続を開始する
+        channel.subscribe(stats.update, try_to_connect=True)
+        return channel
+
+    def get_aio_channel(
+        self, target: str, keepalive_without_calls: bool = True
+    ) -> grpc.aio.Channel:
+        """接続先のgrpc.aioのチャンネルを返す。イベントループ上で呼び出し、ループごとに作成する。
+
+        Args:
+            target (str): 接続先("host:port")。
+            keepalive_without_calls (bool, optional): RPCを実行していない間もkeepaliveのpingを送るかどうか。デフォルトはTrue。
+
+        Returns:
+            grpc.aio.Channel: 共有するチャンネル。
+
+        """
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            channel = self.aio_channels.get((target, loop))
+            if channel is not None:
+                return channel
+            channel = grpc.aio.insecure_channel(
+                target, options=channel_options(keepalive_without_calls)
+            )
+            self.aio_channels[(target, loop)] = channel
+            stats = self._get_stats(f"{target} (aio)")
+        task = loop.create_task(self._watch_aio_channel(channel, stats))
+        self.watch_tasks.add(task)
+        task.add_done_callback(self.watch_tasks.discard)
+        return channel
+
+    async def _watch_aio_channel(
+        self, channel: grpc.aio.Channel, stats: ChannelStats
+    ) -> None:
+        try:
+            while True:
+                state = channel.get_state(try_to_connect=True)
+                stats.update(state)
+                await channel.wait_for_state_change(state)
+        except BaseException:
+            # チャンネルを閉じた場合やイベントループの終了時
+            pass
+
+    def wait_ready(self, target: str, timeout: Optional[float] = None) -> bool:
+        """接続先のチャンネルが接続されるまで待つ。
+
+        Args:
+            target (str): 接続先("host:port")。
+            timeout (Optional[float], optional): 待機する最大時間[sec]。Noneの場合は接続されるまで待つ。
+
+        Returns:
+            bool: 接続された場合はTrue。
+
+        """
+        try:
+            grpc.channel_ready_future(self.get_channel(target)).result(timeout=timeout)
+        except grpc.FutureTimeoutError:
+            return False
+        return True
+
+    def all_stats(self) -> List[ChannelStats]:
+        """全ての接続先の接続状態を返す。"""
+        with self.lock:
+            return list(self.stats.values())
+
+
+# プロセス内で共有するChannelRegistry
+_registry = ChannelRegistry()
+
+
+def get_channel(target: str, keepalive_without_calls: bool = True) -> grpc.Channel:
+    """プロセス内で共有する接続先のチャンネルを返す。ChannelRegistry.get_channelを参照。"""
+    return _registry.get_channel(target, keepalive_without_calls)
+
+
+def get_aio_channel(
+    target: str, keepalive_without_calls: bool = True
+) -> grpc.aio.Channel:
+    """プロセス内で共有する接続先のgrpc.aioのチャンネルを返す。ChannelRegistry.get_aio_channelを参照。"""
+    return _registry.get_aio_channel(target, keepalive_without_calls)
+
+
+def wait_ready(target: str, timeout: Optional[float] = None) -> bool:
+    """接続先のチャンネルが接続されるまで待つ。ChannelRegistry.wait_readyを参照。"""
+    return _registry.wait_ready(target, timeout)
+
+
+def channel_stats() -> List[ChannelStats]:
+    """プロセス内の全ての接続先の接続状態を返す。"""
+    return _registry.all_stats()
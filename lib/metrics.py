@@ -0,0 +1,491 @@
+import asyncio
+import inspect
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import grpc
+
+from .grpc_channel import channel_stats
+
+# 遅延のヒストグラムのデフォルトのバケット[sec]
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if len(names) == 0:
+        return ""
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric(object):
+    """
+    ラベルの値ごとに値を保持するメトリクスの基底クラス。
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            name (str): メトリクス名。
+            help (str): メトリクスの説明。
+            label_names (Sequence[str], optional): ラベル名。デフォルトは()。
+
+        """
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.values: Dict[Tuple[str, ...], Any] = {}
+        self.lock = Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels.keys()) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} requires labels {self.label_names}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """出力するサンプル(メトリクス名、ラベル、値)を返す。"""
+        with self.lock:
+            items = list(self.values.items())
+        return [
+            (self.name, _format_labels(self.label_names, key), value)
+            for key, value in sorted(items)
+        ]
+
+    def render(self) -> str:
+        """Prometheusのテキスト形式で出力する。"""
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """
+    増加のみする値(回数、累計時間など)のメトリクス。
+    """
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        """値を増やす。"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: Any) -> None:
+        """他のクラスで集計している累計値をそのまま設定する。"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Gauge(Metric):
+    """
+    増減する現在値(キューの長さ、閾値など)のメトリクス。
+    """
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        """値を設定する。"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        """値を増やす。"""
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        """値を減らす。"""
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    値の分布(遅延など)をバケットごとの累積数で記録するメトリクス。
+    """
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            name (str): メトリクス名。
+            help (str): メトリクスの説明。
+            label_names (Sequence[str], optional): ラベル名。デフォルトは()。
+            buckets (Sequence[float], optional): バケットの上限値。デフォルトはDEFAULT_BUCKETS。
+
+        """
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """値を記録する。"""
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # バケットごとの数、合計、個数
+                state = [[0] * len(self.buckets), 0.0, 0]
+                self.values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self.lock:
+            items = [
+                (key, (list(state[0]), state[1], state[2]))
+                for key, state in self.values.items()
+            ]
+        result = []
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(
+                    self.label_names + ("le",), key + (_format_value(bound),)
+                )
+                result.append((f"{self.name}_bucket", labels, cumulative))
+            labels = _format_labels(self.label_names, key)
+            result.append((f"{self.name}_sum", labels, total))
+            result.append((f"{self.name}_count", labels, count))
+        return result
+
+
+class MetricsRegistry(object):
+    """
+    プロセス内のメトリクスを保持し、Prometheusのテキスト形式で出力するクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.lock = Lock()
+        self.metrics: Dict[str, Metric] = {}
+        # 出力の直前に呼び出し、他のクラスの状態からゲージなどを更新する関数
+        self.callbacks: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        """メトリクスを登録する。同じ名前のメトリクスが登録済みの場合はそれを返す。"""
+        with self.lock:
+            registered = self.metrics.get(metric.name)
+            if registered is not None:
+                if type(registered) is not type(metric):
+                    raise ValueError(f"{metric.name} is already registered")
+                return registered
+            self.metrics[metric.name] = metric
+        return metric
+
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """出力の直前に呼び出す関数を登録する。"""
+        with self.lock:
+            self.callbacks.append(callback)
+
+    def render(self) -> str:
+        """全てのメトリクスをPrometheusのテキスト形式で出力する。"""
+        with self.lock:
+            callbacks = list(self.callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except BaseException as e:
+                print(f"Metrics callback error: {e}")
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return "".join(metric.render() for metric in metrics)
+
+
+# プロセス内で共有するMetricsRegistry
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """プロセス内で共有するMetricsRegistryを返す。"""
+    return _registry
+
+
+def counter(name: str, help: str, label_names: Sequence[str] = ()) -> Counter:
+    """プロセス内で共有するCounterを登録して返す。"""
+    return _registry.register(Counter(name, help, label_names))  # type: ignore
+
+
+def gauge(name: str, help: str, label_names: Sequence[str] = ()) -> Gauge:
+    """プロセス内で共有するGaugeを登録して返す。"""
+    return _registry.register(Gauge(name, help, label_names))  # type: ignore
+
+
+def histogram(
+    name: str,
+    help: str,
+    label_names: Sequence[str] = (),
+    buckets: Sequence[float] = DEFAULT_BUCKETS,
+) -> Histogram:
+    """プロセス内で共有するHistogramを登録して返す。"""
+    return _registry.register(Histogram(name, help, label_names, buckets))  # type: ignore
+
+
+def add_callback(callback: Callable[[], None]) -> None:
+    """出力の直前に呼び出す関数を、プロセス内で共有するMetricsRegistryに登録する。"""
+    _registry.add_callback(callback)
+
+
+RPC_HANDLED = counter(
+    "grpc_server_handled_total",
+    "Number of RPCs completed on the server",
+    ["grpc_service", "grpc_method", "grpc_code"],
+)
+RPC_HANDLING_SECONDS = histogram(
+    "grpc_server_handling_seconds",
+    "Time to complete RPCs on the server, including streaming responses",
+    ["grpc_service", "grpc_method"],
+)
+CHANNEL_READY = gauge(
+    "grpc_client_channel_ready",
+    "1 if the shared client channel is connected",
+    ["target"],
+)
+CHANNEL_CONNECTS = counter(
+    "grpc_client_channel_connects_total",
+    "Number of times the shared client channel became ready",
+    ["target"],
+)
+CHANNEL_FAILURES = counter(
+    "grpc_client_channel_failures_total",
+    "Number of connection failures of the shared client channel",
+    ["target"],
+)
+
+
+def _collect_channel_stats() -> None:
+    for stats in channel_stats():
+        values = stats.to_dict()
+        target = values["target"]
+        CHANNEL_READY.set(1 if values["state"] == "READY" else 0, target=target)
+        CHANNEL_CONNECTS.set(values["num_connects"], target=target)
+        CHANNEL_FAILURES.set(values["num_failures"], target=target)
+
+
+add_callback(_collect_channel_stats)
+
+
+def _split_method(method: str) -> Tuple[str, str]:
+    # "/package.Service/Method"
+    parts = method.rsplit("/", 2)
+    if len(parts) < 3:
+        return "", method
+    return parts[1], parts[2]
+
+
+def _observe_rpc(method: str, code: str, elapsed: float) -> None:
+    service, name = _split_method(method)
+    RPC_HANDLED.inc(grpc_service=service, grpc_method=name, grpc_code=code)
+    RPC_HANDLING_SECONDS.observe(elapsed, grpc_service=service, grpc_method=name)
+
+
+def _error_code(e: BaseException) -> str:
+    if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+        return "CANCELLED"
+    return "UNKNOWN"
+
+
+def _wrap_behavior(
+    behavior: Callable[..., Any], method: str, response_streaming: bool
+) -> Callable[..., Any]:
+    """RPCの処理関数を、完了までの時間と結果を記録する関数で包む。
+    grpc.aioは関数の種類(コルーチン、非同期ジェネレータ、同期関数)で実行方法を決めるため、同じ種類の関数を返す。
+    """
+    if inspect.isasyncgenfunction(behavior):
+
+        async def wrapped_async_stream(request: Any, context: Any) -> Any:
+            start = time.perf_counter()
+            code = "OK"
+            try:
+                async for response in behavior(request, context):
+                    yield response
+            except BaseException as e:
+                code = _error_code(e)
+                raise
+            finally:
+                _observe_rpc(method, code, time.perf_counter() - start)
+
+        return wrapped_async_stream
+    if inspect.iscoroutinefunction(behavior):
+
+        async def wrapped_async(request: Any, context: Any) -> Any:
+            start = time.perf_counter()
+            code = "OK"
+            try:
+                return await behavior(request, context)
+            except BaseException as e:
+                code = _error_code(e)
+                raise
+            finally:
+                _observe_rpc(method, code, time.perf_counter() - start)
+
+        return wrapped_async
+    if response_streaming:
+
+        def wrapped_stream(request: Any, context: Any) -> Any:
+            start = time.perf_counter()
+            code = "OK"
+            try:
+                yield from behavior(request, context)
+            except BaseException as e:
+                code = _error_code(e)
+                raise
+            finally:
+                _observe_rpc(method, code, time.perf_counter() - start)
+
+        return wrapped_stream
+
+    def wrapped(request: Any, context: Any) -> Any:
+        start = time.perf_counter()
+        code = "OK"
+        try:
+            return behavior(request, context)
+        except BaseException as e:
+            code = _error_code(e)
+            raise
+        finally:
+            _observe_rpc(method, code, time.perf_counter() - start)
+
+    return wrapped
+
+
+def _wrap_handler(
+    handler: Optional[grpc.RpcMethodHandler], method: str
+) -> Optional[grpc.RpcMethodHandler]:
+    if handler is None:
+        return None
+    if handler.unary_unary is not None:
+        factory, behavior = grpc.unary_unary_rpc_method_handler, handler.unary_unary
+    elif handler.unary_stream is not None:
+        factory, behavior = grpc.unary_stream_rpc_method_handler, handler.unary_stream
+    elif handler.stream_unary is not None:
+        factory, behavior = grpc.stream_unary_rpc_method_handler, handler.stream_unary
+    else:
+        factory, behavior = (
+            grpc.stream_stream_rpc_method_handler,
+            handler.stream_stream,
+        )
+    return factory(
+        _wrap_behavior(behavior, method, handler.response_streaming),
+        request_deserializer=handler.request_deserializer,
+        response_serializer=handler.response_serializer,
+    )
+
+
+class MetricsServerInterceptor(grpc.ServerInterceptor):
+    """
+    RPCのメソッドごとの実行回数と完了までの時間を記録するgrpc.serverのインターセプタ。
+    """
+
+    def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], grpc.RpcMethodHandler],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> Optional[grpc.RpcMethodHandler]:
+        handler = continuation(handler_call_details)
+        return _wrap_handler(handler, handler_call_details.method)
+
+
+class AioMetricsServerInterceptor(grpc.aio.ServerInterceptor):
+    """
+    MetricsServerInterceptorのgrpc.aio版。
+    """
+
+    async def intercept_service(
+        self,
+        continuation: Callable[[grpc.HandlerCallDetails], Any],
+        handler_call_details: grpc.HandlerCallDetails,
+    ) -> Optional[grpc.RpcMethodHandler]:
+        handler = await continuation(handler_call_details)
+        return _wrap_handler(handler, handler_call_details.method)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = _registry
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ["/metrics", "/"]:
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # スクレイプのたびにアクセスログを表示しない
+        pass
+
+
+def start_metrics_server(
+    port: int, host: str = "127.0.0.1", registry: Optional[MetricsRegistry] = None
+) -> Optional[ThreadingHTTPServer]:
+    """メトリクスをPrometheusのテキスト形式で返すHTTPサーバをバックグラウンドで起動する。
+
+    Args:
+        port (int): HTTPサーバのポート。0以下の場合は起動しない。
+        host (str, optional): 待ち受けるアドレス。他のマシンのPrometheusから収集する場合は"0.0.0.0"などを指定する。デフォルトは"127.0.0.1"。
+        registry (Optional[MetricsRegistry], optional): 出力するMetricsRegistry。Noneの場合はプロセス内で共有するもの。
+
+    Returns:
+        Optional[ThreadingHTTPServer]: 起動したHTTPサーバ。起動しなかった場合はNone。
+
+    """
+    if port <= 0:
+        return None
+    handler = type(
+        "MetricsHandler",
+        (_MetricsHandler,),
+        {"registry": registry if registry is not None else _registry},
+    )
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        # メトリクスを出力できなくても、gRPCサーバは起動する
+        print(f"Failed to start metrics server on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"metrics server start. host: {host}, port: {port}")
+    return server
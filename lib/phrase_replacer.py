@@ -0,0 +1,194 @@
+import re
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 照合時に1つの空白にまとめる空白(連続する空白と、スペース以外の空白文字)
+COLLAPSIBLE_SPACE = re.compile(r"\s{2,}|[^\S ]")
+
+
+def is_word_char(char: str) -> bool:
+    """英単語を構成する文字(ASCIIのアルファベット)かを返す。"""
+    return ("a" <= char <= "z") or ("A" <= char <= "Z")
+
+
+def normalize_phrase(phrase: str) -> str:
+    """登録するフレーズを照合用に正規化する。小文字化し、連続する空白を1つにまとめる。"""
+    return " ".join(phrase.lower().split())
+
+
+def normalize_text(text: str) -> Tuple[str, Optional[List[int]]]:
+    """検索するテキストを、登録したフレーズと同じく小文字化し、連続する空白を1つにまとめる。
+
+    Args:
+        text (str): 検索対象のテキスト。
+
+    Returns:
+        Tuple[str, Optional[List[int]]]: 正規化したテキストと、その各文字の元のテキストでの位置(末尾にlen(text)を含む)。
+            空白をまとめなかった場合、位置は変わらないためNone。
+
+    """
+    lowered = lower_text(text)
+    if COLLAPSIBLE_SPACE.search(lowered) is None:
+        return lowered, None
+    chars: List[str] = []
+    offsets: List[int] = []
+    for pos, char in enumerate(lowered):
+        if char.isspace():
+            if len(chars) > 0 and chars[-1] == " ":
+                continue
+            char = " "
+        chars.append(char)
+        offsets.append(pos)
+    offsets.append(len(text))
+    return "".join(chars), offsets
+
+
+def lower_text(text: str) -> str:
+    """文字数を変えずにテキストを小文字化する。"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # 小文字化で文字数が変わる文字(例: "İ")はそのまま残し、位置がずれないようにする
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class PhraseReplacer(object):
+    """
+    Aho-Corasick法で単語・フレーズを一括置換するクラス。
+    大文字小文字を区別せず、最も左から始まる最長一致のフレーズを置換する。
+    """
+
+    def __init__(self, phrases: Dict[str, str]) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            phrases (Dict[str, str]): {置換前のフレーズ: 置換後の文字列}の辞書。
+
+        """
+        # 各ノードの遷移先、失敗遷移先、そのノードで終わるフレーズの(長さ, 置換後の文字列)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[Tuple[int, str]]] = [[]]
+        self.phrases: Dict[str, str] = {}
+        for phrase, replacement in phrases.items():
+            key = normalize_phrase(phrase)
+            if len(key) > 0:
+                self._add(key, replacement)
+        self._build()
+
+    def __len__(self) -> int:
+        """登録されているフレーズ数を返す。"""
+        return len(self.phrases)
+
+    def _add(self, key: str, replacement: str) -> None:
+        node = 0
+        for char in key:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][char] = next_node
+            node = next_node
+        # 同じフレーズが複数登録された場合は後のものを優先する
+        self.phrases[key] = replacement
+        self.output[node] = [(len(key), replacement)]
+
+    def _build(self) -> None:
+        # 根から幅優先で失敗遷移を設定する
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                fail = self.fail[node]
+                while fail > 0 and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_node] = fail
+                # 失敗遷移先で終わるフレーズ(接尾辞)も、このノードで一致したとみなす
+                self.output[next_node] = self.output[next_node] + self.output[fail]
+                queue.append(next_node)
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """テキスト中で置換対象となるフレーズを検索する。
+        英単語の途中から始まる、または途中で終わる一致は対象外とする。登録したフレーズと同じく、連続する空白やタブは1つの空白として照合する。
+
+        Args:
+            text (str): 検索対象のテキスト。
+
+        Returns:
+            List[Tuple[int, int, str]]: 重ならない一致の(開始位置, 終了位置, 置換後の文字列)のリスト。
+
+        """
+        if len(self.goto) == 1:
+            return []
+        lowered, offsets = normalize_text(text)
+        matches = self._find(lowered)
+        if offsets is None:
+            return matches
+        # 空白をまとめたテキストでの位置を、元のテキストでの位置に戻す
+        return [
+            (offsets[start], offsets[end - 1] + 1, replacement)
+            for start, end, replacement in matches
+        ]
+
+    def _find(self, lowered: str) -> List[Tuple[int, int, str]]:
+        # 開始位置ごとに最長の一致を保持する
+        longest: Dict[int, Tuple[int, str]] = {}
+        node = 0
+        for pos, char in enumerate(lowered):
+            while node > 0 and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            if not self.output[node]:
+                continue
+            end = pos + 1
+            if end < len(lowered) and is_word_char(char) and is_word_char(lowered[end]):
+                continue
+            for length, replacement in self.output[node]:
+                start = end - length
+                if (
+                    start > 0
+                    and is_word_char(lowered[start])
+                    and is_word_char(lowered[start - 1])
+                ):
+                    continue
+                if start not in longest or longest[start][0] < end:
+                    longest[start] = (end, replacement)
+        matches = []
+        last_end = 0
+        for start in sorted(longest):
+            if start < last_end:
+                continue
+            end, replacement = longest[start]
+            matches.append((start, end, replacement))
+            last_end = end
+        return matches
+
+    def replace(self, text: str, convert: Optional[Callable[[str], str]] = None) -> str:
+        """テキスト中のフレーズを置換して返す。
+
+        Args:
+            text (str): 置換対象のテキスト。
+            convert (Optional[Callable[[str], str]], optional): 置換されなかった部分に適用する変換関数。デフォルトはNone。
+
+        Returns:
+            str: 置換後のテキスト。
+
+        """
+        matches = self.find(text)
+        if not matches:
+            return convert(text) if convert is not None else text
+        parts = []
+        pos = 0
+        for start, end, replacement in matches:
+            if pos < start:
+                part = text[pos:start]
+                parts.append(convert(part) if convert is not None else part)
+            parts.append(replacement)
+            pos = end
+        if pos < len(text):
+            part = text[pos:]
+            parts.append(convert(part) if convert is not None else part)
+        return "".join(parts)
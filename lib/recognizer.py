@@ -0,0 +1,172 @@
+import json
+import os
+import time
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class RecognitionResult(object):
+    """
+    ストリーミング音声認識の途中結果または最終結果を保持するクラス。
+    """
+
+    def __init__(
+        self, transcript: str, is_final: bool = False, stability: float = 0.0
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            transcript (str): 認識されたテキスト。
+            is_final (bool, optional): 最終結果かどうか。デフォルトはFalse。
+            stability (float, optional): 途中結果が今後変化しない確からしさ(0.0~1.0)。デフォルトは0.0。
+
+        """
+        self.transcript = transcript
+        self.is_final = is_final
+        self.stability = stability
+
+
+class Recognizer(metaclass=ABCMeta):
+    """
+    ストリーミング音声認識のインターフェース。
+    MicrophoneStreamから音声データのイテレータを受け取り、認識結果を逐次返す。
+    Google Cloud Speech-to-Text以外の音声認識エンジンは、このクラスを継承して実装する。
+    """
+
+    @abstractmethod
+    def streaming_recognize(
+        self, audio: Iterable[bytes]
+    ) -> Iterator[RecognitionResult]:
+        """音声データをストリーミングで認識する。
+
+        Args:
+            audio (Iterable[bytes]): 16bitモノラルのPCMデータのイテレータ。発話が終了すると終端に達する。
+
+        Returns:
+            Iterator[RecognitionResult]: 認識結果のイテレータ。
+
+        """
+        ...
+
+
+class WavReplayRecognizer(Recognizer):
+    """
+    スクリプトに記述した認識結果を、受け取った音声の長さに合わせて返すRecognizer。
+    録音したWAVファイルを音声入力とすることで、ネットワークなしで音声認識以降の処理を再現できる。
+    """
+
+    def __init__(
+        self,
+        utterances: List[List[Dict[str, Any]]],
+        rate: int = 16000,
+        final_latency: float = 0.3,
+        loop: bool = False,
+        wav_path: Optional[str] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            utterances (List[List[Dict[str, Any]]]): 発話ごとの認識結果のリスト。
+                各認識結果は"transcript"、"is_final"、"stability"、"time"を持つ辞書。
+                "time"は送信開始からの音声の長さ[sec]で、その長さの音声を受け取った時点で結果を返す。
+                "time"がない結果は、音声の終端からfinal_latency秒後に返す。
+            rate (int, optional): 音声のサンプリングレート。デフォルトは16000。
+            final_latency (float, optional): 音声の終端から残りの結果を返すまでの時間[sec]。デフォルトは0.3。
+            loop (bool, optional): 全ての発話を返した後、先頭から繰り返すかどうか。デフォルトはFalse。
+            wav_path (Optional[str], optional): 認識結果に対応する音声のWAVファイルのパス。デフォルトはNone。
+
+        """
+        self.utterances: List[List[Tuple[Optional[float], RecognitionResult]]] = []
+        for results in utterances:
+            self.utterances.append(
+                [
+                    (
+                        result.get("time"),
+                        RecognitionResult(
+                            result.get("transcript", ""),
+                            result.get("is_final", False),
+                            result.get("stability", 0.0),
+                        ),
+                    )
+                    for result in results
+                ]
+            )
+        self.bytes_per_sec = int(rate) * 2
+        self.final_latency = final_latency
+        self.loop = loop
+        self.wav_path = wav_path
+        self.index = 0
+        # 直近の発話で、音声を受け取り始めた時刻と、音声の終端に達した時刻
+        self.audio_start_time: Optional[float] = None
+        self.audio_end_time: Optional[float] = None
+
+    def next_utterance(self) -> List[Tuple[Optional[float], RecognitionResult]]:
+        """次の発話の認識結果を返す。全て返し終えた場合は空のリストを返す。"""
+        if self.index >= len(self.utterances):
+            if not self.loop or len(self.utterances) == 0:
+                return []
+            self.index = 0
+        results = self.utterances[self.index]
+        self.index += 1
+        return results
+
+    def streaming_recognize(
+        self, audio: Iterable[bytes]
+    ) -> Iterator[RecognitionResult]:
+        self.audio_start_time = None
+        self.audio_end_time = None
+        results = None
+        received = 0.0
+        index = 0
+        for chunk in audio:
+            # 音声が1度も届かなかった(発話が始まらなかった)場合は発話を消費しない
+            if results is None:
+                results = self.next_utterance()
+                self.audio_start_time = time.time()
+            received += len(chunk) / self.bytes_per_sec
+            while index < len(results):
+                result_time = results[index][0]
+                if result_time is None or result_time > received:
+                    break
+                yield results[index][1]
+                index += 1
+        self.audio_end_time = time.time()
+        if results is None or index >= len(results):
+            return
+        # 音声の終端から最終結果が返るまでの認識の遅延を再現する
+        time.sleep(self.final_latency)
+        for _, result in results[index:]:
+            yield result
+
+
+def load_replay_script(
+    path: str, rate: int = 16000, loop: bool = False
+) -> WavReplayRecognizer:
+    """スクリプト(json)を読み込み、WavReplayRecognizerを作成する。
+
+    スクリプトの形式は下記の通り。"wav"はスクリプトからの相対パスでもよい。
+    {"wav": "session.wav", "final_latency": 0.3,
+     "utterances": [[{"time": 0.5, "transcript": "こんに", "stability": 0.3},
+                     {"transcript": "こんにちは", "is_final": true}], ...]}
+
+    Args:
+        path (str): スクリプトのパス。
+        rate (int, optional): 音声のサンプリングレート。デフォルトは16000。
+        loop (bool, optional): 全ての発話を返した後、先頭から繰り返すかどうか。デフォルトはFalse。
+
+    Returns:
+        WavReplayRecognizer: 作成したRecognizer。
+
+    """
+    with open(path, mode="r") as f:
+        script = json.load(f)
+    wav_path = script.get("wav")
+    if wav_path is not None and not os.path.isabs(wav_path):
+        wav_path = os.path.join(os.path.dirname(os.path.abspath(path)), wav_path)
+    return WavReplayRecognizer(
+        script.get("utterances", []),
+        rate=rate,
+        final_latency=script.get("final_latency", 0.3),
+        loop=loop,
+        wav_path=wav_path,
+    )
@@ -0,0 +1,174 @@
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from threading import Condition, Lock, Thread
+from typing import Iterable, Iterator, List, Optional
+
+
+def normalize_transcript(text: str) -> str:
+    """音声認識の結果を比較用に正規化する。全角半角を統一し、空白と句読点・記号を除いて小文字化する。"""
+    text = unicodedata.normalize("NFKC", text)
+    return "".join(
+        c.lower() for c in text if unicodedata.category(c)[0] not in ("P", "Z", "S")
+    )
+
+
+# 途中結果の後に付いても発話の意味が変わらない文末の助詞
+TRAILING_PARTICLES = "ねよかなわさのぞぜ"
+
+
+def is_same_transcript(speculated: str, final: str, similarity: float = 0.95) -> bool:
+    """先行生成に使った音声認識の途中結果と最終結果が、同じ発話とみなせるかを返す。
+    正規化後に一致する場合と、最終結果が途中結果に文末の助詞を付け足しただけの場合は同じとみなす。
+    最終結果に途中結果にない内容が増えている場合(否定の追加など)は、類似度に関わらず同じとみなさない。
+
+    Args:
+        speculated (str): 先行生成に使用した音声認識の途中結果。
+        final (str): 音声認識の最終結果。
+        similarity (float, optional): 内容が増えていない場合に、正規化後の文字列の類似度がこの値以上であれば同じとみなす。デフォルトは0.95。
+
+    Returns:
+        bool: 同じ発話とみなせる場合はTrue。
+
+    """
+    speculated = normalize_transcript(speculated)
+    final = normalize_transcript(final)
+    if speculated == final:
+        return True
+    if len(speculated) == 0 or len(final) == 0:
+        return False
+    if final.startswith(speculated):
+        rest = final[len(speculated) :]
+        return len(rest) <= 2 and all(c in TRAILING_PARTICLES for c in rest)
+    matcher = SequenceMatcher(None, speculated, final)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        # 最終結果にだけある文字が増えている場合は、別の発話とみなす
+        if tag == "insert" or (tag == "replace" and j2 - j1 > i2 - i1):
+            return False
+    return matcher.ratio() >= similarity
+
+
+class SpeculativeResponse(object):
+    """
+    音声認識の途中結果から先行して生成した応答を保持するクラス。
+    生成はスレッドで行い、生成した文はcommit(iter_sentences)されるまでバッファに溜める。
+    """
+
+    def __init__(self, text: str, sentences: Iterable[str]) -> None:
+        """クラスの初期化メソッド。生成をすぐに開始する。
+
+        Args:
+            text (str): 先行生成に使用した音声認識の途中結果。
+            sentences (Iterable[str]): 応答を文ごとに返すイテレータ。スレッド内で取り出す。cancel()を持つ場合(GenerationHandle)は中断時に呼び出す。
+
+        """
+        self.text = text
+        self.source = sentences
+        self.sentences: List[str] = []
+        self.start_time = time.time()
+        self.first_sentence_time: Optional[float] = None
+        self.is_done = False
+        self.is_cancelled = False
+        self.condition = Condition()
+        self.thread = Thread(target=self._run, args=(sentences,), daemon=True)
+        self.thread.start()
+
+    def _run(self, sentences: Iterable[str]) -> None:
+        try:
+            for sentence in sentences:
+                if self.is_cancelled:
+                    break
+                with self.condition:
+                    if self.first_sentence_time is None:
+                        self.first_sentence_time = time.time()
+                    self.sentences.append(sentence)
+                    self.condition.notify_all()
+        except BaseException as e:
+            print(f"Speculative generation error: {e}")
+        finally:
+            # 中断した場合もストリームを閉じて生成を止める
+            close = getattr(sentences, "close", None)
+            if close is not None:
+                close()
+            with self.condition:
+                self.is_done = True
+                self.condition.notify_all()
+
+    def cancel(self) -> None:
+        """生成を中断する。"""
+        with self.condition:
+            self.is_cancelled = True
+            self.condition.notify_all()
+        # プロバイダのストリームを閉じ、受信中の文を待たずに停止する
+        cancel = getattr(self.source, "cancel", None)
+        if cancel is not None:
+            cancel()
+
+    def iter_sentences(self) -> Iterator[str]:
+        """生成済みの文を返し、生成が終わるまで続きの文を待って返す。
+
+        Yields:
+            str: 生成した文。
+        """
+        index = 0
+        while True:
+            with self.condition:
+                while (
+                    index >= len(self.sentences)
+                    and not self.is_done
+                    and not self.is_cancelled
+                ):
+                    self.condition.wait()
+                if index >= len(self.sentences):
+                    return
+                sentence = self.sentences[index]
+            index += 1
+            yield sentence
+
+
+class SpeculationStats(object):
+    """
+    最終応答の先行生成の的中率と、短縮できた遅延を記録するクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        # 採用した応答で短縮できた遅延の合計[sec]。平均のみを出力するため、個々の値は保持しない
+        self.total_saved_latency = 0.0
+
+    def record_hit(self, saved_latency: float) -> None:
+        """先行生成した応答を採用したことを記録する。
+
+        Args:
+            saved_latency (float): 最終結果の受信から生成を開始した場合と比べて、最初の文を早く得られた時間[sec]。
+
+        """
+        with self.lock:
+            self.hits += 1
+            self.total_saved_latency += saved_latency
+
+    def record_miss(self) -> None:
+        """先行生成した応答が最終結果と一致せず、破棄したことを記録する。"""
+        with self.lock:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """先行生成した応答を採用した割合。"""
+        with self.lock:
+            total = self.hits + self.misses
+            return self.hits / total if total > 0 else 0.0
+
+    def summary(self) -> str:
+        """記録した結果の概要を返す。"""
+        with self.lock:
+            total = self.hits + self.misses
+            saved = self.total_saved_latency / self.hits if self.hits > 0 else 0.0
+            rate = self.hits / total * 100 if total > 0 else 0.0
+            return (
+                f"Speculation hit rate: {self.hits}/{total} ({rate:.0f}%), "
+                f"mean saved latency: {saved * 1000:.0f}ms"
+            )
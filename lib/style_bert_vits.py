@@ -1,8 +1,11 @@
 import json
-from typing import Optional
+import time
+from threading import Lock
+from typing import Dict, Generator, List, Optional, Union
 from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 
+from lib.audio_io import AudioSink
 from lib.text_to_voice import TextToVoice
 
 
@@ -17,6 +20,7 @@ class TextToStyleBertVits(TextToVoice):
         port: str = "5000",
         motion_host: Optional[str] = "127.0.0.1",
         motion_port: Optional[str] = "50055",
+        audio_sink: Optional[AudioSink] = None,
     ) -> None:
         """クラスの初期化メソッド。
         Args:
@@ -24,17 +28,62 @@ class TextToStyleBertVits(TextToVoice):
             port (str, optional): Style-Bert-VITS2サーバーのポート番号。デフォルトは"5000"。
             motion_host (str, optional): モーションサーバーのホスト名。デフォルトは"127.0.0.1"。
             motion_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            audio_sink (AudioSink, optional): 音声の出力先。Noneの場合はPyAudioの出力デバイス。
 
         """
-        super().__init__(host, port, motion_host, motion_port)
+        super().__init__(host, port, motion_host, motion_port, audio_sink)
         self.model_id = 0
         self.length = 1.0
         self.style = "Neutral"
         self.style_weight = 1.0
+        self.STREAM_CHUNK_SIZE = 4096  # 音声データを受信しながら再生する際のチャンクサイズ
+        self.MODEL_INFO_TTL = 300.0  # モデル情報を再取得するまでの時間[s]
+        self.model_info_lock = Lock()
+        self.model_info_time = 0.0  # モデル情報を最後に取得した時刻
+        # モデル番号は/models/infoのキー(文字列)で保持する
+        self.model_id_by_name: Dict[str, str] = {}  # モデル名→モデル番号
+        self.model_name_by_id: Dict[str, str] = {}  # モデル番号→モデル名
+        self.styles_by_id: Dict[str, List[str]] = {}  # モデル番号→スタイル名リスト
         # 話者モデル名を指定
         self.set_param(model_name="jvnv-F1-jp")
 
-    def get_model_id_from_name(self, model_name: str) -> int:
+    def fetch_model_info(self) -> None:
+        """
+        Style-Bert-VITS2サーバーからモデル情報を取得し、モデル名、モデル番号、スタイル名で索引を作成する。
+        """
+        headers = {"accept": "application/json"}
+        address = "http://" + self.host + ":" + self.port + "/models/info"
+        # GETリクエストを作成
+        req = Request(address, headers=headers, method="GET")
+        with urlopen(req) as res:
+            model_info_json = json.loads(res.read())
+        model_id_by_name = {}
+        model_name_by_id = {}
+        styles_by_id = {}
+        for key, details in model_info_json.items():
+            model_id = str(key)
+            model_name = details["id2spk"]["0"]
+            model_id_by_name[model_name] = model_id
+            model_name_by_id[model_id] = model_name
+            styles_by_id[model_id] = list(details.get("style2id", {}).keys())
+        with self.model_info_lock:
+            self.model_id_by_name = model_id_by_name
+            self.model_name_by_id = model_name_by_id
+            self.styles_by_id = styles_by_id
+            self.model_info_time = time.time()
+
+    def update_model_info(self, force: bool = False) -> None:
+        """
+        モデル情報が未取得、もしくはMODEL_INFO_TTLを経過している場合にモデル情報を再取得する。
+
+        Args:
+            force (bool, optional): TTLに関わらず再取得するかどうか。デフォルトはFalse。
+
+        """
+        if force or time.time() - self.model_info_time > self.MODEL_INFO_TTL:
+            self.fetch_model_info()
+
+    def get_model_id_from_name(self, model_name: str) -> str:
         """
         モデル名からモデル番号を取得する。
 
@@ -42,20 +91,35 @@ class TextToStyleBertVits(TextToVoice):
             model_name (str): モデル名。
 
         Returns:
-            int: モデル番号。
+            str: モデル番号(/models/infoのキー)。
 
         """
-        headers = {"accept": "application/json"}
-        address = "http://" + self.host + ":" + self.port + "/models/info"
-        # GETリクエストを作成
-        req = Request(address, headers=headers, method="GET")
-        with urlopen(req) as res:
-            model_info = res.read()
-            model_info_json = json.loads(model_info)
-            for key, details in model_info_json.items():
-                if model_name == details["id2spk"]["0"]:
-                    return key
-        raise ValueError("Model name not found")
+        self.update_model_info()
+        if model_name not in self.model_id_by_name:
+            # サーバー側にモデルが追加されている可能性があるため、一度だけ再取得する
+            self.update_model_info(force=True)
+        if model_name not in self.model_id_by_name:
+            raise ValueError(f"Model name {model_name} not found")
+        return self.model_id_by_name[model_name]
+
+    def get_styles(self, model_id: Union[int, str]) -> List[str]:
+        """
+        モデル番号から使用可能なスタイル名のリストを取得する。
+
+        Args:
+            model_id (Union[int, str]): モデル番号。
+
+        Returns:
+            List[str]: スタイル名のリスト。
+
+        """
+        model_id = str(model_id)
+        self.update_model_info()
+        if model_id not in self.styles_by_id:
+            self.update_model_info(force=True)
+        if model_id not in self.styles_by_id:
+            raise ValueError(f"Model id {model_id} not found")
+        return self.styles_by_id[model_id]
 
     def set_param(
         self,
@@ -76,14 +140,29 @@ class TextToStyleBertVits(TextToVoice):
             style_weight (float, optional): 音声の感情スタイルの重み。値が大きいほど感情の影響が大きくなる。デフォルトはNone。
 
         """
+        # 合成リクエストを送る前に、モデルとスタイルの組み合わせを検証する
+        new_model_id = self.model_id
         if model_name is not None:
-            self.model_id = self.get_model_id_from_name(model_name)
+            new_model_id = self.get_model_id_from_name(model_name)
         elif model_id is not None:
-            self.model_id = model_id
+            new_model_id = model_id
+        new_style = self.style
+        # モデル番号が変わらない場合(初期値と同じ番号のモデルを指定した場合など)も、指定されたモデルとスタイルを検証する
+        if style is not None or model_name is not None or model_id is not None:
+            styles = self.get_styles(new_model_id)
+            if style is not None:
+                if style not in styles:
+                    raise ValueError(
+                        f"Style {style} is not available. Available styles: {styles}"
+                    )
+                new_style = style
+            elif new_style not in styles and len(styles) > 0:
+                print(f"Style {new_style} is not available. Set style to {styles[0]}")
+                new_style = styles[0]
+        self.model_id = new_model_id
+        self.style = new_style
         if length is not None:
             self.length = length
-        if style is not None:
-            self.style = style
         if style_weight is not None:
             self.style_weight = style_weight
 
@@ -119,13 +198,43 @@ class TextToStyleBertVits(TextToVoice):
         with urlopen(req) as res:
             return res.read()
 
+    def post_synthesis_stream(
+        self,
+        text: str,
+    ) -> Generator[bytes, None, None]:
+        """
+        Style-Bert-VITS2サーバーに音声合成要求を送信し、合成された音声データを受信しながら順次返す。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+
+        Yields:
+            bytes: 受信した音声データのチャンク。
+
+        """
+        headers = {"accept": "audio/wav"}
+        params = {
+            "text": text,
+            "model_id": self.model_id,
+            "length": self.length,
+            "style": self.style,
+            "style_weight": self.style_weight,
+        }
+        address = (
+            "http://" + self.host + ":" + self.port + "/voice" + "?" + urlencode(params)
+        )
+        req = Request(address, headers=headers, method="GET")
+        with urlopen(req) as res:
+            while chunk := res.read(self.STREAM_CHUNK_SIZE):
+                yield chunk
+
     def text_to_voice(self, text: str) -> None:
         """
         テキストから音声を合成して再生する。
         Args:
             text (str): 音声合成対象のテキスト。
         """
-        wav = self.post_synthesis(text)
-        if wav is not None:
-            print(f"[Play] {text}")
-            self.play_wav(wav)
+        if len(text.strip()) <= 0:
+            return
+        print(f"[Play] {text}")
+        self.play_wav_stream(self.post_synthesis_stream(text))
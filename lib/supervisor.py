@@ -0,0 +1,399 @@
+import importlib
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+
+def probe_port(host: str, port: str, timeout: float = 0.2) -> bool:
+    """ポートに接続できるかどうかを返す。
+
+    Supervisorはforkする前のプロセスでgRPCのチャンネルを作成しないよう、gRPCではなくTCPの接続で確認する。
+    gRPCのサーバはserver.start()の時点でポートを待ち受けるため、接続できればRPCを受け付けられる。
+
+    Args:
+        host (str): 接続先のホスト。
+        port (str): 接続先のポート。
+        timeout (float, optional): 接続を待つ最大時間[sec]。デフォルトは0.2。
+
+    Returns:
+        bool: 接続できた場合はTrue。
+
+    """
+    try:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def preload_modules(modules: List[str]) -> List[str]:
+    """モジュールを読み込む。forkで起動するコンポーネントは、読み込み済みのモジュールを引き継ぐ。
+
+    Args:
+        modules (List[str]): 読み込むモジュール名。
+
+    Returns:
+        List[str]: 読み込めたモジュール名。
+
+    """
+    loaded = []
+    for module in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module)
+        except BaseException as e:
+            # 読み込めないモジュールはコンポーネントの起動時に改めて読み込み、エラーを表示する
+            print(f"Failed to preload {module}: {e}")
+            continue
+        loaded.append(module)
+        print(f"Preloaded {module} ({(time.perf_counter() - start) * 1000:.0f}ms)")
+    return loaded
+
+
+def _exit_code(status: int) -> int:
+    """os.waitpidの終了ステータスを、subprocess.Popen.returncodeと同じ形式に変換する。"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ForkedProcess(object):
+    """
+    Supervisorのプロセスをforkし、子プロセスでモジュールのmain()を実行するクラス。
+    subprocess.Popenと同じpoll、terminate、kill、waitを持つ。
+    """
+
+    def __init__(
+        self, module: str, args: List[str], log_path: Optional[str] = None
+    ) -> None:
+        """クラスの初期化メソッド。子プロセスを起動する。
+
+        Args:
+            module (str): main()を実行するモジュール名。
+            args (List[str]): main()に渡すコマンドライン引数(sys.argv[1:])。
+            log_path (Optional[str], optional): 標準出力と標準エラー出力を追記するファイルのパス。Noneの場合は親プロセスと同じ出力に書き込む。
+
+        """
+        self.returncode: Optional[int] = None
+        sys.stdout.flush()
+        sys.stderr.flush()
+        self.pid = os.fork()
+        if self.pid == 0:
+            self._run_child(module, args, log_path)
+
+    def _run_child(self, module: str, args: List[str], log_path: Optional[str]) -> None:
+        code = 1
+        try:
+            # Supervisorのシグナルハンドラを解除し、単独で起動した場合と同じ終了処理にする
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            if log_path is not None:
+                fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                os.dup2(fd, 1)
+                os.dup2(fd, 2)
+                os.close(fd)
+            sys.argv = [module + ".py"] + args
+            importlib.import_module(module).main()
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code)
+        except KeyboardInterrupt:
+            code = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # 親プロセスから引き継いだ終了処理(atexit等)を実行しないよう、直ちに終了する
+            os._exit(code)
+
+    def poll(self) -> Optional[int]:
+        """子プロセスが終了していれば終了コードを、実行中であればNoneを返す。"""
+        if self.returncode is not None:
+            return self.returncode
+        try:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+        except ChildProcessError:
+            self.returncode = 1
+            return self.returncode
+        if pid == 0:
+            return None
+        self.returncode = _exit_code(status)
+        return self.returncode
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[int]:
+        """子プロセスの終了を待ち、終了コードを返す。timeoutまでに終了しない場合はNoneを返す。"""
+        start = time.time()
+        while self.poll() is None:
+            if timeout is not None and time.time() - start > timeout:
+                return None
+            time.sleep(0.05)
+        return self.returncode
+
+    def send_signal(self, sig: int) -> None:
+        if self.poll() is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class Component(object):
+    """
+    Supervisorで起動するコンポーネント(voice_server、gpt_publisher、speech_publisherなど)の設定。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        module: Optional[str] = None,
+        args: Optional[List[str]] = None,
+        command: Optional[List[str]] = None,
+        cwd: Optional[str] = None,
+        ready_port: Optional[str] = None,
+        ready_host: str = "127.0.0.1",
+        depends_on: Optional[List[str]] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            name (str): コンポーネント名。
+            module (Optional[str], optional): main()を実行するモジュール名。commandを指定しない場合は必須。
+            args (Optional[List[str]], optional): moduleのmain()に渡すコマンドライン引数。
+            command (Optional[List[str]], optional): moduleの代わりに実行するコマンド。別のvenvのサーバ(akari_motion_serverなど)に使用する。
+            cwd (Optional[str], optional): commandを実行するディレクトリ。Noneの場合はSupervisorと同じ。
+            ready_port (Optional[str], optional): 起動完了を判定するポート。Noneの場合は起動した時点で起動完了とする。
+            ready_host (str, optional): 起動完了を判定するホスト。デフォルトは"127.0.0.1"。
+            depends_on (Optional[List[str]], optional): 起動完了を待ってから起動するコンポーネント名。
+
+        """
+        if module is None and command is None:
+            raise ValueError(f"{name}: module or command is required")
+        self.name = name
+        self.module = module
+        self.args = args if args is not None else []
+        self.command = command
+        self.cwd = cwd
+        self.ready_port = ready_port
+        self.ready_host = ready_host
+        self.depends_on = depends_on if depends_on is not None else []
+
+    def is_ready(self) -> bool:
+        """起動完了しているかどうかを返す。"""
+        if self.ready_port is None:
+            return True
+        return probe_port(self.ready_host, self.ready_port)
+
+
+class _ComponentState(object):
+    """Supervisorが管理する、コンポーネントのプロセスと再起動の状態。"""
+
+    def __init__(self, component: Component) -> None:
+        self.component = component
+        self.process: Optional[Any] = None
+        self.start_time = 0.0
+        self.is_ready = False
+        # 連続して異常終了した回数。再起動までの待ち時間を決める
+        self.failures = 0
+        self.num_restarts = 0
+        # 次に起動する時刻。Noneの場合は依存先の起動完了を待って起動する
+        self.next_start: Optional[float] = None
+        self.has_started = False
+
+
+class Supervisor(object):
+    """
+    コンポーネントを子プロセスとして起動し、監視するクラス。
+    依存先のコンポーネントの起動完了(ポートへの接続)を待ってから起動し、終了したコンポーネントは待ち時間を倍にしながら再起動する。
+    start_methodが"fork"の場合は、preload_modulesで読み込んだモジュールを引き継いだ子プロセスでmain()を実行するため、
+    各コンポーネントがPythonの起動と共通のモジュールの読み込みを繰り返さない。
+    """
+
+    def __init__(
+        self,
+        components: List[Component],
+        start_method: str = "fork",
+        log_dir: Optional[str] = None,
+        ready_timeout: float = 60.0,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+        stable_time: float = 60.0,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            components (List[Component]): 起動するコンポーネント。
+            start_method (str, optional): moduleのコンポーネントの起動方法。"fork"(Supervisorのプロセスをfork)または"spawn"(新しいPythonのプロセス)。デフォルトは"fork"。
+            log_dir (Optional[str], optional): コンポーネントごとの出力を"{コンポーネント名}.log"に追記するディレクトリ。Noneの場合はSupervisorと同じ出力に書き込む。
+            ready_timeout (float, optional): 起動してから起動完了までを待つ最大時間[sec]。超えた場合は終了させて再起動する。デフォルトは60。
+            backoff_initial (float, optional): 最初の再起動までの待ち時間[sec]。デフォルトは1。
+            backoff_max (float, optional): 再起動までの待ち時間の上限[sec]。デフォルトは30。
+            stable_time (float, optional): この時間[sec]以上動作してから終了した場合は、再起動までの待ち時間を最初の値に戻す。デフォルトは60。
+
+        """
+        names = [component.name for component in components]
+        for component in components:
+            for name in component.depends_on:
+                if name not in names:
+                    raise ValueError(f"{component.name} depends on unknown {name}")
+        if start_method == "fork" and not hasattr(os, "fork"):
+            raise ValueError("fork is not supported on this platform")
+        self.states: Dict[str, _ComponentState] = {
+            component.name: _ComponentState(component) for component in components
+        }
+        self.start_method = start_method
+        self.log_dir = log_dir
+        self.ready_timeout = ready_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_time = stable_time
+        self.is_stopping = False
+        if log_dir is not None:
+            os.makedirs(log_dir, exist_ok=True)
+
+    def _log_path(self, component: Component) -> Optional[str]:
+        if self.log_dir is None:
+            return None
+        return os.path.join(self.log_dir, component.name + ".log")
+
+    def _spawn(self, component: Component) -> Any:
+        log_path = self._log_path(component)
+        if component.command is None and self.start_method == "fork":
+            return ForkedProcess(component.module, component.args, log_path)
+        if component.command is not None:
+            command = component.command
+        else:
+            command = [sys.executable, component.module + ".py"] + component.args
+        if log_path is None:
+            return subprocess.Popen(command, cwd=component.cwd)
+        with open(log_path, "ab") as f:
+            return subprocess.Popen(
+                command, cwd=component.cwd, stdout=f, stderr=subprocess.STDOUT
+            )
+
+    def _start(self, state: _ComponentState) -> None:
+        component = state.component
+        try:
+            state.process = self._spawn(component)
+        except BaseException as e:
+            print(f"[supervisor] Failed to start {component.name}: {e}")
+            self._schedule_restart(state)
+            return
+        state.start_time = time.time()
+        state.is_ready = False
+        state.next_start = None
+        if state.has_started:
+            state.num_restarts += 1
+        state.has_started = True
+        print(
+            f"[supervisor] Start {component.name} "
+            f"(pid: {state.process.pid}, restarts: {state.num_restarts})"
+        )
+
+    def _schedule_restart(self, state: _ComponentState) -> None:
+        if state.start_time > 0 and time.time() - state.start_time >= self.stable_time:
+            state.failures = 0
+        delay = min(self.backoff_initial * 2**state.failures, self.backoff_max)
+        state.failures += 1
+        state.process = None
+        state.is_ready = False
+        state.next_start = time.time() + delay
+        print(f"[supervisor] Restart {state.component.name} in {delay:.1f}s")
+
+    def _deps_ready(self, state: _ComponentState) -> bool:
+        return all(self.states[name].is_ready for name in state.component.depends_on)
+
+    def step(self) -> None:
+        """コンポーネントの状態を1回確認し、起動、起動完了の判定、再起動を行う。"""
+        now = time.time()
+        for state in self.states.values():
+            component = state.component
+            if state.process is None:
+                if self.is_stopping:
+                    continue
+                if state.next_start is not None:
+                    # 再起動は依存先の状態によらず行う。依存先への再接続は各コンポーネントのgRPCのチャンネルが行う
+                    if now >= state.next_start:
+                        self._start(state)
+                elif self._deps_ready(state):
+                    self._start(state)
+                continue
+            code = state.process.poll()
+            if code is not None:
+                if self.is_stopping:
+                    continue
+                print(f"[supervisor] {component.name} exited with code {code}")
+                self._schedule_restart(state)
+                continue
+            if state.is_ready:
+                continue
+            if component.is_ready():
+                state.is_ready = True
+                print(
+                    f"[supervisor] {component.name} is ready "
+                    f"({now - state.start_time:.2f}s)"
+                )
+            elif now - state.start_time > self.ready_timeout:
+                print(
+                    f"[supervisor] {component.name} is not ready "
+                    f"in {self.ready_timeout:.0f}s"
+                )
+                self._stop_process(state)
+                self._schedule_restart(state)
+
+    def _stop_process(self, state: _ComponentState, timeout: float = 5.0) -> None:
+        process = state.process
+        if process is None or process.poll() is not None:
+            return
+        process.terminate()
+        try:
+            if process.wait(timeout=timeout) is not None:
+                return
+        except subprocess.TimeoutExpired:
+            pass
+        print(f"[supervisor] Kill {state.component.name}")
+        process.kill()
+        process.wait()
+
+    def stop(self) -> None:
+        """全てのコンポーネントを、起動と逆の順に終了させる。"""
+        self.is_stopping = True
+        for state in reversed(list(self.states.values())):
+            self._stop_process(state)
+            state.process = None
+
+    def _handle_signal(self, signum: int, frame: Any) -> None:
+        raise KeyboardInterrupt
+
+    def run(self, interval: float = 0.1) -> None:
+        """SIGINTまたはSIGTERMを受信するまで、コンポーネントを起動して監視する。
+
+        Args:
+            interval (float, optional): 状態を確認する間隔[sec]。デフォルトは0.1。
+
+        """
+        signal.signal(signal.SIGTERM, self._handle_signal)
+        try:
+            while True:
+                self.step()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("[supervisor] Stopping")
+        finally:
+            self.stop()
@@ -0,0 +1,124 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Event, Thread
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from .en_to_jp import EnToJp
+
+
+class TextNormalizer(object):
+    """
+    音声合成用にテキストを正規化(英単語のかな変換)するクラス。
+    変換はワーカースレッドで行い、音声合成の処理と並行して実行できる。
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        alkana: bool = True,
+        japanglish: bool = True,
+        inference: bool = True,
+    ) -> None:
+        """クラスの初期化メソッド。
+        EnToJpは辞書の読み込みに時間がかかるため、バックグラウンドで初期化する。
+
+        Args:
+            max_workers (int, optional): 変換を行うワーカースレッド数。デフォルトは1。
+            alkana (bool, optional): alkanaで変換するかのフラグ。デフォルトはTrue。
+            japanglish (bool, optional): japanglishで変換するかのフラグ。デフォルトはTrue。
+            inference (bool, optional): 変換できない場合に推論変換するかのフラグ。デフォルトはTrue。
+
+        """
+        self.alkana = alkana
+        self.japanglish = japanglish
+        self.inference = inference
+        self.en_to_jp: Optional["EnToJp"] = None
+        self.ready = Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.load_thread = Thread(target=self.load_en_to_jp, daemon=True)
+        self.load_thread.start()
+
+    def load_en_to_jp(self) -> None:
+        """EnToJpを初期化し、変換を1回実行して辞書を読み込んだ状態にする。"""
+        try:
+            from .en_to_jp import EnToJp
+
+            en_to_jp = EnToJp()
+            en_to_jp.text_to_kana("warm up", True, True, True)
+            self.en_to_jp = en_to_jp
+        except BaseException as e:
+            print(f"Failed to load EnToJp: {e}")
+        self.ready.set()
+
+    def is_ready(self) -> bool:
+        """
+        英単語のかな変換が使用可能かを返す。
+
+        Returns:
+            bool: EnToJpの初期化が完了していればTrue。
+
+        """
+        return self.ready.is_set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        EnToJpの初期化完了を待つ。
+
+        Args:
+            timeout (Optional[float], optional): 待機する最大時間[sec]。Noneの場合は完了まで待つ。
+
+        Returns:
+            bool: 初期化が完了した場合はTrue。タイムアウトした場合はFalse。
+
+        """
+        return self.ready.wait(timeout)
+
+    def normalize(self, text: str) -> str:
+        """
+        テキストを正規化して返す。変換に失敗した場合は元のテキストを返す。
+
+        Args:
+            text (str): 変換対象のテキスト。
+
+        Returns:
+            str: textに含まれる英語を極力かな変換したテキスト。
+
+        """
+        self.wait_ready()
+        if self.en_to_jp is None:
+            return text
+        try:
+            return self.en_to_jp.text_to_kana(
+                text, self.alkana, self.japanglish, self.inference
+            )
+        except BaseException as e:
+            print(f"Failed to normalize text: {e}")
+            return text
+
+    def submit(self, text: str) -> "Future[str]":
+        """
+        テキストの正規化をワーカースレッドで開始する。
+
+        Args:
+            text (str): 変換対象のテキスト。
+
+        Returns:
+            Future[str]: 正規化したテキストを返すFuture。
+
+        """
+        return self.executor.submit(self.normalize, text)
+
+
+def completed_future(text: str) -> "Future[str]":
+    """正規化済みのテキストを、完了済みのFutureとして返す。
+
+    Args:
+        text (str): 正規化済みのテキスト。
+
+    Returns:
+        Future[str]: textを結果に持つFuture。
+
+    """
+    future: Future = Future()
+    future.set_result(text)
+    return future
@@ -1,24 +1,43 @@
-import io
 import os
 import sys
 import time
-import wave
 from abc import ABCMeta, abstractmethod
+from concurrent.futures import Future
 from queue import Queue
 from threading import Event, Thread
-from typing import Any, Optional
+from typing import Any, Iterable, Optional
+from weakref import WeakKeyDictionary
 
-import grpc
 import numpy as np
-import pyaudio
-from lib.en_to_jp import EnToJp
 
-from .err_handler import ignoreStderr
+from .audio_io import AudioSink, PyAudioSink
+from .grpc_channel import get_channel
+from .metrics import add_callback, counter, gauge, histogram
+from .text_normalizer import TextNormalizer, completed_future
+from .tracing import get_tracer
+from .wav_parser import iter_wav_frames
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
 import motion_server_pb2
 import motion_server_pb2_grpc
 
+TTS_TEXTS = counter(
+    "tts_texts_total", "Number of texts queued for synthesis", ["normalized"]
+)
+TTS_QUEUE_DEPTH = gauge("tts_queue_depth", "Number of texts waiting for synthesis")
+TTS_KANA_CONVERSION_SECONDS = histogram(
+    "tts_kana_conversion_seconds", "Time to convert English words in a text to kana"
+)
+TTS_SYNTHESIS_SECONDS = histogram(
+    "tts_synthesis_seconds",
+    "Time from dequeuing a text to writing its first audio frame",
+)
+TTS_PLAYBACK_SECONDS = histogram(
+    "tts_playback_seconds",
+    "Time from the first to the last audio frame of a text",
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 20.0, 30.0, 60.0),
+)
+
 
 class TextToVoice(metaclass=ABCMeta):
     """
@@ -31,6 +50,8 @@ class TextToVoice(metaclass=ABCMeta):
         port: str = "52001",
         motion_host: Optional[str] = "127.0.0.1",
         motion_port: Optional[str] = "50055",
+        audio_sink: Optional[AudioSink] = None,
+        text_normalizer: Optional[TextNormalizer] = None,
     ) -> None:
         """クラスの初期化メソッド。
         Args:
@@ -38,14 +59,29 @@ class TextToVoice(metaclass=ABCMeta):
             port (str, optional): サーバーのポート番号。デフォルトは "52001"。
             motion_host (str, optional): モーションサーバーのホスト名。デフォルトは"127.0.0.1"。
             motion_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            audio_sink (AudioSink, optional): 音声の出力先。Noneの場合はPyAudioの出力デバイス。
+            text_normalizer (TextNormalizer, optional): テキストの正規化を行うインスタンス。Noneの場合は新たに生成する。
 
         """
-        self.queue: Queue[str] = Queue()
+        # 正規化(英単語のかな変換)済みのテキストを返すFutureのキュー
+        self.queue: Queue[Future[str]] = Queue()
+        # キューのテキストと、それを含む発話のトレースID
+        self.text_traces: "WeakKeyDictionary[Future[str], str]" = WeakKeyDictionary()
+        # 合成・再生中のテキストのトレースIDと、キューから取り出した時刻
+        self.playing_trace_id: Optional[str] = None
+        self.playing_start_time = 0.0
+        # 合成・再生中のテキストの最初の音声をまだ出力していないかどうか
+        self.first_frame_pending = False
+        # 最初の音声を出力したトレースID。発話ごとに最初の1文のみ記録する
+        self.first_audio_trace_id: Optional[str] = None
+        self.audio_sink = audio_sink if audio_sink is not None else PyAudioSink()
         self.host = host
         self.port = port
         self.motion_stub = None
         if motion_host is not None or motion_port is not None:
-            motion_channel = grpc.insecure_channel(motion_host + ":" + motion_port)
+            motion_channel = get_channel(
+                motion_host + ":" + motion_port, keepalive_without_calls=False
+            )
             self.motion_stub = motion_server_pb2_grpc.MotionServerServiceStub(
                 motion_channel
             )
@@ -64,10 +100,13 @@ class TextToVoice(metaclass=ABCMeta):
         self.head_motion_thread = Thread(target=self.head_motion_control, daemon=True)
         if self.motion_stub is not None:
             self.head_motion_thread.start()
+        self.text_normalizer = (
+            text_normalizer if text_normalizer is not None else TextNormalizer()
+        )
         self.text_to_voice_event = Event()
         self.voice_thread = Thread(target=self.text_to_voice_thread)
         self.voice_thread.start()
-        self.en_to_jp = EnToJp()
+        add_callback(self.update_metrics)
 
     def __exit__(self) -> None:
         """音声合成スレッドを終了する。"""
@@ -98,10 +137,14 @@ class TextToVoice(metaclass=ABCMeta):
             if self.queue.qsize() > 0:
                 queue_start = True
                 last_queue_time = time.time()
-                text = self.queue.get()
-                # textに含まれる英語を極力かな変換する
-                text = self.en_to_jp.text_to_kana(text, True, True, True)
+                text_future = self.queue.get()
+                text = text_future.result()
+                self.playing_trace_id = self.text_traces.get(text_future)
+                self.playing_start_time = time.time()
+                self.first_frame_pending = True
                 self.text_to_voice(text)
+                self.first_frame_pending = False
+                self.playing_trace_id = None
             else:
                 # queueが空の状態でsentence_endが送られる、もしくはsentence_end_timeout秒経過した場合finishedにする。
                 if self.sentence_end_flg or (
@@ -126,24 +169,65 @@ class TextToVoice(metaclass=ABCMeta):
                     self.sentence_end_flg = False
                     self.text_to_voice_event.clear()
 
+    def clear_queue(self) -> None:
+        """再生待ちのテキストを全て破棄する。"""
+        while not self.queue.empty():
+            self.queue.get()
+
+    def convert_text(self, text: str) -> str:
+        """
+        音声合成用にテキストを変換する。
+
+        Args:
+            text (str): 変換対象のテキスト。
+
+        Returns:
+            str: textに含まれる英語を極力かな変換したテキスト。
+
+        """
+        return self.text_normalizer.normalize(text)
+
     def put_text(
-        self, text: str, play_now: bool = True, blocking: bool = False
-    ) -> None:
+        self,
+        text: str,
+        play_now: bool = True,
+        blocking: bool = False,
+        normalized: bool = False,
+        trace_id: Optional[str] = None,
+    ) -> "Future[str]":
         """
         音声合成のためのテキストをキューに追加する。
+        テキストの正規化はキューへの追加と同時にワーカースレッドで開始する。
 
         Args:
             text (str): 音声合成対象のテキスト。
             play_now (bool, optional): すぐに音声再生を開始するかどうか。デフォルトはTrue。
             blocking (bool, optional): 音声合成が完了するまでブロックするかどうか。デフォルトはFalse。
+            normalized (bool, optional): textが正規化済みかどうか。デフォルトはFalse。
+            trace_id (Optional[str], optional): テキストを含む発話のトレースID。デフォルトはNone。
+
+        Returns:
+            Future[str]: 正規化したテキストを返すFuture。
 
         """
         if play_now:
             self.text_to_voice_event.set()
-        self.queue.put(text)
+        TTS_TEXTS.inc(normalized=str(normalized).lower())
+        if normalized:
+            text_future = completed_future(text)
+        else:
+            submit_time = time.time()
+            text_future = self.text_normalizer.submit(text)
+            text_future.add_done_callback(
+                lambda _: self.record_kana_conversion(text, submit_time, trace_id)
+            )
+        if trace_id is not None:
+            self.text_traces[text_future] = trace_id
+        self.queue.put(text_future)
         self.finished = False
         if blocking:
             self.wait_finish()
+        return text_future
 
     def wait_finish(self) -> None:
         """
@@ -176,27 +260,72 @@ class TextToVoice(metaclass=ABCMeta):
             wav_file (bytes): 合成された音声データ。
 
         """
-        wr: wave.Wave_read = wave.open(io.BytesIO(wav_file))
-        with ignoreStderr():
-            p = pyaudio.PyAudio()
-            stream = p.open(
-                format=p.get_format_from_width(wr.getsampwidth()),
-                channels=wr.getnchannels(),
-                rate=wr.getframerate(),
-                output=True,
-            )
-            chunk = 1024
-            data = wr.readframes(chunk)
-            while data:
-                audio_data = np.frombuffer(data, dtype=np.int16)
-                rms = np.sqrt(np.mean(audio_data**2))
-                db = 20 * np.log10(rms) if rms > 0.0 else 0.0
-                self.tilt_rate = self.db_to_head_rate(db)
-                stream.write(data)
-                data = wr.readframes(chunk)
-            time.sleep(0.2)
-            stream.close()
-        p.terminate()
+        self.play_wav_stream([wav_file])
+
+    def play_wav_stream(self, wav_chunks: Iterable[bytes]) -> None:
+        """分割して受信した音声データを、受信しながら再生する。
+        データはコピーせずにmemoryviewのまま出力先に渡す。
+
+        Args:
+            wav_chunks (Iterable[bytes]): 合成された音声データのチャンク列。
+
+        """
+        chunk = 1024
+        is_open = False
+        open_time = 0.0
+        try:
+            for wav_format, data in iter_wav_frames(wav_chunks):
+                if not is_open:
+                    self.audio_sink.open(
+                        wav_format.sampwidth, wav_format.channels, wav_format.rate
+                    )
+                    is_open = True
+                    open_time = time.time()
+                step = chunk * wav_format.frame_size
+                for pos in range(0, len(data), step):
+                    frames = data[pos : pos + step]
+                    audio_data = np.frombuffer(frames, dtype=np.int16)
+                    rms = np.sqrt(np.mean(np.square(audio_data, dtype=np.float32)))
+                    db = 20 * np.log10(rms) if rms > 0.0 else 0.0
+                    self.tilt_rate = self.db_to_head_rate(db)
+                    self.audio_sink.write(frames)
+                    if pos == 0:
+                        self.record_first_frame()
+        finally:
+            if is_open:
+                self.audio_sink.close()
+                TTS_PLAYBACK_SECONDS.observe(time.time() - open_time)
+
+    def record_kana_conversion(
+        self, text: str, submit_time: float, trace_id: Optional[str]
+    ) -> None:
+        """英単語のかな変換の完了時に、変換にかかった時間を記録する。"""
+        now = time.time()
+        TTS_KANA_CONVERSION_SECONDS.observe(now - submit_time)
+        get_tracer().record(
+            trace_id, "kana_conversion", submit_time, now, chars=len(text)
+        )
+
+    def record_first_frame(self) -> None:
+        """合成・再生中の文の最初の音声を出力した時に、合成の時間と発話の最初の音声の時刻を記録する。"""
+        if not self.first_frame_pending:
+            return
+        # 同じ文の2つ目以降のwavは記録しない
+        self.first_frame_pending = False
+        now = time.time()
+        TTS_SYNTHESIS_SECONDS.observe(now - self.playing_start_time)
+        trace_id = self.playing_trace_id
+        if trace_id is None:
+            return
+        tracer = get_tracer()
+        tracer.record(trace_id, "synthesis", self.playing_start_time, now)
+        if trace_id != self.first_audio_trace_id:
+            self.first_audio_trace_id = trace_id
+            tracer.record(trace_id, "first_audio", now)
+
+    def update_metrics(self) -> None:
+        """メトリクスの出力前に、合成待ちのテキスト数を更新する。"""
+        TTS_QUEUE_DEPTH.set(self.queue.qsize())
 
     @abstractmethod
     def text_to_voice(self, text: str) -> None:
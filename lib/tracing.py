@@ -0,0 +1,180 @@
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# トレースIDを送るgRPCのメタデータのキー
+TRACE_METADATA_KEY = "trace-id"
+
+
+def new_trace_id() -> str:
+    """新しいトレースIDを返す。"""
+    return uuid.uuid4().hex[:16]
+
+
+def trace_metadata(trace_id: Optional[str]) -> List[Tuple[str, str]]:
+    """トレースIDをgRPCのメタデータに変換する。トレースIDがNoneの場合は空のリストを返す。"""
+    if trace_id is None:
+        return []
+    return [(TRACE_METADATA_KEY, trace_id)]
+
+
+def trace_id_from_context(context: Any) -> Optional[str]:
+    """gRPCのRPCのコンテキストのメタデータからトレースIDを取り出す。"""
+    if context is None:
+        return None
+    for key, value in context.invocation_metadata():
+        if key == TRACE_METADATA_KEY:
+            return value
+    return None
+
+
+class Trace(object):
+    """
+    1回の発話(VADの開始から応答の再生まで)のトレース。
+    プロセス内で後のスパンの開始時刻に使う時刻(VADの終了など)を保持する。
+    """
+
+    def __init__(self, trace_id: Optional[str] = None) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            trace_id (Optional[str], optional): トレースID。Noneの場合は新たに生成する。
+
+        """
+        self.trace_id = trace_id if trace_id is not None else new_trace_id()
+        self.start_time = time.time()
+        self.marks: Dict[str, float] = {}
+
+    def mark(self, name: str, t: Optional[float] = None) -> float:
+        """名前をつけて時刻を記録し、その時刻を返す。"""
+        if t is None:
+            t = time.time()
+        self.marks[name] = t
+        return t
+
+
+class Tracer(object):
+    """
+    スパン(処理の開始と終了の時刻)をjsonlのファイルに追記するクラス。
+    複数のプロセスが同じファイルに追記し、trace_report.pyでトレースIDごとにまとめて表示する。
+    """
+
+    def __init__(self, path: Optional[str] = None, process: str = "") -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            path (Optional[str], optional): スパンを追記するjsonlファイルのパス。Noneの場合は記録しない。
+            process (str, optional): 記録するプロセス名。デフォルトは""。
+
+        """
+        self.path = path
+        self.process = process
+        self.lock = Lock()
+
+    def record(
+        self,
+        trace_id: Optional[str],
+        name: str,
+        start: float,
+        end: Optional[float] = None,
+        **attrs: Any,
+    ) -> None:
+        """スパンを記録する。
+
+        Args:
+            trace_id (Optional[str]): トレースID。Noneの場合は記録しない。
+            name (str): スパン名。
+            start (float): 開始時刻(time.time())。
+            end (Optional[float], optional): 終了時刻。Noneの場合は開始時刻と同じ(時点の記録)とする。
+            **attrs (Any): スパンの属性。
+
+        """
+        if self.path is None or trace_id is None:
+            return
+        span = {
+            "trace": trace_id,
+            "process": self.process,
+            "name": name,
+            "start": start,
+            "end": end if end is not None else start,
+        }
+        if len(attrs) > 0:
+            span["attrs"] = attrs
+        line = json.dumps(span, ensure_ascii=False) + "\n"
+        try:
+            with self.lock:
+                # 他のプロセスと同じファイルに追記するため、1行を1回の書き込みで追記する
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode("utf-8"))
+                finally:
+                    os.close(fd)
+        except BaseException as e:
+            print(f"Failed to write trace: {e}")
+
+    @contextmanager
+    def span(self, trace_id: Optional[str], name: str, **attrs: Any) -> Iterator[None]:
+        """withブロックの実行時間をスパンとして記録する。"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(trace_id, name, start, time.time(), **attrs)
+
+
+# プロセス内で共有するTracer
+_tracer = Tracer()
+# speech_publisherで認識中の発話のトレース。speech_publisherは1つの会話のみを扱うため、プロセスで1つとする
+_current_trace: Optional[Trace] = None
+
+
+def configure_tracing(path: Optional[str], process: str) -> Tracer:
+    """プロセス内で共有するTracerの記録先を設定する。
+
+    Args:
+        path (Optional[str]): スパンを追記するjsonlファイルのパス。Noneの場合は記録しない。
+        process (str): 記録するプロセス名。
+
+    Returns:
+        Tracer: 設定したTracer。
+
+    """
+    _tracer.path = path
+    _tracer.process = process
+    return _tracer
+
+
+def get_tracer() -> Tracer:
+    """プロセス内で共有するTracerを返す。"""
+    return _tracer
+
+
+def start_trace() -> Trace:
+    """新しい発話のトレースを開始し、現在のトレースとする。"""
+    global _current_trace
+    _current_trace = Trace()
+    return _current_trace
+
+
+def current_trace() -> Optional[Trace]:
+    """現在のトレースを返す。開始していない場合はNone。"""
+    return _current_trace
+
+
+def end_speech() -> Optional[str]:
+    """VADで発話の終了を検出した時に呼び出す。現在のトレースに終了時刻を記録し、発話区間のスパンを記録する。
+
+    Returns:
+        Optional[str]: 現在のトレースID。トレースを開始していない場合はNone。
+
+    """
+    trace = _current_trace
+    if trace is None:
+        return None
+    end = trace.mark("vad_end")
+    _tracer.record(trace.trace_id, "speech", trace.start_time, end)
+    return trace.trace_id
@@ -0,0 +1,472 @@
+import math
+from abc import ABCMeta, abstractmethod
+from typing import Optional, Union
+
+import numpy as np
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class LevelMeter(object):
+    """
+    16bitのPCMデータから音量[dB]を計算するクラス。
+    マイクのコールバック内で呼び出すため、計算用のバッファは事前に確保し、呼び出しごとの配列生成を行わない。
+    """
+
+    def __init__(self, max_samples: int = 1600) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            max_samples (int, optional): 1回に計算する最大サンプル数。これを超えるデータが来た場合はバッファを拡張する。デフォルトは1600。
+
+        """
+        self._buf = np.zeros(max(int(max_samples), 1), dtype=np.float32)
+        self._view = self._buf[:0]
+
+    def mean_square(self, data: BytesLike) -> float:
+        """PCMデータの二乗平均を返す。
+
+        Args:
+            data (BytesLike): 16bitのPCMデータ。
+
+        Returns:
+            float: 二乗平均。データが空の場合は0.0。
+
+        """
+        samples = np.frombuffer(data, dtype=np.int16)
+        num = len(samples)
+        if num == 0:
+            return 0.0
+        if num > len(self._buf):
+            self._buf = np.zeros(num, dtype=np.float32)
+        if len(self._view) != num:
+            self._view = self._buf[:num]
+        # int16のまま二乗するとオーバーフローするため、floatのバッファに変換してから計算する
+        np.copyto(self._view, samples, casting="unsafe")
+        return float(np.dot(self._view, self._view)) / num
+
+    def power_db(self, data: BytesLike) -> float:
+        """PCMデータの音量[dB]を返す。
+
+        Args:
+            data (BytesLike): 16bitのPCMデータ。
+
+        Returns:
+            float: 音量[dB]。無音の場合は-inf。
+
+        """
+        ms = self.mean_square(data)
+        return 10 * math.log10(ms) if ms > 0.0 else -math.inf  # RMS to db
+
+
+class VadResult(object):
+    """
+    発話区間検出の結果を保持するクラス。
+    """
+
+    def __init__(
+        self,
+        is_speech: bool,
+        confidence: float,
+        power: float,
+        speech_started: bool = False,
+        speech_ended: bool = False,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            is_speech (bool): 発話中かどうか。
+            confidence (float): 発話である確からしさ(0.0~1.0)。
+            power (float): 入力の音量[dB]。
+            speech_started (bool, optional): このデータで発話が開始したかどうか。デフォルトはFalse。
+            speech_ended (bool, optional): このデータで発話が終了したかどうか。デフォルトはFalse。
+
+        """
+        self.is_speech = is_speech
+        self.confidence = confidence
+        self.power = power
+        self.speech_started = speech_started
+        self.speech_ended = speech_ended
+
+
+class Vad(metaclass=ABCMeta):
+    """
+    発話区間検出(VAD)のインターフェース。
+    マイクのコールバックから16bitモノラルのPCMデータを受け取り、発話の開始と終了を判定する。
+    """
+
+    def __init__(self, rate: int, db_thresh: float, timeout_thresh: float) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (int): サンプリングレート。
+            db_thresh (float): 発話と判断する音量閾値[dB]。
+            timeout_thresh (float): 発話が終了したと判断する無音時間の上限[sec]。
+
+        """
+        self.rate = int(rate)
+        self.db_thresh = db_thresh
+        self.timeout_thresh = timeout_thresh
+
+    @abstractmethod
+    def reset(self) -> None:
+        """状態を初期化する。発話の受付開始時に呼び出す。"""
+        pass
+
+    @abstractmethod
+    def process(self, data: BytesLike) -> VadResult:
+        """PCMデータを入力し、発話区間の判定結果を返す。
+
+        Args:
+            data (BytesLike): 16bitモノラルのPCMデータ。
+
+        Returns:
+            VadResult: 判定結果。
+
+        """
+        pass
+
+
+class PowerThresholdVad(Vad):
+    """
+    チャンクごとの音量が閾値を超えたかどうかで発話区間を判定するVAD。
+    閾値を超えないチャンクがtimeout_thresh秒続くと発話終了とする。
+    """
+
+    def __init__(
+        self,
+        rate: int = 16000,
+        db_thresh: float = 55.0,
+        timeout_thresh: float = 0.5,
+        max_samples: int = 1600,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (int, optional): サンプリングレート。デフォルトは16000。
+            db_thresh (float, optional): 発話と判断する音量閾値[dB]。デフォルトは55.0。
+            timeout_thresh (float, optional): 発話が終了したと判断する無音時間[sec]。デフォルトは0.5。
+            max_samples (int, optional): 1回に入力する最大サンプル数。デフォルトは1600。
+
+        """
+        super().__init__(rate, db_thresh, timeout_thresh)
+        self.level_meter = LevelMeter(max_samples)
+        self.reset()
+
+    def reset(self) -> None:
+        self.is_speech = False
+        self.silence_samples = 0
+
+    def process(self, data: BytesLike) -> VadResult:
+        power = self.level_meter.power_db(data)
+        speech_started = False
+        speech_ended = False
+        if power > self.db_thresh:
+            speech_started = not self.is_speech
+            self.is_speech = True
+            self.silence_samples = 0
+        elif self.is_speech:
+            self.silence_samples += len(data) // 2
+            if self.silence_samples >= self.timeout_thresh * self.rate:
+                self.is_speech = False
+                speech_ended = True
+        return VadResult(
+            is_speech=self.is_speech,
+            confidence=1.0 if power > self.db_thresh else 0.0,
+            power=power,
+            speech_started=speech_started,
+            speech_ended=speech_ended,
+        )
+
+
+class FeatureVad(Vad):
+    """
+    短いフレームごとの音量、ゼロ交差率、スペクトル平坦度から発話の確からしさを求めるVAD。
+    開始と終了で異なる閾値を使うヒステリシスと、無音の確からしさに応じて長さを変えるハングオーバーで判定する。
+    無音が明確な場合はmin_hangover秒、曖昧な場合は最大timeout_thresh秒で発話終了とする。
+    """
+
+    def __init__(
+        self,
+        rate: int = 16000,
+        db_thresh: float = 55.0,
+        timeout_thresh: float = 0.8,
+        frame_ms: int = 20,
+        min_hangover: float = 0.2,
+        start_thresh: float = 0.6,
+        stop_thresh: float = 0.4,
+        min_speech_ms: int = 60,
+        smoothing: float = 0.5,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (int, optional): サンプリングレート。デフォルトは16000。
+            db_thresh (float, optional): 発話と判断する音量閾値[dB]。デフォルトは55.0。
+            timeout_thresh (float, optional): 発話が終了したと判断する無音時間の上限[sec]。デフォルトは0.8。
+            frame_ms (int, optional): 判定を行うフレーム長[ms]。10~30程度。デフォルトは20。
+            min_hangover (float, optional): 発話が終了したと判断する無音時間の下限[sec]。デフォルトは0.2。
+            start_thresh (float, optional): 発話開始と判断する確からしさの閾値。デフォルトは0.6。
+            stop_thresh (float, optional): 無音と判断する確からしさの閾値。デフォルトは0.4。
+            min_speech_ms (int, optional): 発話開始と判断するのに必要な発話の継続時間[ms]。デフォルトは60。
+            smoothing (float, optional): 確からしさの平滑化係数(0.0~1.0)。大きいほど変化が緩やかになる。デフォルトは0.5。
+
+        """
+        super().__init__(rate, db_thresh, timeout_thresh)
+        self.frame_len = max(int(self.rate * frame_ms / 1000), 16)
+        self.min_hangover = min(min_hangover, timeout_thresh)
+        self.start_thresh = start_thresh
+        self.stop_thresh = stop_thresh
+        self.min_speech_samples = int(self.rate * min_speech_ms / 1000)
+        self.smoothing = smoothing
+        self.window = np.hanning(self.frame_len).astype(np.float32)
+        self.level_meter = LevelMeter(self.frame_len * 10)
+        self._pending = b""
+        self.reset()
+
+    def reset(self) -> None:
+        self.is_speech = False
+        self.confidence = 0.0
+        self.speech_samples = 0
+        self.silence_samples = 0
+        self.silence_confidence_sum = 0.0
+        self.silence_frames = 0
+        self._pending = b""
+
+    def frame_scores(self, frames: np.ndarray) -> np.ndarray:
+        """フレームごとの発話らしさ(0.0~1.0)を求める。
+
+        Args:
+            frames (np.ndarray): (フレーム数, フレーム長)のfloat32配列。
+
+        Returns:
+            np.ndarray: フレームごとの発話らしさ。
+
+        """
+        mean_square = np.mean(np.square(frames), axis=1)
+        power = 10 * np.log10(mean_square + 1e-10)
+        # 閾値付近を3dB幅でなだらかに変化させる
+        energy_score = 1.0 / (1.0 + np.exp(-(power - self.db_thresh) / 3.0))
+        # ゼロ交差率。有声音は低く、雑音や無声音は高い
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        zcr_score = np.clip((0.5 - zcr) / 0.4, 0.0, 1.0)
+        # スペクトル平坦度。調波構造を持つ音声は低く、白色雑音は高い
+        spectrum = np.square(np.abs(np.fft.rfft(frames * self.window, axis=1))) + 1e-10
+        flatness = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+        tonal_score = np.clip((0.6 - flatness) / 0.5, 0.0, 1.0)
+        # 音量が閾値を超えない場合は発話としない。大きな雑音は周波数特徴で抑制する
+        return energy_score * (0.5 + 0.5 * (0.6 * tonal_score + 0.4 * zcr_score))
+
+    def hangover(self) -> float:
+        """現在の無音区間に対するハングオーバー時間[sec]を返す。"""
+        if self.silence_frames == 0:
+            return self.timeout_thresh
+        mean_confidence = self.silence_confidence_sum / self.silence_frames
+        # 確からしさが0に近いほど無音が明確とみなし、早く終了する
+        certainty = min(max(1.0 - mean_confidence / self.stop_thresh, 0.0), 1.0)
+        return (
+            self.timeout_thresh - (self.timeout_thresh - self.min_hangover) * certainty
+        )
+
+    def process(self, data: BytesLike) -> VadResult:
+        power = self.level_meter.power_db(data)
+        if len(self._pending) > 0:
+            data = self._pending + bytes(data)
+        samples = np.frombuffer(data, dtype=np.int16)
+        num_frames = len(samples) // self.frame_len
+        used = num_frames * self.frame_len
+        # フレームに満たない端数は次回の入力と結合する
+        self._pending = samples[used:].tobytes()
+        speech_started = False
+        speech_ended = False
+        if num_frames > 0:
+            frames = (
+                samples[:used].reshape(num_frames, self.frame_len).astype(np.float32)
+            )
+            for score in self.frame_scores(frames):
+                self.confidence = (
+                    self.smoothing * self.confidence + (1.0 - self.smoothing) * score
+                )
+                if not self.is_speech:
+                    if self.confidence >= self.start_thresh:
+                        self.speech_samples += self.frame_len
+                        if self.speech_samples >= self.min_speech_samples:
+                            self.is_speech = True
+                            speech_started = True
+                            self.silence_samples = 0
+                            self.silence_confidence_sum = 0.0
+                            self.silence_frames = 0
+                    else:
+                        self.speech_samples = 0
+                elif self.confidence >= self.stop_thresh:
+                    self.silence_samples = 0
+                    self.silence_confidence_sum = 0.0
+                    self.silence_frames = 0
+                else:
+                    self.silence_samples += self.frame_len
+                    self.silence_confidence_sum += self.confidence
+                    self.silence_frames += 1
+                    if self.silence_samples >= self.hangover() * self.rate:
+                        self.is_speech = False
+                        self.speech_samples = 0
+                        speech_ended = True
+                        break
+        return VadResult(
+            is_speech=self.is_speech,
+            confidence=float(self.confidence),
+            power=power,
+            speech_started=speech_started,
+            speech_ended=speech_ended,
+        )
+
+
+def create_vad(
+    name: str,
+    rate: int,
+    db_thresh: float,
+    timeout_thresh: float,
+    frame_ms: int = 20,
+    min_hangover: float = 0.2,
+    max_samples: Optional[int] = None,
+) -> Vad:
+    """名前を指定してVADを生成する。
+
+    Args:
+        name (str): "power"または"feature"。
+        rate (int): サンプリングレート。
+        db_thresh (float): 発話と判断する音量閾値[dB]。
+        timeout_thresh (float): 発話が終了したと判断する無音時間(featureの場合は上限)[sec]。
+        frame_ms (int, optional): featureの場合の判定フレーム長[ms]。デフォルトは20。
+        min_hangover (float, optional): featureの場合の無音時間の下限[sec]。デフォルトは0.2。
+        max_samples (Optional[int], optional): 1回に入力する最大サンプル数。Noneの場合は100ms分。
+
+    Returns:
+        Vad: 生成したVAD。
+
+    Raises:
+        ValueError: 不明な名前が指定された場合。
+
+    """
+    if max_samples is None:
+        max_samples = int(rate / 10)
+    if name == "power":
+        return PowerThresholdVad(rate, db_thresh, timeout_thresh, max_samples)
+    elif name == "feature":
+        return FeatureVad(
+            rate,
+            db_thresh,
+            timeout_thresh,
+            frame_ms=frame_ms,
+            min_hangover=min_hangover,
+        )
+    raise ValueError(f"Unknown vad: {name}")
+
+
+class NoiseFloorEstimator(object):
+    """
+    マイク入力から周囲音量(ノイズフロア)を継続的に推定し、発話判定の音量閾値を求めるクラス。
+    直近window秒分のチャンクごとの音量を保持し、その下位percentileパーセンタイルをノイズフロアとする。
+    発話が含まれていても、無音区間が窓の一定割合あれば推定値は発話の影響を受けにくい。
+    音量はBIN_DB刻みのヒストグラムで保持し、入力のコールバック内でソートやメモリ確保をせずにパーセンタイルを求める。
+    """
+
+    # 無音(デジタル0)の入力を記録する際の音量[dB]
+    MIN_POWER_DB = 0.0
+    # ヒストグラムで保持する音量の上限[dB]。16bitのPCMの最大音量(約90.3dB)を含む
+    MAX_POWER_DB = 100.0
+    # ヒストグラムの刻み幅[dB]
+    BIN_DB = 0.5
+
+    def __init__(
+        self,
+        rate: int = 16000,
+        chunk: int = 1600,
+        window: float = 30.0,
+        percentile: float = 10.0,
+        margin: float = 20.0,
+        update_interval: float = 1.0,
+        initial_floor: Optional[float] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            rate (int, optional): サンプリングレート。デフォルトは16000。
+            chunk (int, optional): 1回に入力するサンプル数。デフォルトは1600。
+            window (float, optional): 推定に使用する直近の時間[sec]。デフォルトは30.0。
+            percentile (float, optional): ノイズフロアとする音量のパーセンタイル(0~100)。デフォルトは10.0。
+            margin (float, optional): ノイズフロアに足して発話判定の閾値とする値[dB]。デフォルトは20.0。
+            update_interval (float, optional): ノイズフロアを再計算する間隔[sec]。デフォルトは1.0。
+            initial_floor (Optional[float], optional): ノイズフロアの初期値[dB]。指定した場合は窓をこの値で埋め、実測値で徐々に置き換える。デフォルトはNone。
+
+        """
+        self.rate = int(rate)
+        self.percentile = percentile
+        self.margin = margin
+        size = max(int(window * rate / chunk), 1)
+        # チャンクごとの音量のヒストグラムのビン番号のリングバッファ
+        self.bins = np.zeros(size, dtype=np.int32)
+        num_bins = int(math.ceil((self.MAX_POWER_DB - self.MIN_POWER_DB) / self.BIN_DB))
+        # 窓内の音量のヒストグラムと、その累積和(再計算時に上書きする)
+        self.histogram = np.zeros(num_bins, dtype=np.int32)
+        self.cumulative = np.zeros(num_bins, dtype=np.int32)
+        self.count = 0
+        self.pos = 0
+        self.update_samples = max(int(update_interval * rate), 1)
+        self.samples_since_update = 0
+        self.level_meter = LevelMeter(chunk)
+        self.noise_floor: Optional[float] = None
+        if initial_floor is not None:
+            self.bins.fill(self.to_bin(initial_floor))
+            self.histogram[self.to_bin(initial_floor)] = size
+            self.count = size
+            self.noise_floor = float(initial_floor)
+
+    def to_bin(self, power: float) -> int:
+        """音量[dB]をヒストグラムのビン番号に変換する。範囲外の音量は両端のビンとする。"""
+        if not power > self.MIN_POWER_DB:
+            # 無音(-inf)を含む
+            return 0
+        return min(
+            int((power - self.MIN_POWER_DB) / self.BIN_DB), len(self.histogram) - 1
+        )
+
+    @property
+    def threshold(self) -> Optional[float]:
+        """発話判定の音量閾値[dB]。推定値がまだない場合はNone。"""
+        if self.noise_floor is None:
+            return None
+        return self.noise_floor + self.margin
+
+    def update(self, data: BytesLike) -> bool:
+        """PCMデータの音量を記録し、update_intervalごとにノイズフロアを再計算する。
+
+        Args:
+            data (BytesLike): 16bitモノラルのPCMデータ。
+
+        Returns:
+            bool: ノイズフロアを再計算した場合はTrue。
+
+        """
+        num = len(data) // 2
+        if num == 0:
+            return False
+        index = self.to_bin(self.level_meter.power_db(data))
+        if self.count < len(self.bins):
+            self.count += 1
+        else:
+            # 窓から外れる最も古い音量をヒストグラムから除く
+            self.histogram[self.bins[self.pos]] -= 1
+        self.bins[self.pos] = index
+        self.histogram[index] += 1
+        self.pos = (self.pos + 1) % len(self.bins)
+        self.samples_since_update += num
+        if self.samples_since_update < self.update_samples:
+            return False
+        self.samples_since_update = 0
+        # 下位percentileパーセンタイルの音量を含むビンの中央値をノイズフロアとする
+        rank = max(int(math.ceil(self.count * self.percentile / 100.0)), 1)
+        np.cumsum(self.histogram, out=self.cumulative)
+        index = int(np.searchsorted(self.cumulative, rank))
+        self.noise_floor = self.MIN_POWER_DB + (index + 0.5) * self.BIN_DB
+        return True
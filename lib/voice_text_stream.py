@@ -0,0 +1,467 @@
+import asyncio
+import os
+import queue
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from threading import Lock
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Deque,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import grpc
+
+from .tracing import get_tracer
+
+if TYPE_CHECKING:
+    from .text_normalizer import TextNormalizer
+    from .text_to_voice import TextToVoice
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "grpc"))
+import voice_server_pb2
+
+
+class VoiceTextStream(object):
+    """
+    1回の応答で音声合成する文を、voice_serverのStreamTextの1本のストリームで送信するクラス。
+    StreamTextを持たない古いvoice_serverの場合は、文ごとのSetTextで送り直し、以降はSetTextを使用する。
+    """
+
+    def __init__(
+        self,
+        stub: Any,
+        use_stream: bool = True,
+        metadata: Optional[List[Tuple[str, str]]] = None,
+        max_pending: int = 8,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            stub (Any): voice_serverのVoiceServerServiceStub。
+            use_stream (bool, optional): StreamTextを使用するかどうか。Falseの場合は文ごとにSetTextを呼び出す。デフォルトはTrue。
+            metadata (Optional[List[Tuple[str, str]]], optional): 全てのRPCに付けるメタデータ(発話のトレースIDなど)。デフォルトはNone。
+            max_pending (int, optional): StreamTextで送信待ちにできる文の最大数。voice_serverの受信が滞った場合、sendは空きができるまで待つ。デフォルトは8。
+
+        """
+        self.stub = stub
+        self.use_stream = use_stream
+        self.metadata = metadata
+        self.max_pending = max_pending
+        self.queue: Optional[queue.Queue] = None
+        self.future: Optional[Any] = None
+        # 送信した文。StreamTextが使えなかった場合にSetTextで送り直す
+        self.requests: List[voice_server_pb2.StreamTextRequest] = []
+
+    def __enter__(self) -> "VoiceTextStream":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        self.close()
+
+    def _request_iterator(
+        self, requests: queue.Queue
+    ) -> Iterator[voice_server_pb2.StreamTextRequest]:
+        while True:
+            request = requests.get()
+            if request is None:
+                return
+            yield request
+
+    def open(self) -> None:
+        """StreamTextのストリームを開始する。"""
+        self.requests = []
+        if not self.use_stream:
+            return
+        self.queue = queue.Queue(maxsize=self.max_pending)
+        self.future = self.stub.StreamText.future(
+            self._request_iterator(self.queue), metadata=self.metadata
+        )
+
+    def send(
+        self, text: str, normalized: bool = False, sentence_end: bool = False
+    ) -> None:
+        """音声合成する文を送信する。
+
+        Args:
+            text (str): 音声合成する文。
+            normalized (bool, optional): 英単語のかな変換済みかどうか。デフォルトはFalse。
+            sentence_end (bool, optional): 応答の終わりを通知するかどうか。デフォルトはFalse。
+
+        """
+        request = voice_server_pb2.StreamTextRequest(
+            text=text, normalized=normalized, sentence_end=sentence_end
+        )
+        self.requests.append(request)
+        # ストリームが途中で終了した場合は、以降の文をSetTextで送る
+        if self.future is not None and self.future.done():
+            self.close()
+            if self.use_stream:
+                self._send_unary(request)
+            return
+        if self.queue is None:
+            self._send_unary(request)
+        elif not self._put(request):
+            # 送信待ちの間にストリームが終了した場合は、SetTextで送る
+            self.close()
+            if self.use_stream:
+                self._send_unary(request)
+
+    def _put(self, request: Optional[voice_server_pb2.StreamTextRequest]) -> bool:
+        """送信待ちのキューに空きができるまで待ち、リクエストを追加する。
+
+        Returns:
+            bool: 追加できた場合はTrue。待機中にストリームが終了した場合はFalse。
+
+        """
+        requests, future = self.queue, self.future
+        if requests is None or future is None:
+            return False
+        while True:
+            try:
+                requests.put(request, timeout=0.1)
+                return True
+            except queue.Full:
+                if future.done():
+                    return False
+
+    def _send_unary(self, request: voice_server_pb2.StreamTextRequest) -> None:
+        try:
+            if request.text != "":
+                self.stub.SetText(
+                    voice_server_pb2.SetTextRequest(
+                        text=request.text, normalized=request.normalized
+                    ),
+                    metadata=self.metadata,
+                )
+            if request.sentence_end:
+                self.stub.SentenceEnd(
+                    voice_server_pb2.SentenceEndRequest(), metadata=self.metadata
+                )
+        except BaseException as e:
+            print(f"SetText error: {e}")
+
+    def close(self) -> bool:
+        """ストリームを終了し、voice_serverの受信完了を待つ。
+
+        Returns:
+            bool: 送信に成功したかどうか。
+
+        """
+        if self.queue is None or self.future is None:
+            return True
+        self._put(None)
+        future = self.future
+        self.queue = None
+        self.future = None
+        try:
+            return future.result().success
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                print(f"StreamText error: {e}")
+                return False
+        # StreamTextを持たないvoice_serverには、ここまでの文をSetTextで送り直す
+        print("StreamText is not implemented on voice server. Use SetText.")
+        self.use_stream = False
+        for request in self.requests:
+            self._send_unary(request)
+        return True
+
+
+class NormalizedTextSender(object):
+    """
+    VoiceTextStreamに送る文を、TextNormalizerのワーカースレッドで正規化してから送信するクラス。
+    正規化は文の生成と並行して行い、正規化が終わった文から生成した順番でvoice_serverに送信する。
+    """
+
+    def __init__(
+        self,
+        voice_stream: VoiceTextStream,
+        text_normalizer: Optional["TextNormalizer"] = None,
+        trace_id: Optional[str] = None,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            voice_stream (VoiceTextStream): 文を送信するVoiceTextStream。
+            text_normalizer (Optional[TextNormalizer], optional): 正規化に使うTextNormalizer。Noneの場合は正規化せずにそのまま送信する。デフォルトはNone。
+            trace_id (Optional[str], optional): 正規化のスパンを記録するトレースID。デフォルトはNone。
+
+        """
+        self.voice_stream = voice_stream
+        self.text_normalizer = text_normalizer
+        self.trace_id = trace_id
+        self.lock = Lock()
+        # 送信待ちの文。(正規化のFuture, 元の文, 応答の終わりかどうか, 正規化の開始時刻)
+        self.pending: Deque[Tuple["Future[str]", str, bool, float]] = deque()
+
+    def send(self, text: str, sentence_end: bool = False) -> None:
+        """文の正規化を開始し、それより前の文が全て送信済みになった時点で送信する。
+
+        Args:
+            text (str): 音声合成する文。
+            sentence_end (bool, optional): 応答の終わりを通知するかどうか。デフォルトはFalse。
+
+        """
+        if self.text_normalizer is None:
+            with self.lock:
+                self.voice_stream.send(text, sentence_end=sentence_end)
+            return
+        if text == "":
+            future: "Future[str]" = Future()
+            future.set_result(text)
+        else:
+            future = self.text_normalizer.submit(text)
+        with self.lock:
+            self.pending.append((future, text, sentence_end, time.time()))
+        future.add_done_callback(lambda _: self._drain())
+
+    def _drain(self) -> None:
+        """先頭から正規化が終わっている文を順番に送信する。"""
+        with self.lock:
+            while len(self.pending) > 0 and self.pending[0][0].done():
+                future, text, sentence_end, start = self.pending.popleft()
+                try:
+                    normalized = future.result()
+                except BaseException as e:
+                    print(f"Failed to normalize text: {e}")
+                    normalized = text
+                get_tracer().record(
+                    self.trace_id,
+                    "text_normalize",
+                    start,
+                    time.time(),
+                    chars=len(text),
+                )
+                self.voice_stream.send(
+                    normalized, normalized=True, sentence_end=sentence_end
+                )
+
+    def flush(self) -> None:
+        """正規化中の文を全て待ち、送信する。"""
+        with self.lock:
+            futures = [item[0] for item in self.pending]
+        wait(futures)
+        self._drain()
+
+
+class AioVoiceTextStream(object):
+    """
+    VoiceTextStreamのgrpc.aio版。grpc.aioのVoiceServerServiceStubを使用し、イベントループ上で文を送信する。
+    StreamTextを持たない古いvoice_serverの場合は、文ごとのSetTextで送り直し、以降はSetTextを使用する。
+    """
+
+    def __init__(
+        self,
+        stub: Any,
+        use_stream: bool = True,
+        metadata: Optional[List[Tuple[str, str]]] = None,
+        max_pending: int = 8,
+    ) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            stub (Any): grpc.aioのチャンネルで作成したvoice_serverのVoiceServerServiceStub。
+            use_stream (bool, optional): StreamTextを使用するかどうか。Falseの場合は文ごとにSetTextを呼び出す。デフォルトはTrue。
+            metadata (Optional[List[Tuple[str, str]]], optional): 全てのRPCに付けるメタデータ(発話のトレースIDなど)。デフォルトはNone。
+            max_pending (int, optional): StreamTextで送信待ちにできる文の最大数。voice_serverの受信が滞った場合、sendは空きができるまで待つ。デフォルトは8。
+
+        """
+        self.stub = stub
+        self.use_stream = use_stream
+        self.metadata = metadata
+        self.max_pending = max_pending
+        self.queue: Optional[asyncio.Queue] = None
+        self.call: Optional[Any] = None
+        # 送信した文。StreamTextが使えなかった場合にSetTextで送り直す
+        self.requests: List[voice_server_pb2.StreamTextRequest] = []
+
+    async def __aenter__(self) -> "AioVoiceTextStream":
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        await self.close()
+
+    async def _request_iterator(
+        self, requests: asyncio.Queue
+    ) -> AsyncIterator[voice_server_pb2.StreamTextRequest]:
+        while True:
+            request = await requests.get()
+            if request is None:
+                return
+            yield request
+
+    def open(self) -> None:
+        """StreamTextのストリームを開始する。"""
+        self.requests = []
+        if not self.use_stream:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.call = self.stub.StreamText(
+            self._request_iterator(self.queue), metadata=self.metadata
+        )
+
+    async def send(
+        self, text: str, normalized: bool = False, sentence_end: bool = False
+    ) -> None:
+        """音声合成する文を送信する。
+
+        Args:
+            text (str): 音声合成する文。
+            normalized (bool, optional): 英単語のかな変換済みかどうか。デフォルトはFalse。
+            sentence_end (bool, optional): 応答の終わりを通知するかどうか。デフォルトはFalse。
+
+        """
+        request = voice_server_pb2.StreamTextRequest(
+            text=text, normalized=normalized, sentence_end=sentence_end
+        )
+        self.requests.append(request)
+        # ストリームが途中で終了した場合は、以降の文をSetTextで送る
+        if self.call is not None and self.call.done():
+            await self.close()
+            if self.use_stream:
+                await self._send_unary(request)
+            return
+        if self.queue is None:
+            await self._send_unary(request)
+        elif not await self._put(request):
+            # 送信待ちの間にストリームが終了した場合は、SetTextで送る
+            await self.close()
+            if self.use_stream:
+                await self._send_unary(request)
+
+    async def _put(self, request: Optional[voice_server_pb2.StreamTextRequest]) -> bool:
+        """送信待ちのキューに空きができるまで待ち、リクエストを追加する。
+
+        Returns:
+            bool: 追加できた場合はTrue。待機中にストリームが終了した場合はFalse。
+
+        """
+        requests, call = self.queue, self.call
+        if requests is None or call is None:
+            return False
+        while True:
+            try:
+                await asyncio.wait_for(requests.put(request), timeout=0.1)
+                return True
+            except asyncio.TimeoutError:
+                if call.done():
+                    return False
+
+    async def _send_unary(self, request: voice_server_pb2.StreamTextRequest) -> None:
+        try:
+            if request.text != "":
+                await self.stub.SetText(
+                    voice_server_pb2.SetTextRequest(
+                        text=request.text, normalized=request.normalized
+                    ),
+                    metadata=self.metadata,
+                )
+            if request.sentence_end:
+                await self.stub.SentenceEnd(
+                    voice_server_pb2.SentenceEndRequest(), metadata=self.metadata
+                )
+        except BaseException as e:
+            print(f"SetText error: {e}")
+
+    async def close(self) -> bool:
+        """ストリームを終了し、voice_serverの受信完了を待つ。
+
+        Returns:
+            bool: 送信に成功したかどうか。
+
+        """
+        if self.queue is None or self.call is None:
+            return True
+        await self._put(None)
+        call = self.call
+        self.queue = None
+        self.call = None
+        try:
+            return (await call).success
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                print(f"StreamText error: {e}")
+                return False
+        # StreamTextを持たないvoice_serverには、ここまでの文をSetTextで送り直す
+        print("StreamText is not implemented on voice server. Use SetText.")
+        self.use_stream = False
+        for request in self.requests:
+            await self._send_unary(request)
+        return True
+
+
+def put_stream_text(
+    text_to_voice: "TextToVoice",
+    request: voice_server_pb2.StreamTextRequest,
+    trace_id: Optional[str] = None,
+) -> bool:
+    """voice_serverが受信したStreamTextの1文を、音声合成のキューに追加する。SetTextと同様に即時再生はしない。
+
+    Args:
+        text_to_voice (TextToVoice): 音声合成を行うインスタンス。
+        request (voice_server_pb2.StreamTextRequest): 受信したリクエスト。
+        trace_id (Optional[str], optional): 文を含む発話のトレースID。デフォルトはNone。
+
+    Returns:
+        bool: 文をキューに追加した場合はTrue。応答の終わりの通知のみの場合はFalse。
+
+    """
+    added = False
+    if request.text != "":
+        print(f"Send text: {request.text}")
+        text_to_voice.put_text(
+            request.text,
+            play_now=False,
+            normalized=request.normalized,
+            trace_id=trace_id,
+        )
+        added = True
+    if request.sentence_end:
+        text_to_voice.sentence_end()
+    return added
+
+
+def receive_stream_text(
+    text_to_voice: "TextToVoice",
+    request_iterator: Iterator[voice_server_pb2.StreamTextRequest],
+    trace_id: Optional[str] = None,
+) -> voice_server_pb2.StreamTextReply:
+    """StreamTextで1回の応答の文を受信し、音声合成のキューに追加する。
+
+    Args:
+        text_to_voice (TextToVoice): 音声合成を行うインスタンス。
+        request_iterator (Iterator[voice_server_pb2.StreamTextRequest]): 受信するリクエストのイテレータ。
+        trace_id (Optional[str], optional): 応答の発話のトレースID。デフォルトはNone。
+
+    Returns:
+        voice_server_pb2.StreamTextReply: StreamTextの返り値。
+
+    """
+    num_texts = 0
+    for request in request_iterator:
+        if put_stream_text(text_to_voice, request, trace_id):
+            num_texts += 1
+    return voice_server_pb2.StreamTextReply(success=True, num_texts=num_texts)
+
+
+async def receive_stream_text_async(
+    text_to_voice: "TextToVoice",
+    request_iterator: AsyncIterator[voice_server_pb2.StreamTextRequest],
+    trace_id: Optional[str] = None,
+) -> voice_server_pb2.StreamTextReply:
+    """receive_stream_textのgrpc.aio版。受信待ちの間はイベントループを止めない。"""
+    num_texts = 0
+    async for request in request_iterator:
+        if put_stream_text(text_to_voice, request, trace_id):
+            num_texts += 1
+    return voice_server_pb2.StreamTextReply(success=True, num_texts=num_texts)
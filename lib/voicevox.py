@@ -1,8 +1,15 @@
+import copy
+import io
 import json
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from queue import Queue
-from typing import Any, Optional
+from threading import Lock
+from typing import Any, Dict, Generator, List, Optional, Tuple
 
 import requests
+from lib.audio_io import AudioSink
 from lib.text_to_voice import TextToVoice
 
 
@@ -17,6 +24,9 @@ class TextToVoiceVox(TextToVoice):
         port: str = "52001",
         motion_host: Optional[str] = "127.0.0.1",
         motion_port: Optional[str] = "50055",
+        output_sampling_rate: Optional[int] = None,
+        output_stereo: bool = False,
+        audio_sink: Optional[AudioSink] = None,
     ) -> None:
         """クラスの初期化メソッド。
         Args:
@@ -24,14 +34,33 @@ class TextToVoiceVox(TextToVoice):
             port (str, optional): VoiceVoxサーバーのポート番号。デフォルトは "52001"。
             motion_host (str, optional): モーションサーバーのホスト名。デフォルトは"127.0.0.1"。
             motion_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            output_sampling_rate (int, optional): 合成音声の出力サンプリングレート。Noneの場合はVoiceVoxのデフォルト値。
+            output_stereo (bool, optional): 合成音声をステレオで出力するかどうか。デフォルトはFalse。
+            audio_sink (AudioSink, optional): 音声の出力先。Noneの場合はPyAudioの出力デバイス。
 
         """
-        super().__init__(
-            host=host, port=port, motion_host=motion_host, motion_port=motion_port
-        )
         # デフォルトのspeakerは8(春日部つむぎ)
         self.speaker = 8
         self.speed_scale = 1.0
+        self.output_sampling_rate = output_sampling_rate
+        self.output_stereo = output_stereo
+        self.AUDIO_QUERY_CACHE_SIZE = 256  # audio_queryの結果をキャッシュする最大数
+        self.PREFETCH_SIZE = 4  # 先読みして合成しておく文の最大数
+        self.STREAM_CHUNK_SIZE = 4096  # 音声データを受信しながら再生する際のチャンクサイズ
+        self.audio_query_cache: OrderedDict[Tuple[str, int], dict] = OrderedDict()
+        self.cache_lock = Lock()
+        # 先読み合成中の音声。キーは(テキスト, 話者番号, 再生速度)
+        self.wav_futures: Dict[Tuple[str, int, float], Future] = {}
+        self.wav_futures_lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.closed = False  # 先読み合成のスレッドプールを終了したかどうか
+        super().__init__(
+            host=host,
+            port=port,
+            motion_host=motion_host,
+            motion_port=motion_port,
+            audio_sink=audio_sink,
+        )
 
     def set_param(
         self,
@@ -50,6 +79,9 @@ class TextToVoiceVox(TextToVoice):
             self.speaker = speaker
         elif speed_scale is not None:
             self.speed_scale = speed_scale
+        # 変更前のパラメータで先読み合成した音声は使用されないため破棄する
+        with self.wav_futures_lock:
+            self.wav_futures.clear()
 
     def post_audio_query(
         self,
@@ -79,6 +111,47 @@ class TextToVoiceVox(TextToVoice):
         res = requests.post(address, params=params)
         return res.json()
 
+    def get_audio_query(self, text: str) -> Optional[dict]:
+        """音声合成クエリを取得する。
+        アクセント句はテキストと話者のみで決まるため、結果をキャッシュして再利用する。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+
+        Returns:
+            Optional[dict]: 音声合成クエリ。textが空の場合はNone。
+
+        """
+        key = (text, self.speaker)
+        with self.cache_lock:
+            if key in self.audio_query_cache:
+                self.audio_query_cache.move_to_end(key)
+                return copy.deepcopy(self.audio_query_cache[key])
+        res = self.post_audio_query(text)
+        if res is None:
+            return None
+        with self.cache_lock:
+            self.audio_query_cache[key] = res
+            while len(self.audio_query_cache) > self.AUDIO_QUERY_CACHE_SIZE:
+                self.audio_query_cache.popitem(last=False)
+        return copy.deepcopy(res)
+
+    def apply_query_param(self, audio_query_response: dict) -> dict:
+        """音声合成クエリに再生速度と出力フォーマットを設定する。
+
+        Args:
+            audio_query_response (dict): 音声合成クエリの応答。
+
+        Returns:
+            dict: パラメータを設定した音声合成クエリ。
+
+        """
+        audio_query_response["speedScale"] = self.speed_scale
+        if self.output_sampling_rate is not None:
+            audio_query_response["outputSamplingRate"] = self.output_sampling_rate
+        audio_query_response["outputStereo"] = self.output_stereo
+        return audio_query_response
+
     def post_synthesis(
         self,
         audio_query_response: dict,
@@ -94,14 +167,207 @@ class TextToVoiceVox(TextToVoice):
         """
         params = {"speaker": self.speaker}
         headers = {"content-type": "application/json"}
-        audio_query_response["speedScale"] = self.speed_scale
-        audio_query_response_json = json.dumps(audio_query_response)
+        audio_query_response_json = json.dumps(
+            self.apply_query_param(audio_query_response)
+        )
         address = "http://" + self.host + ":" + self.port + "/synthesis"
         res = requests.post(
             address, data=audio_query_response_json, params=params, headers=headers
         )
         return res.content
 
+    def post_synthesis_stream(
+        self,
+        audio_query_response: dict,
+    ) -> Generator[bytes, None, None]:
+        """
+        VoiceVoxサーバーに音声合成要求を送信し、合成された音声データを受信しながら順次返す。
+
+        Args:
+            audio_query_response (dict): 音声合成クエリの応答。
+
+        Yields:
+            bytes: 受信した音声データのチャンク。
+        """
+        params = {"speaker": self.speaker}
+        headers = {"content-type": "application/json"}
+        audio_query_response_json = json.dumps(
+            self.apply_query_param(audio_query_response)
+        )
+        address = "http://" + self.host + ":" + self.port + "/synthesis"
+        with requests.post(
+            address,
+            data=audio_query_response_json,
+            params=params,
+            headers=headers,
+            stream=True,
+        ) as res:
+            yield from res.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+
+    def post_multi_synthesis(
+        self,
+        audio_query_responses: List[dict],
+    ) -> List[bytes]:
+        """
+        VoiceVoxサーバーに複数文の音声合成要求をまとめて送信し、合成された音声データを取得する。
+
+        Args:
+            audio_query_responses (List[dict]): 音声合成クエリの応答のリスト。
+
+        Returns:
+            List[bytes]: 合成された音声データのリスト。audio_query_responsesと同じ順番。
+        """
+        params = {"speaker": self.speaker}
+        headers = {"content-type": "application/json"}
+        audio_query_responses_json = json.dumps(
+            [self.apply_query_param(query) for query in audio_query_responses]
+        )
+        address = "http://" + self.host + ":" + self.port + "/multi_synthesis"
+        res = requests.post(
+            address, data=audio_query_responses_json, params=params, headers=headers
+        )
+        res.raise_for_status()
+        # 合成結果は連番のwavファイルを含むzipで返される
+        with zipfile.ZipFile(io.BytesIO(res.content)) as zip_file:
+            return [zip_file.read(name) for name in sorted(zip_file.namelist())]
+
+    def wav_key(self, text: str) -> Tuple[str, int, float]:
+        """先読み合成した音声を識別するキーを返す。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+
+        Returns:
+            Tuple[str, int, float]: テキスト、話者番号、再生速度の組。
+
+        """
+        return (text, self.speaker, self.speed_scale)
+
+    def synthesize(self, text: str) -> Optional[bytes]:
+        """テキストから音声を合成する。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+
+        Returns:
+            Optional[bytes]: 合成された音声データ。textが空の場合はNone。
+
+        """
+        res = self.get_audio_query(text)
+        if res is None:
+            return None
+        return self.post_synthesis(res)
+
+    def synthesize_batch(self, texts: List[str], futures: List[Future]) -> None:
+        """複数のテキストをmulti_synthesisでまとめて合成し、結果をfuturesに格納する。
+
+        Args:
+            texts (List[str]): 音声合成対象のテキストのリスト。
+            futures (List[Future]): 合成結果を格納するFutureのリスト。
+
+        """
+        try:
+            queries = [self.get_audio_query(text) for text in texts]
+            wavs = self.post_multi_synthesis(queries)
+            for future, wav in zip(futures, wavs):
+                future.set_result(wav)
+        except BaseException as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+    def prefetch_upcoming(self) -> None:
+        """キューで待機しているテキストの音声合成を、再生中の文と並行して先に実行する。
+        次に再生する先頭の文は単独で合成し、それ以降の文はmulti_synthesisでまとめて合成する。
+        """
+        upcoming = []
+        for text_future in list(self.queue.queue)[: self.PREFETCH_SIZE]:
+            # 正規化が終わっていない文以降は、次回の先読みで合成する
+            if not text_future.done():
+                break
+            text = text_future.result()
+            if len(text.strip()) > 0:
+                upcoming.append(text)
+        pending_texts = []
+        pending_futures: List[Future] = []
+        # 合成結果は再生時にtext_to_voiceが取り出すまで保持する。
+        # 音声合成スレッドがキューから取り出した直後の文の結果も残すため、ここでは破棄しない
+        with self.wav_futures_lock:
+            for text in upcoming:
+                key = self.wav_key(text)
+                if key in self.wav_futures:
+                    continue
+                future: Future = Future()
+                self.wav_futures[key] = future
+                pending_texts.append(text)
+                pending_futures.append(future)
+        if len(pending_texts) == 0:
+            return
+        # 先頭の文はまとめて合成するとバッチ全体の合成を待つことになるため、単独で合成する
+        try:
+            pending_futures[0].set_result(self.synthesize(pending_texts[0]))
+        except BaseException as e:
+            pending_futures[0].set_exception(e)
+        if len(pending_texts) == 2:
+            try:
+                pending_futures[1].set_result(self.synthesize(pending_texts[1]))
+            except BaseException as e:
+                pending_futures[1].set_exception(e)
+        elif len(pending_texts) > 2:
+            self.synthesize_batch(pending_texts[1:], pending_futures[1:])
+
+    def start_prefetch(self) -> None:
+        """先読み合成をスレッドプールで開始する。スレッドプールの終了後は何もしない。"""
+        with self.wav_futures_lock:
+            if self.closed:
+                return
+            self.executor.submit(self.prefetch_upcoming)
+
+    def __exit__(self) -> None:
+        """先読み合成のスレッドプールと、音声合成スレッドを終了する。"""
+        with self.wav_futures_lock:
+            self.closed = True
+            self.wav_futures.clear()
+        self.executor.shutdown(wait=False)
+        super().__exit__()
+
+    def clear_queue(self) -> None:
+        """再生待ちのテキストと、その先読み合成の結果を全て破棄する。"""
+        super().clear_queue()
+        with self.wav_futures_lock:
+            self.wav_futures.clear()
+
+    def put_text(
+        self,
+        text: str,
+        play_now: bool = True,
+        blocking: bool = False,
+        normalized: bool = False,
+        trace_id: Optional[str] = None,
+    ) -> "Future[str]":
+        """
+        音声合成のためのテキストをキューに追加し、正規化の完了後に先読み合成を開始する。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+            play_now (bool, optional): すぐに音声再生を開始するかどうか。デフォルトはTrue。
+            blocking (bool, optional): 音声合成が完了するまでブロックするかどうか。デフォルトはFalse。
+            normalized (bool, optional): textが正規化済みかどうか。デフォルトはFalse。
+            trace_id (Optional[str], optional): テキストを含む発話のトレースID。デフォルトはNone。
+
+        Returns:
+            Future[str]: 正規化したテキストを返すFuture。
+
+        """
+        text_future = super().put_text(
+            text, play_now=play_now, normalized=normalized, trace_id=trace_id
+        )
+        if self.PREFETCH_SIZE > 0:
+            text_future.add_done_callback(lambda _: self.start_prefetch())
+        if blocking:
+            self.wait_finish()
+        return text_future
+
     def text_to_voice(self, text: str) -> None:
         """
         テキストから音声を合成して再生する。
@@ -110,13 +376,29 @@ class TextToVoiceVox(TextToVoice):
             text (str): 音声合成対象のテキスト。
 
         """
-        res = self.post_audio_query(text)
-        if res is None:
+        if len(text.strip()) <= 0:
             return
-        wav = self.post_synthesis(res)
+        with self.wav_futures_lock:
+            future = self.wav_futures.pop(self.wav_key(text), None)
+        # 後続の文のaudio_queryと合成を、この文の合成・再生と並行して行う
+        if self.PREFETCH_SIZE > 0 and not self.queue.empty():
+            self.start_prefetch()
+        wav = None
+        if future is not None:
+            try:
+                wav = future.result()
+            except BaseException as e:
+                print(f"Prefetch synthesis error: {e}")
         if wav is not None:
             print(f"[Play] {text}")
             self.play_wav(wav)
+            return
+        # 先読みされていない場合は、受信しながら再生する
+        res = self.get_audio_query(text)
+        if res is None:
+            return
+        print(f"[Play] {text}")
+        self.play_wav_stream(self.post_synthesis_stream(res))
 
 
 class TextToVoiceVoxWeb(TextToVoiceVox):
@@ -129,12 +411,14 @@ class TextToVoiceVoxWeb(TextToVoiceVox):
         apikey: str,
         motion_host: Optional[str] = "127.0.0.1",
         motion_port: Optional[str] = "50055",
+        audio_sink: Optional[AudioSink] = None,
     ) -> None:
         """クラスの初期化メソッド。
         Args:
             apikey (str): VoiceVox wweb版のAPIキー。
             motion_host (str, optional): モーションサーバーのホスト名。デフォルトは"127.0.0.1"。
             motion_port (str, optional): モーションサーバーのポート番号。デフォルトは"50055"。
+            audio_sink (AudioSink, optional): 音声の出力先。Noneの場合はPyAudioの出力デバイス。
 
         """
         super().__init__(
@@ -142,9 +426,12 @@ class TextToVoiceVoxWeb(TextToVoiceVox):
             port="0000",
             motion_host=motion_host,
             motion_port=motion_port,
+            audio_sink=audio_sink,
         )
-        self.queue: Queue[str] = Queue()
+        self.queue: Queue[Future[str]] = Queue()
         self.apikey = apikey
+        # web版はaudio_queryを使用しないため、先読み合成は行わない
+        self.PREFETCH_SIZE = 0
 
     def post_web(
         self,
@@ -187,6 +474,43 @@ class TextToVoiceVoxWeb(TextToVoiceVox):
         res = requests.post(address)
         return res.content
 
+    def post_web_stream(
+        self,
+        text: str,
+        speaker: int = 8,
+        pitch: int = 0,
+        intonation_scale: int = 1,
+        speed: int = 1,
+    ) -> Generator[bytes, None, None]:
+        """
+        VoiceVoxウェブAPIに音声合成要求を送信し、合成された音声データを受信しながら順次返す。
+
+        Args:
+            text (str): 音声合成対象のテキスト。
+            speaker (int, optional): VoiceVoxの話者番号。デフォルトは8(春日部つむぎ)。
+            pitch (int, optional): ピッチ。デフォルトは0。
+            intonation_scale (int, optional): イントネーションスケール。デフォルトは1。
+            speed (int, optional): 音声の速度。デフォルトは1。
+
+        Yields:
+            bytes: 受信した音声データのチャンク。
+
+        """
+        params = {
+            "key": self.apikey,
+            "speaker": speaker,
+            "pitch": pitch,
+            "intonationScale": intonation_scale,
+            "speed": speed,
+            "text": text,
+        }
+        with requests.post(
+            "https://deprecatedapis.tts.quest/v2/voicevox/audio/",
+            params=params,
+            stream=True,
+        ) as res:
+            yield from res.iter_content(chunk_size=self.STREAM_CHUNK_SIZE)
+
     def text_to_voice(self, text: str) -> None:
         """
         テキストから音声を合成して再生する。
@@ -195,7 +519,7 @@ class TextToVoiceVoxWeb(TextToVoiceVox):
             text (str): 音声合成対象のテキスト。
 
         """
-        wav = self.post_web(text=text)
-        if wav is not None:
-            print(f"[Play] {text}")
-            self.play_wav(wav)
+        if len(text.strip()) <= 0:
+            return
+        print(f"[Play] {text}")
+        self.play_wav_stream(self.post_web_stream(text=text))
@@ -0,0 +1,152 @@
+import struct
+from typing import Generator, Iterable, Optional, Tuple, Union
+
+# RIFFヘッダ("RIFF" + サイズ + "WAVE")のバイト数
+RIFF_HEADER_SIZE = 12
+# チャンクヘッダ(ID + サイズ)のバイト数
+CHUNK_HEADER_SIZE = 8
+# ストリーミング出力などでdataチャンクのサイズが不定の場合に使われる値
+UNKNOWN_DATA_SIZE = (0, 0xFFFFFFFF)
+
+
+class WavFormat(object):
+    """
+    WAVファイルのフォーマット情報を保持するクラス。
+    """
+
+    def __init__(self, sampwidth: int, channels: int, rate: int) -> None:
+        """クラスの初期化メソッド。
+
+        Args:
+            sampwidth (int): 1サンプルあたりのバイト数。
+            channels (int): チャンネル数。
+            rate (int): サンプリングレート。
+
+        """
+        self.sampwidth = sampwidth
+        self.channels = channels
+        self.rate = rate
+
+    @property
+    def frame_size(self) -> int:
+        """1フレームあたりのバイト数を返す。"""
+        return self.sampwidth * self.channels
+
+
+def parse_wav_header(
+    buf: Union[bytes, bytearray, memoryview]
+) -> Optional[Tuple[WavFormat, int, Optional[int]]]:
+    """WAVコンテナを解析し、フォーマットとdataチャンクの位置を取得する。
+    データのコピーは行わず、bufのdataチャンクの開始位置のみを返す。
+
+    Args:
+        buf (Union[bytes, bytearray, memoryview]): WAVデータの先頭部分。
+
+    Returns:
+        Optional[Tuple[WavFormat, int, Optional[int]]]: フォーマット、dataチャンクの開始位置、dataチャンクのバイト数。
+            dataチャンクのバイト数が不定の場合はNone。ヘッダが揃っていない場合はNoneを返す。
+
+    Raises:
+        ValueError: WAVフォーマットでない場合。
+
+    """
+    view = memoryview(buf).cast("B")
+    if len(view) < RIFF_HEADER_SIZE:
+        return None
+    if view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("Not a WAV file")
+    wav_format = None
+    pos = RIFF_HEADER_SIZE
+    while pos + CHUNK_HEADER_SIZE <= len(view):
+        chunk_id = bytes(view[pos : pos + 4])
+        (chunk_size,) = struct.unpack_from("<I", view, pos + 4)
+        body = pos + CHUNK_HEADER_SIZE
+        if chunk_id == b"data":
+            if wav_format is None:
+                raise ValueError("fmt chunk not found before data chunk")
+            data_size = None if chunk_size in UNKNOWN_DATA_SIZE else chunk_size
+            return wav_format, body, data_size
+        if body + chunk_size > len(view):
+            return None
+        if chunk_id == b"fmt ":
+            channels, rate = struct.unpack_from("<HI", view, body + 2)
+            (bits,) = struct.unpack_from("<H", view, body + 14)
+            wav_format = WavFormat(sampwidth=bits // 8, channels=channels, rate=rate)
+        # チャンクは2バイト境界に揃えられる
+        pos = body + chunk_size + (chunk_size & 1)
+    return None
+
+
+class WavStreamParser(object):
+    """
+    分割して受信したWAVデータを逐次解析し、PCMデータをフレーム境界で切り出すクラス。
+    """
+
+    def __init__(self) -> None:
+        """クラスの初期化メソッド。"""
+        self.format: Optional[WavFormat] = None
+        self._header = bytearray()
+        self._remain: Optional[int] = None  # dataチャンクの残りバイト数。不定の場合はNone
+        self._pending = bytearray()  # フレーム境界に満たない端数
+
+    def feed(
+        self, chunk: Union[bytes, bytearray, memoryview]
+    ) -> Generator[memoryview, None, None]:
+        """受信したデータを解析し、再生可能なPCMデータを返す。
+
+        Args:
+            chunk (Union[bytes, bytearray, memoryview]): 受信したデータ。
+
+        Yields:
+            memoryview: フレーム境界に揃えたPCMデータ。
+
+        """
+        view = memoryview(chunk).cast("B")
+        if self.format is None:
+            if len(self._header) > 0:
+                # ヘッダが複数チャンクに分かれている場合のみ結合する
+                self._header += view
+                view = memoryview(bytes(self._header))
+            header = parse_wav_header(view)
+            if header is None:
+                if len(self._header) == 0:
+                    self._header += view
+                return
+            self.format, offset, self._remain = header
+            view = view[offset:]
+            self._header = bytearray()
+        if self._remain is not None:
+            view = view[: self._remain]
+            self._remain -= len(view)
+        if len(self._pending) > 0:
+            # 前回の端数と結合して1フレーム分を作る
+            need = self.format.frame_size - len(self._pending)
+            self._pending += view[:need]
+            view = view[need:]
+            if len(self._pending) < self.format.frame_size:
+                return
+            yield memoryview(bytes(self._pending))
+            self._pending = bytearray()
+        end = len(view) - len(view) % self.format.frame_size
+        if end > 0:
+            yield view[:end]
+        if end < len(view):
+            self._pending += view[end:]
+
+
+def iter_wav_frames(
+    chunks: Iterable[Union[bytes, bytearray, memoryview]]
+) -> Generator[Tuple[WavFormat, memoryview], None, None]:
+    """分割されたWAVデータから、フォーマットとPCMデータを順次取り出す。
+
+    Args:
+        chunks (Iterable[Union[bytes, bytearray, memoryview]]): WAVデータのチャンク列。
+
+    Yields:
+        Tuple[WavFormat, memoryview]: フォーマットとフレーム境界に揃えたPCMデータ。
+
+    """
+    parser = WavStreamParser()
+    for chunk in chunks:
+        for data in parser.feed(chunk):
+            yield parser.format, data
@@ -3,7 +3,7 @@ import os
 import sys
 import time
 
-import grpc
+from lib.grpc_channel import get_channel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import gpt_server_pb2
@@ -34,9 +34,9 @@ def main() -> None:
     )
     args = parser.parse_args()
     # grpc stubの設定
-    gpt_channel = grpc.insecure_channel(args.gpt_ip + ":" + args.gpt_port)
+    gpt_channel = get_channel(args.gpt_ip + ":" + args.gpt_port)
     gpt_stub = gpt_server_pb2_grpc.GptServerServiceStub(gpt_channel)
-    voice_channel = grpc.insecure_channel(args.voice_ip + ":" + args.voice_port)
+    voice_channel = get_channel(args.voice_ip + ":" + args.voice_port)
     voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
 
     while True:
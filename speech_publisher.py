@@ -3,9 +3,22 @@ import os
 import sys
 import time
 from concurrent import futures
+from typing import Optional
 
 import grpc
+from lib.audio_io import WavFileSource, create_audio_source
+from lib.dispatch_policy import DispatchPolicy
 from lib.google_speech import get_db_thresh
+from lib.grpc_channel import get_channel, server_options
+from lib.metrics import (
+    MetricsServerInterceptor,
+    add_callback,
+    gauge,
+    start_metrics_server,
+)
+from lib.recognizer import load_replay_script
+from lib.tracing import configure_tracing
+from lib.vad import NoiseFloorEstimator, create_vad
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import motion_server_pb2
@@ -20,12 +33,25 @@ CHUNK = int(RATE / 10)  # 100ms
 POWER_THRESH_DIFF = 20  # 周辺音量にこの値を足したものをpower_threshouldとする
 enable_input = True
 
+VAD_THRESHOLD_DB = gauge("vad_threshold_db", "Current power threshold of VAD [dB]")
+VAD_NOISE_FLOOR_DB = gauge(
+    "vad_noise_floor_db", "Current estimated noise floor of microphone input [dB]"
+)
+SPEECH_INPUT_ENABLED = gauge(
+    "speech_input_enabled", "1 if microphone input is enabled by ToggleSpeech"
+)
+
 
 class SpeechServer(speech_server_pb2_grpc.SpeechServerServiceServicer):
     """
     音声入力の制御用のgRPCサーバ
     """
 
+    def __init__(self) -> None:
+        # 周囲音量の推定器。音量閾値を固定する場合はNone
+        self.noise_floor_estimator: Optional[NoiseFloorEstimator] = None
+        self.power_threshold = 0.0
+
     def ToggleSpeech(
         self,
         request: speech_server_pb2.ToggleSpeechRequest,
@@ -35,6 +61,32 @@ class SpeechServer(speech_server_pb2_grpc.SpeechServerServiceServicer):
         enable_input = request.enable
         return speech_server_pb2.ToggleSpeechReply(success=True)
 
+    def GetNoiseLevel(
+        self,
+        request: speech_server_pb2.GetNoiseLevelRequest,
+        context: grpc.ServicerContext,
+    ) -> speech_server_pb2.GetNoiseLevelReply:
+        estimator = self.noise_floor_estimator
+        if estimator is None or estimator.noise_floor is None:
+            return speech_server_pb2.GetNoiseLevelReply(
+                adaptive=False, power_threshold=self.power_threshold
+            )
+        return speech_server_pb2.GetNoiseLevelReply(
+            adaptive=True,
+            noise_floor=estimator.noise_floor,
+            power_threshold=estimator.threshold,
+        )
+
+    def update_metrics(self) -> None:
+        """メトリクスの出力前に、現在の発話判定閾値と周辺音量を更新する。"""
+        SPEECH_INPUT_ENABLED.set(1 if enable_input else 0)
+        estimator = self.noise_floor_estimator
+        if estimator is None or estimator.noise_floor is None:
+            VAD_THRESHOLD_DB.set(self.power_threshold)
+            return
+        VAD_THRESHOLD_DB.set(estimator.threshold)
+        VAD_NOISE_FLOOR_DB.set(estimator.noise_floor)
+
 
 def main() -> None:
     global enable_input
@@ -62,7 +114,7 @@ def main() -> None:
         "--timeout",
         type=float,
         default=0.5,
-        help="Microphone input power timeout",
+        help="Microphone input power timeout (maximum hangover if --vad feature)",
     )
     parser.add_argument(
         "-p",
@@ -77,6 +129,65 @@ def main() -> None:
         default=8,
         help="Send the progress of speech recognition if recognition word count over this number ",
     )
+    parser.add_argument(
+        "--early_stability",
+        type=float,
+        default=0.6,
+        help="Send the progress if the stability of interim result is over this value",
+    )
+    parser.add_argument(
+        "--early_agreement",
+        type=float,
+        default=0.9,
+        help="Send the progress if the prefix agreement with previous interim result is over this value",
+    )
+    parser.add_argument(
+        "--early_max_wait",
+        type=float,
+        default=1.5,
+        help="Send the progress regardless of stability after this time from speech start [sec]",
+    )
+    parser.add_argument(
+        "--speculate",
+        help="Start generating the final response from stable interim results",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--speculate_stability",
+        type=float,
+        default=0.8,
+        help="Start speculative generation if the stability of interim result is over this value",
+    )
+    parser.add_argument(
+        "--speculate_min_elapsed",
+        type=float,
+        default=1.0,
+        help="Minimum time from the first interim result to start speculative generation [sec]",
+    )
+    parser.add_argument(
+        "--dispatch_log",
+        type=str,
+        default=None,
+        help="Log every dispatch decision of interim results to this jsonl file",
+    )
+    parser.add_argument(
+        "--session_id",
+        type=str,
+        default=None,
+        help="Session id on gpt server. Set a unique id per robot to share one gpt server",
+    )
+    parser.add_argument(
+        "--session_voice_address",
+        type=str,
+        default=None,
+        help="Voice server address (host:port) of this robot seen from gpt server",
+    )
+    parser.add_argument(
+        "--session_motion_address",
+        type=str,
+        default=None,
+        help="Motion server address (host:port) of this robot seen from gpt server",
+    )
     parser.add_argument(
         "--no_motion",
         help="Not play nod motion",
@@ -92,7 +203,75 @@ def main() -> None:
         action="store_true",
         help="Use google speech v2 instead of v1",
     )
+    parser.add_argument(
+        "--vad",
+        type=str,
+        default="power",
+        choices=["power", "feature"],
+        help="Voice activity detector",
+    )
+    parser.add_argument(
+        "--vad_frame_ms",
+        type=int,
+        default=20,
+        help="Frame length of feature vad [ms]",
+    )
+    parser.add_argument(
+        "--min_hangover",
+        type=float,
+        default=0.2,
+        help="Minimum hangover of feature vad [sec]",
+    )
+    parser.add_argument(
+        "--pre_roll",
+        type=float,
+        default=0.3,
+        help="Length of audio sent from before speech start [sec]",
+    )
+    parser.add_argument(
+        "--noise_window",
+        type=float,
+        default=30.0,
+        help="Window of ambient noise tracking [sec]. 0 to fix the power threshold at startup",
+    )
+    parser.add_argument(
+        "--noise_percentile",
+        type=float,
+        default=10.0,
+        help="Percentile of input power used as the noise floor",
+    )
+    parser.add_argument(
+        "--input_wav",
+        type=str,
+        default=None,
+        help="Use this wav file as audio input instead of microphone",
+    )
+    parser.add_argument(
+        "--replay_script",
+        type=str,
+        default=None,
+        help="Replay scripted transcripts from this json instead of google speech",
+    )
+    parser.add_argument(
+        "--trace_file",
+        type=str,
+        default=None,
+        help="Append latency trace spans to this jsonl file",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=10013,
+        help="Port of the Prometheus metrics HTTP endpoint. 0 disables",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default="127.0.0.1",
+        help="Address the Prometheus metrics HTTP endpoint listens on",
+    )
     args = parser.parse_args()
+    configure_tracing(args.trace_file, "speech_publisher")
     if args.v2:
         from lib.google_speech_v2_grpc import GoogleSpeechV2Grpc as GoogleSpeechGrpc
         from lib.google_speech_v2_grpc import (
@@ -108,71 +287,135 @@ def main() -> None:
         motion_server_port = args.robot_port
     timeout: float = args.timeout
     power_threshold: float = args.power_threshold
+    # スクリプトの認識結果を再生する場合は、google speechに接続しない
+    recognizer = None
+    audio_source = None
+    if args.replay_script is not None:
+        recognizer = load_replay_script(args.replay_script, RATE)
+        if args.input_wav is None and recognizer.wav_path is not None:
+            audio_source = WavFileSource(recognizer.wav_path)
+    if audio_source is None:
+        audio_source = create_audio_source(args.input_wav)
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        interceptors=[MetricsServerInterceptor()],
+    )
+    speech_server = SpeechServer()
+    add_callback(speech_server.update_metrics)
     speech_server_pb2_grpc.add_SpeechServerServiceServicer_to_server(
-        SpeechServer(), server
+        speech_server, server
     )
     port = "10003"
     server.add_insecure_port("[::]:" + port)
     server.start()
     print(f"speech_server start. port: {port}")
+    start_metrics_server(args.metrics_port, host=args.metrics_host)
 
     # grpc stubの設定
-    voice_channel = grpc.insecure_channel(args.voice_ip + ":" + args.voice_port)
+    voice_channel = get_channel(args.voice_ip + ":" + args.voice_port)
     voice_stub = voice_server_pb2_grpc.VoiceServerServiceStub(voice_channel)
 
+    dispatch_policy = DispatchPolicy(
+        early_min_chars=args.progress_report_len,
+        early_stability=args.early_stability,
+        early_agreement=args.early_agreement,
+        early_max_wait=args.early_max_wait,
+        speculate=args.speculate,
+        speculate_stability=args.speculate_stability,
+        speculate_min_elapsed=args.speculate_min_elapsed,
+        log_path=args.dispatch_log,
+    )
     google_speech_grpc = GoogleSpeechGrpc(
         gpt_host=args.gpt_ip,
         gpt_port=args.gpt_port,
         voice_host=args.voice_ip,
         voice_port=args.voice_port,
+        dispatch_policy=dispatch_policy,
+        session_id=args.session_id,
+        session_voice_address=args.session_voice_address,
+        session_motion_address=args.session_motion_address,
     )
     # power_threshouldが指定されていない場合、周辺音量を収録し、発話判定閾値を決定
+    noise_floor_estimator = None
     if power_threshold == 0:
-        power_threshold = get_db_thresh() + POWER_THRESH_DIFF
+        noise_floor = get_db_thresh(audio_source)
+        power_threshold = noise_floor + POWER_THRESH_DIFF
+        # 以降もマイク入力から周辺音量を推定し続け、発話判定閾値を追従させる
+        if args.noise_window > 0:
+            noise_floor_estimator = NoiseFloorEstimator(
+                rate=RATE,
+                chunk=CHUNK,
+                window=args.noise_window,
+                percentile=args.noise_percentile,
+                margin=POWER_THRESH_DIFF,
+                initial_floor=noise_floor,
+            )
     print(f"power_threshold set to {power_threshold:.3f}db")
+    speech_server.noise_floor_estimator = noise_floor_estimator
+    speech_server.power_threshold = power_threshold
+    vad = create_vad(
+        args.vad,
+        RATE,
+        power_threshold,
+        timeout,
+        frame_ms=args.vad_frame_ms,
+        min_hangover=args.min_hangover,
+        max_samples=CHUNK,
+    )
 
-    while True:
-        responses = None
-        while not enable_input:
-            time.sleep(0.01)
-        with MicrophoneStreamGrpc(
-            rate=RATE,
-            chunk=CHUNK,
-            _timeout_thresh=timeout,
-            _db_thresh=power_threshold,
-            gpt_host=args.gpt_ip,
-            gpt_port=args.gpt_port,
-            voice_host=args.voice_ip,
-            voice_port=args.voice_port,
-            motion_server_host=motion_server_host,
-            motion_server_port=motion_server_port,
-        ) as stream:
-            if not args.auto:
-                print("Enterを入力してから、マイクに話しかけてください")
-                input()
+    # 音声認識クライアント、gRPCのチャンネル、音声入力デバイスは発話をまたいで使い回す
+    stream = MicrophoneStreamGrpc(
+        rate=RATE,
+        chunk=CHUNK,
+        _timeout_thresh=timeout,
+        _db_thresh=power_threshold,
+        gpt_host=args.gpt_ip,
+        gpt_port=args.gpt_port,
+        voice_host=args.voice_ip,
+        voice_port=args.voice_port,
+        motion_server_host=motion_server_host,
+        motion_server_port=motion_server_port,
+        audio_source=audio_source,
+        vad=vad,
+        pre_roll=args.pre_roll,
+        persistent=True,
+        noise_floor_estimator=noise_floor_estimator,
+        recognizer=recognizer,
+        session_id=args.session_id,
+    )
+    try:
+        while True:
+            responses = None
+            while not enable_input:
+                time.sleep(0.01)
+            # 発話ごとに作成するのは音声認識のストリームのみ
+            with stream:
+                if not args.auto:
+                    print("Enterを入力してから、マイクに話しかけてください")
+                    input()
+                    try:
+                        voice_stub.DisableVoicePlay(
+                            voice_server_pb2.DisableVoicePlayRequest()
+                        )
+                    except BaseException:
+                        pass
                 try:
-                    voice_stub.DisableVoicePlay(
-                        voice_server_pb2.DisableVoicePlayRequest()
-                    )
+                    responses = stream.transcribe()
                 except BaseException:
-                    pass
-            try:
-                responses = stream.transcribe()
-            except BaseException:
-                google_speech_grpc.interrupt()
-                continue
-            if responses is not None:
-                try:
-                    google_speech_grpc.listen_publisher_grpc(
-                        responses, progress_report_len=args.progress_report_len
-                    )
-                except BaseException as e:
-                    print(e)
                     google_speech_grpc.interrupt()
                     continue
-        print("")
+                if responses is not None:
+                    try:
+                        google_speech_grpc.listen_publisher_grpc(responses)
+                    except BaseException as e:
+                        print(e)
+                        google_speech_grpc.interrupt()
+                        continue
+            print("")
+    finally:
+        stream.close()
 
 
 if __name__ == "__main__":
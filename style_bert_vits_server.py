@@ -1,12 +1,22 @@
 import argparse
+import asyncio
 import os
 import sys
 import time
 from concurrent import futures
-from typing import Any
+from typing import Any, AsyncIterator, Iterator
 
 import grpc
+from lib.audio_io import create_audio_sink
+from lib.grpc_channel import server_options
+from lib.metrics import (
+    AioMetricsServerInterceptor,
+    MetricsServerInterceptor,
+    start_metrics_server,
+)
 from lib.style_bert_vits import TextToStyleBertVits
+from lib.tracing import configure_tracing, get_tracer, trace_id_from_context
+from lib.voice_text_stream import receive_stream_text, receive_stream_text_async
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import voice_server_pb2
@@ -28,22 +38,41 @@ class VoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
     ) -> voice_server_pb2.SetTextReply:
         # 即時再生しないようにis_playはFalseで実行
         print(f"Send text: {request.text}")
-        self.text_to_voice.put_text(request.text, play_now=False)
+        self.text_to_voice.put_text(
+            request.text,
+            play_now=False,
+            normalized=request.normalized,
+            trace_id=trace_id_from_context(context),
+        )
         return voice_server_pb2.SetTextReply(success=True)
 
+    def StreamText(
+        self,
+        request_iterator: Iterator[voice_server_pb2.StreamTextRequest],
+        context: grpc.ServicerContext,
+    ) -> voice_server_pb2.StreamTextReply:
+        # 1回の応答の文を1本のストリームで受け取る。SetTextと同様に即時再生はしない
+        return receive_stream_text(
+            self.text_to_voice, request_iterator, trace_id_from_context(context)
+        )
+
     def SetStyleBertVitsParam(
         self,
         request: voice_server_pb2.SetStyleBertVitsParamRequest(),
         context: grpc.ServicerContext,
     ) -> voice_server_pb2.SetStyleBertVitsParamReply:
-        if request.model_name:
-            self.text_to_voice.set_param(model_name=request.model_name)
-        if request.length:
-            self.text_to_voice.set_param(length=request.length)
-        if request.style:
-            self.text_to_voice.set_param(style=request.style)
-        if request.style_weight:
-            self.text_to_voice.set_param(style_weight=request.style_weight)
+        try:
+            if request.model_name:
+                self.text_to_voice.set_param(model_name=request.model_name)
+            if request.length:
+                self.text_to_voice.set_param(length=request.length)
+            if request.style:
+                self.text_to_voice.set_param(style=request.style)
+            if request.style_weight:
+                self.text_to_voice.set_param(style_weight=request.style_weight)
+        except ValueError as e:
+            print(f"SetStyleBertVitsParam error: {e}")
+            return voice_server_pb2.SetStyleBertVitsParamReply(success=False)
         return voice_server_pb2.SetStyleBertVitsParamReply(success=True)
 
     def SetVoicevoxParam(
@@ -59,8 +88,7 @@ class VoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
         request: voice_server_pb2.InterruptVoiceRequest(),
         context: grpc.ServicerContext,
     ) -> voice_server_pb2.InterruptVoiceReply:
-        while not self.text_to_voice.queue.empty():
-            self.text_to_voice.queue.get()
+        self.text_to_voice.clear_queue()
         return voice_server_pb2.InterruptVoiceReply(success=True)
 
     def EnableVoicePlay(
@@ -68,6 +96,9 @@ class VoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
         request: voice_server_pb2.EnableVoicePlayRequest(),
         context: grpc.ServicerContext,
     ) -> voice_server_pb2.EnableVoicePlayReply:
+        get_tracer().record(
+            trace_id_from_context(context), "enable_voice_play", time.time()
+        )
         self.text_to_voice.enable_voice_play()
         return voice_server_pb2.EnableVoicePlayReply(success=True)
 
@@ -105,6 +136,45 @@ class VoiceServer(voice_server_pb2_grpc.VoiceServerServiceServicer):
         return voice_server_pb2.StartHeadControlReply(success=False)
 
 
+class AioVoiceServer(VoiceServer):
+    """
+    VoiceServerのgrpc.aio版。SetTextとStreamTextをイベントループ上のコルーチンで受信する。
+    音声合成と再生はtext_to_voiceのスレッドで行うため、RPCはキューへの追加のみを行う。
+    その他のRPCはVoiceServerの実装をスレッドプールで実行する。
+    """
+
+    async def SetText(
+        self,
+        request: voice_server_pb2.SetTextRequest(),
+        context: grpc.aio.ServicerContext,
+    ) -> voice_server_pb2.SetTextReply:
+        return super().SetText(request, context)
+
+    async def StreamText(
+        self,
+        request_iterator: AsyncIterator[voice_server_pb2.StreamTextRequest],
+        context: grpc.aio.ServicerContext,
+    ) -> voice_server_pb2.StreamTextReply:
+        # 受信待ちの間はワーカーを占有しないため、多数の応答のストリームを同時に受け付けられる
+        return await receive_stream_text_async(
+            self.text_to_voice, request_iterator, trace_id_from_context(context)
+        )
+
+
+async def serve_aio(voice_server: AioVoiceServer, port: str) -> None:
+    """grpc.aioのサーバでAioVoiceServerを起動する。"""
+    server = grpc.aio.server(
+        migration_thread_pool=futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        interceptors=[AioMetricsServerInterceptor()],
+    )
+    voice_server_pb2_grpc.add_VoiceServerServiceServicer_to_server(voice_server, server)
+    server.add_insecure_port("[::]:" + port)
+    await server.start()
+    print(f"voice_server(aio) start. port: {port}")
+    await server.wait_for_termination()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
@@ -130,7 +200,45 @@ def main() -> None:
         help="Not play nod motion",
         action="store_true",
     )
+    parser.add_argument(
+        "--audio_sink",
+        type=str,
+        default="pyaudio",
+        choices=["pyaudio", "null", "file"],
+        help="Audio output destination",
+    )
+    parser.add_argument(
+        "--audio_output_dir",
+        type=str,
+        default=None,
+        help="Directory to save wav files when --audio_sink is file",
+    )
+    parser.add_argument(
+        "--aio",
+        help="Serve with grpc.aio",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--trace_file",
+        type=str,
+        default=None,
+        help="Append latency trace spans to this jsonl file",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=10012,
+        help="Port of the Prometheus metrics HTTP endpoint. 0 disables",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default="127.0.0.1",
+        help="Address the Prometheus metrics HTTP endpoint listens on",
+    )
     args = parser.parse_args()
+    configure_tracing(args.trace_file, "style_bert_vits_server")
+    audio_sink = create_audio_sink(args.audio_sink, args.audio_output_dir)
 
     host = args.voice_host
     port = args.voice_port
@@ -144,13 +252,22 @@ def main() -> None:
         port=port,
         motion_host=motion_server_host,
         motion_port=motion_server_port,
+        audio_sink=audio_sink,
     )
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    port = "10002"
+    start_metrics_server(args.metrics_port, host=args.metrics_host)
+    if args.aio:
+        asyncio.run(serve_aio(AioVoiceServer(text_to_voice), port))
+        return
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=10),
+        options=server_options(),
+        interceptors=[MetricsServerInterceptor()],
+    )
     voice_server_pb2_grpc.add_VoiceServerServiceServicer_to_server(
         VoiceServer(text_to_voice), server
     )
-    port = "10002"
     server.add_insecure_port("[::]:" + port)
     server.start()
     print(f"voice_server start. port: {port}")
@@ -4,6 +4,7 @@ import sys
 import time
 
 import grpc
+from lib.grpc_channel import get_channel
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "lib/grpc"))
 import speech_server_pb2
@@ -30,8 +31,8 @@ def main() -> None:
     args = parser.parse_args()
 
     # grpc stubの設定
-    speech_channel = grpc.insecure_channel(args.speech_ip + ":" + str(args.speech_port))
-    voice_channel = grpc.insecure_channel(args.voice_ip + ":" + args.voice_port)
+    speech_channel = get_channel(args.speech_ip + ":" + str(args.speech_port))
+    voice_channel = get_channel(args.voice_ip + ":" + args.voice_port)
     voice_stub = None
     speech_stub = None
     # Voice serverの接続確認
@@ -0,0 +1,182 @@
+import argparse
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# 発話の終了(VADの終了)から最初の音声の出力までを応答遅延とする
+END_OF_SPEECH_SPAN = "speech"
+FIRST_AUDIO_SPAN = "first_audio"
+
+
+def load_spans(path: str) -> "OrderedDict[str, List[Dict[str, Any]]]":
+    """jsonlファイルのスパンを読み込み、トレースIDごとに開始時刻順にまとめる。
+
+    Args:
+        path (str): speech_publisher、gpt_publisher、voice_serverが--trace_fileで書き出したファイルのパス。
+
+    Returns:
+        OrderedDict[str, List[Dict[str, Any]]]: トレースIDごとのスパン。トレースの開始時刻順。
+
+    """
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line == "":
+                continue
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                # 書き込み途中で終了した行は無視する
+                continue
+            traces.setdefault(span["trace"], []).append(span)
+    result: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+    for trace_id, spans in sorted(
+        traces.items(), key=lambda item: min(span["start"] for span in item[1])
+    ):
+        result[trace_id] = sorted(spans, key=lambda span: (span["start"], span["end"]))
+    return result
+
+
+def find_span(spans: List[Dict[str, Any]], name: str) -> Optional[Dict[str, Any]]:
+    """指定した名前の最初のスパンを返す。"""
+    for span in spans:
+        if span["name"] == name:
+            return span
+    return None
+
+
+def end_of_speech(spans: List[Dict[str, Any]]) -> Optional[float]:
+    """発話の終了時刻を返す。記録されていない場合はNone。"""
+    speech = find_span(spans, END_OF_SPEECH_SPAN)
+    return speech["end"] if speech is not None else None
+
+
+def response_latency(spans: List[Dict[str, Any]]) -> Optional[float]:
+    """発話の終了から最初の音声の出力までの時間[sec]を返す。どちらかが記録されていない場合はNone。"""
+    speech_end = end_of_speech(spans)
+    first_audio = find_span(spans, FIRST_AUDIO_SPAN)
+    if speech_end is None or first_audio is None:
+        return None
+    return first_audio["start"] - speech_end
+
+
+def percentile(values: List[float], p: float) -> float:
+    """値のパーセンタイルを線形補間で返す。"""
+    values = sorted(values)
+    pos = (len(values) - 1) * p / 100
+    lower = int(pos)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+
+def format_attrs(span: Dict[str, Any]) -> str:
+    attrs = span.get("attrs")
+    if not attrs:
+        return ""
+    return " " + " ".join(f"{key}={value}" for key, value in attrs.items())
+
+
+def print_waterfall(trace_id: str, spans: List[Dict[str, Any]], width: int) -> None:
+    """1回の発話のスパンを、発話の終了時刻を0とした時間軸のウォーターフォールで表示する。"""
+    start = min(span["start"] for span in spans)
+    end = max(span["end"] for span in spans)
+    speech_end = end_of_speech(spans)
+    origin = speech_end if speech_end is not None else start
+    scale = width / max(end - start, 1e-3)
+    latency = response_latency(spans)
+    latency_text = f"{latency * 1000:.0f}ms" if latency is not None else "-"
+    print(f"trace {trace_id}: end of speech -> first audio {latency_text}")
+    name_width = max(len(f"{span['process']}/{span['name']}") for span in spans)
+    for span in spans:
+        begin = int((span["start"] - start) * scale)
+        length = int((span["end"] - span["start"]) * scale)
+        if span["end"] > span["start"]:
+            bar = " " * begin + "=" * max(length, 1)
+        else:
+            bar = " " * begin + "|"
+        name = f"{span['process']}/{span['name']}"
+        line = (
+            f"  {name:<{name_width}} "
+            f"{(span['start'] - origin) * 1000:+7.0f}ms "
+            f"{(span['end'] - span['start']) * 1000:6.0f}ms "
+            f"{bar:<{width + 1}}{format_attrs(span)}"
+        )
+        print(line.rstrip())
+    print("")
+
+
+def print_percentiles(traces: "OrderedDict[str, List[Dict[str, Any]]]") -> None:
+    """スパン名ごとの所要時間と、応答遅延のパーセンタイルを表示する。"""
+    durations: "OrderedDict[str, List[float]]" = OrderedDict()
+    latencies: List[float] = []
+    for spans in traces.values():
+        for span in spans:
+            if span["end"] <= span["start"]:
+                # 時点の記録は所要時間を持たない
+                continue
+            key = span["name"]
+            attrs = span.get("attrs", {})
+            if "kind" in attrs:
+                key += f" ({attrs['kind']})"
+            durations.setdefault(key, []).append(span["end"] - span["start"])
+        latency = response_latency(spans)
+        if latency is not None:
+            latencies.append(latency)
+    rows = list(durations.items())
+    rows.append(("end of speech -> first audio", latencies))
+    name_width = max(len(name) for name, _ in rows)
+    print(
+        f"{'span':<{name_width}} {'n':>5} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}"
+    )
+    for name, values in rows:
+        if len(values) == 0:
+            print(f"{name:<{name_width}} {0:>5} {'-':>8} {'-':>8} {'-':>8} {'-':>8}")
+            continue
+        print(
+            f"{name:<{name_width}} {len(values):>5} "
+            f"{percentile(values, 50) * 1000:>6.0f}ms "
+            f"{percentile(values, 90) * 1000:>6.0f}ms "
+            f"{percentile(values, 99) * 1000:>6.0f}ms "
+            f"{max(values) * 1000:>6.0f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Print per-turn latency waterfalls and percentiles from a trace file"
+    )
+    parser.add_argument(
+        "trace_file", type=str, help="Trace file written by --trace_file"
+    )
+    parser.add_argument(
+        "--last",
+        type=int,
+        default=5,
+        help="Number of latest turns to print waterfalls. 0 disables",
+    )
+    parser.add_argument(
+        "--trace", type=str, default=None, help="Print the waterfall of this trace id"
+    )
+    parser.add_argument(
+        "--width", type=int, default=50, help="Width of waterfall bars in characters"
+    )
+    args = parser.parse_args()
+    traces = load_spans(args.trace_file)
+    if len(traces) == 0:
+        print(f"No spans in {args.trace_file}")
+        return
+    if args.trace is not None:
+        if args.trace not in traces:
+            print(f"Trace {args.trace} is not found")
+            return
+        print_waterfall(args.trace, traces[args.trace], args.width)
+        return
+    if args.last > 0:
+        for trace_id in list(traces.keys())[-args.last :]:
+            print_waterfall(trace_id, traces[trace_id], args.width)
+    print_percentiles(traces)
+
+
+if __name__ == "__main__":
+    main()